@@ -12,17 +12,22 @@ from datetime import datetime
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
-from PyQt5.QAxContainer import *
 from PyQt5 import uic
 from PyQt5 import QtGui
 
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from kiwoom import constant
 from config import config_manager
 from util.tt_logger import TTlog
 from util.slack import Slack
 
 from database.db_manager import DBM
+from database.realtime_writer import RealtimeWriter
+from kiwoom.order_gateway import OrderGateway
+from kiwoom.real_decoder import to_abs
+from kiwoom.condition_coalescer import ConditionCoalescer
+from trading.account_snapshot import AccountSnapshot
+from trading.position_book import PositionBook
 from pymongo import MongoClient
 import pymongo
 import random
@@ -34,13 +39,29 @@ ui = uic.loadUiType(config_manager.MAIN_UI_PATH)[0]
 
 # main class
 class TopTrader(QMainWindow, ui):
+    REAL_FIDS = "10;15;20"  # 보유종목 실시간 체결가 (주식체결)
+    CONDI_WINDOW = 1.0  # 조건검색 편입/이탈 event 를 합치는 구간(sec)
+
     def __init__(self):
         super().__init__()
         self.logger = TTlog().logger
         self.mongo = MongoClient()
         self.tt_db = self.mongo.TopTrader
         self.slack = Slack(config_manager.get_slack_token())
-        self.kw = Kiwoom()
+        self.kw = get_kiwoom()
+        # callback 에서는 queue/buffer 에 넣기만 하고, 주문은 OrderGateway 가, DB 저장은 RealtimeWriter thread 가 한다.
+        self.condi_writer = RealtimeWriter(self.tt_db.real_condi_search, logger=self.logger)
+        self.history_writer = RealtimeWriter(self.tt_db.trading_history, logger=self.logger)
+        self.condi_writer.start()
+        self.history_writer.start()
+        # 보내지 못한 매수주문은 AccountSnapshot 에 잡아둔 주문금액을 돌려놓는다.
+        self.order_gateway = OrderGateway(self.kw, self.history_writer,
+                                          schedule=lambda fn: QTimer.singleShot(0, fn),
+                                          on_drop=lambda intent: self.account.release(intent.code),
+                                          logger=self.logger)
+        # 같은 종목이 짧은 시간에 편입/이탈을 반복하는 event 는 합쳐서 전달한다.
+        self.condi_events = ConditionCoalescer(
+            window=self.CONDI_WINDOW, schedule=lambda sec, fn: QTimer.singleShot(int(sec * 1000), fn))
         self.init_trading()
         # self.just_sell_all_stocks()
         self.auto_trading()
@@ -54,6 +75,13 @@ class TopTrader(QMainWindow, ui):
         t = datetime.today()
         self.s_time = datetime(t.year, t.month, t.day, 9, 0, 0)  # 장 시작시간, 오전9시
 
+        # 보유종목 장부, 체결/잔고통보와 실시간 체결가로 갱신하며 +3%, -2% 에 바로 매도한다.
+        self.position_book = PositionBook(take_profit=3.0, stop_loss=-2.0, on_exit=self.sell_position,
+                                          logger=self.logger)
+        self.kw.reg_callback("OnReceiveChejanData", "", self.on_chejan_data)
+        self.kw.reg_callback("OnReceiveRealData", "", self.position_book.on_real_data)
+        self.reconcile_positions()
+
     def login(self):
         # Login
         err_code = self.kw.login()
@@ -90,7 +118,12 @@ class TopTrader(QMainWindow, ui):
     def set_account(self):
         self.acc_no = self.kw.get_login_info("ACCNO")
         self.acc_no = self.acc_no.strip(";")  # 계좌 1개를 가정함.
-        self.stock_account = self.get_account_info(self.acc_no)
+        # 계좌정보는 AccountSnapshot 하나로 같이 쓴다. (잔고통보로 갱신, ttl 이 지났거나 체결 후에만 TR 조회)
+        self.account = AccountSnapshot(self.kw, self.acc_no, ttl=30,
+                                       schedule=lambda sec, fn: QTimer.singleShot(int(sec * 1000), fn),
+                                       logger=self.logger)
+        self.account.refresh()
+        self.kw.reg_callback("OnReceiveChejanData", "", self.account.on_chejan_data)
 
         # kiwoom default account setting
         self.kw.set_account(self.acc_no)
@@ -100,19 +133,17 @@ class TopTrader(QMainWindow, ui):
             self.timer.stop()
             self.timer.deleteLater()
         self.timer = QTimer()
-        self.timer.timeout.connect(self.check_stocks_to_sell)
+        self.timer.timeout.connect(self.reconcile_positions)
         # self.timer.setSingleShot(True)
-        self.timer.start(30000) # 30 sec interval
+        self.timer.start(300000)  # 5 min interval, 매도 판단은 실시간 체결가로 한다.
 
     def just_sell_all_stocks(self):
         curr_time = datetime.today()
-        self.stock_account = self.get_account_info(self.acc_no)
-        for data in self.stock_account["종목정보"]:
+        for data in self.account.get()["종목정보"]:
             self.logger.info("Trading시간 종료되어 보유한 종목 모두 매도처리합니다.")
             code, stock_name, quantity = data["종목코드"][1:], data["종목명"], int(data["보유수량"])
-            self.kw.시장가_신규매도(code, quantity)
             손익율 = data["손익율"]
-            self.tt_db.trading_history.insert({
+            self.order_gateway.sell(code, quantity, history={
                 'date': curr_time,
                 'code': code,
                 'stock_name': self.stock_dict[code]["stock_name"],
@@ -125,60 +156,81 @@ class TopTrader(QMainWindow, ui):
                 'hoga_gubun': '시장가',
                 'account_no': self.acc_no
             })
-            time.sleep(0.5)
 
-    def check_stocks_to_sell(self):
-        self.logger.info("[Timer Interrupt] 30 second")
-        self.stock_account = self.get_account_info(self.acc_no)
-        curr_time = datetime.today()
-        self.logger.info("=" * 50)
-        self.logger.info("현재 계좌 현황입니다...")
+    def reconcile_positions(self):
+        """계좌평가현황(opw00004)으로 보유종목 장부를 맞추고, 보유종목의 실시간 체결가를 등록한다.
+        (체결/잔고통보를 놓치거나 HTS 에서 직접 주문한 경우 대비)
 
-        if not bool(self.stock_account):
+        :return:
+        """
+        self.logger.info("[Timer Interrupt] reconcile positions")
+        account_info = self.account.get()
+        if not bool(account_info["계좌정보"]):
             self.logger.error("계좌정보를 제대로 받아오지 못했습니다.")
             return
 
-        if datetime.today() < self.s_time:
-            self.logger.info("시작시간이 되지 않아 매도하지 않습니다.")
-            return
+        self.position_book.reconcile(account_info)
+        self.my_stock_pocket = self.position_book.codes()
+        self.kw.reg_real(list(self.position_book.codes()), self.REAL_FIDS)
 
-        self.my_stock_pocket = set()
-        for data in self.stock_account["종목정보"]:
-            code, stock_name, quantity = data["종목코드"][1:], data["종목명"], int(data["보유수량"])
+        self.logger.info("OrderGateway: {}".format(self.order_gateway.get_stats()))
+        self.logger.info("ConditionCoalescer: {}".format(self.condi_events.get_stats()))
+        self.logger.info("AccountSnapshot: {}".format(self.account.get_stats()))
+        self.logger.info("=" * 50)
+        self.logger.info("현재 계좌 현황입니다...")
+        for data in account_info["종목정보"]:
             self.logger.info("* 종목: {}, 손익율: {}%, 보유수량: {}, 평가금액: {}원".format(
                 data["종목명"], ("%.2f" % data["손익율"]), int(data["보유수량"]), format(int(data["평가금액"]), ',')
             ))
-            self.my_stock_pocket.add(code)
-            손익율 = data["손익율"]
-            if 손익율 >= 3.0 or 손익율 <= -2.0:
-                if 손익율 > 0:
-                    self.logger.info("시장가로 물량 전부 익절합니다. ^^    [{}:{}, {}주]".format(stock_name, code, quantity))
-                else:
-                    self.logger.info("시장가로 물량 전부 손절합니다. ㅜㅜ. [{}:{}, {}주]".format(stock_name, code, quantity))
-
-                self.my_stock_pocket.remove(code)
-                self.kw.시장가_신규매도(code, quantity)
-                self.tt_db.trading_history.insert({
-                    'date': curr_time,
-                    'code': code,
-                    'stock_name': self.stock_dict[code]["stock_name"],
-                    'market': self.stock_dict[code]["market"],
-                    'event': '',
-                    'condi_name': '',
-                    'trade': 'sell',
-                    'profit': 손익율,
-                    'quantity': quantity,
-                    'hoga_gubun': '시장가',
-                    'account_no': self.acc_no
-                })
-
-    def get_account_info(self, acc_no):
-        self.logger.info("계좌평가현황요청")
-        ret = self.kw.계좌평가현황요청("계좌평가현황요청", acc_no, "", "1", "6001")
-        return ret
+
+    def on_chejan_data(self, data):
+        """키움모듈의 OnReceiveChejanData 이벤트 callback. 잔고통보로 장부를 갱신한다.
+
+        :param data: Chejan.make_data
+        :return:
+        """
+        position = self.position_book.on_chejan_data(data)
+        if position is not None:
+            self.my_stock_pocket.add(position.code)
+            self.kw.reg_real([position.code], self.REAL_FIDS)
+
+    def sell_position(self, position):
+        """보유종목이 익절/손절 조건이 되면 PositionBook 이 호출하는 함수. 시장가로 물량 전부 매도한다.
+
+        :param position: trading.position_book.Position
+        :return:
+        """
+        curr_time = datetime.today()
+        if curr_time < self.s_time:
+            self.logger.info("시작시간이 되지 않아 매도하지 않습니다.")
+            position.reset_exit()
+            return
+
+        code, stock_name, quantity = position.code, position.stock_name, position.quantity
+        손익율 = position.profit_rate
+        if 손익율 > 0:
+            self.logger.info("시장가로 물량 전부 익절합니다. ^^    [{}:{}, {}주]".format(stock_name, code, quantity))
+        else:
+            self.logger.info("시장가로 물량 전부 손절합니다. ㅜㅜ. [{}:{}, {}주]".format(stock_name, code, quantity))
+
+        self.my_stock_pocket.discard(code)
+        self.order_gateway.sell(code, quantity, history={
+            'date': curr_time,
+            'code': code,
+            'stock_name': self.stock_dict[code]["stock_name"],
+            'market': self.stock_dict[code]["market"],
+            'event': '',
+            'condi_name': '',
+            'trade': 'sell',
+            'profit': 손익율,
+            'quantity': quantity,
+            'hoga_gubun': '시장가',
+            'account_no': self.acc_no
+        })
 
     def search_condi(self, event_data):
         """키움모듈의 OnReceiveRealCondition 이벤트 수신되면 호출되는 callback함수
+        (ConditionCoalescer 가 편입/이탈 상태가 바뀐 event 만 전달한다.)
         이벤트 정보는 event_data 변수로 전달된다.
 
             ex)
@@ -197,7 +249,7 @@ class TopTrader(QMainWindow, ui):
             return
 
         # 실시간 조건검색 이력정보
-        self.tt_db.real_condi_search.insert({
+        self.condi_writer.put({
             'date': curr_time,
             'code': event_data["code"],
             'stock_name': self.stock_dict[event_data["code"]]["stock_name"],
@@ -207,13 +259,6 @@ class TopTrader(QMainWindow, ui):
         })
 
         if event_data["event_type"] == "I":
-            예수금 = self.stock_account["계좌정보"]["예수금"]
-            D2_예수금 = self.stock_account["계좌정보"]["예수금"]
-            총예수금 = 예수금 + D2_예수금
-            if 총예수금 < 100000:  # 잔고가 10만원 미만이면 매수 안함
-                self.logger.info("총예수금({}) 부족으로 추가 매수하지 않습니다.".format(총예수금))
-                return
-
             if event_data["code"] in self.my_stock_pocket:
                 self.logger.info("해당 종목({}) 이미 보유중이라 추가매수하지 않습니다.".format(
                     self.stock_dict[event_data["code"]]["stock_name"]))
@@ -221,10 +266,23 @@ class TopTrader(QMainWindow, ui):
             # curr_price = self.kw.get_curr_price(event_data["code"])
             # quantity = int(100000/curr_price)
             quantity = 20
+
+            # 실시간 event 처리중에는 TR 을 요청하지 않고, 잔고통보가 반영된 snapshot 에서
+            # 아직 체결되지 않은 매수주문 금액을 뺀 주문가능금액을 본다.
+            # 시장가 주문은 상한가(전일가 +30%) 기준으로 주문금액을 잡아둔다.
+            price = to_abs(str(self.kw.get_master_last_price(event_data["code"]) or "")) * 1.3
+            주문금액 = price * quantity
+            주문가능금액 = self.account.available()
+            if 주문가능금액 < 100000 or 주문가능금액 < 주문금액:  # 잔고가 10만원 미만이거나 주문금액보다 적으면 매수 안함
+                self.logger.info("주문가능금액({}) 부족으로 추가 매수하지 않습니다. (주문금액 {})".format(주문가능금액, 주문금액))
+                return
             # self.kw.reg_callback("OnReceiveChejanData", ("조건식매수", "5000"), self.account_stat)
             stock_name = self.stock_dict[event_data["code"]]["stock_name"]
             market = self.stock_dict[event_data["code"]]["market"]
-            self.tt_db.trading_history.insert({
+            self.logger.info("{}:{}를 {}주 시장가_신규매수합니다.".format(stock_name, event_data["code"], quantity))
+            self.my_stock_pocket.add(event_data["code"])
+            self.account.reserve(event_data["code"], quantity, price)
+            ok = self.order_gateway.buy(event_data["code"], quantity, history={
                 'date': curr_time,
                 'code': event_data["code"],
                 'stock_name': stock_name,
@@ -236,9 +294,8 @@ class TopTrader(QMainWindow, ui):
                 'hoga_gubun': '시장가',
                 'account_no': self.acc_no
             })
-            self.logger.info("{}:{}를 {}주 시장가_신규매수합니다.".format(stock_name, event_data["code"], quantity))
-            self.my_stock_pocket.add(event_data["code"])
-            self.kw.시장가_신규매수(event_data["code"], quantity)
+            if not ok:
+                self.account.release(event_data["code"])
             # self.kw.send_order("조건식매수", "5000", self.acc_no, 1, event_data["code"], quantity, 0, "03", "")
 
     def auto_trading(self):
@@ -253,22 +310,20 @@ class TopTrader(QMainWindow, ui):
         self.start_timer()
 
         # callback fn 등록
-        self.kw.reg_callback("OnReceiveRealCondition", "", self.search_condi)
+        self.kw.reg_callback("OnReceiveRealCondition", "", self.condi_events.on_event)
+        self.condi_events.subscribe(self.search_condi)
 
-        screen_no, cnt = 4000, 0
         condi_info = self.kw.get_condition_load()
         self.logger.info("실시간 조건 검색 시작합니다.")
         for condi_name, condi_id in condi_info.items():
             # 화면번호, 조건식이름, 조건식ID, 실시간조건검색(1)
+            # 조건식마다 화면번호 pool 에서 화면번호를 빌려서, 조건식별로 중지(send_condition_stop)할 수 있게 한다.
+            screen_no = self.kw.screen_pool.lease(condi_name)
             self.logger.info("화면번호: {}, 조건식명: {}, 조건식ID: {}".format(
                 screen_no, condi_name, condi_id
             ))
-            self.kw.send_condition(str(screen_no), condi_name, int(condi_id), 1)
+            self.kw.send_condition(screen_no, condi_name, int(condi_id), 1)
             time.sleep(0.5)
-            cnt += 1
-            if cnt == 10:
-                screen_no += 1
-                cnt = 0
 
 
 # Print Exception Setting
@@ -0,0 +1,31 @@
+# built-in module
+import sys
+
+# My modules
+from database.db_manager import DBM
+from util.tt_logger import TTlog
+
+
+def main():
+    # 목표 !!!
+    # DBM 의 모든 query 가 index 를 사용하는지 확인한다. (COLLSCAN 이 있으면 exit code 1)
+    logger = TTlog(logger_name="TTDB").logger
+    dbm = DBM('TopTrader')
+
+    result = dbm.diagnose_queries()
+    logger.info("{:<36}{:<28}{:<24}{:>10}{:>10}{:>8}".format(
+        "method", "collection", "stages", "examined", "returned", "ms"))
+    for info in result:
+        logger.info("{:<36}{:<28}{:<24}{:>10}{:>10}{:>8}".format(
+            info['method'], info['collection'], "/".join(info['stages']),
+            str(info['docs_examined']), str(info['n_returned']), str(info['time_ms'])))
+
+    collscan = [info for info in result if info['collscan']]
+    if bool(collscan):
+        logger.warning("{} queries use COLLSCAN".format(len(collscan)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,15 +12,15 @@ import time
 # UI(PyQt5) module
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QAxContainer import *
 from PyQt5 import uic
 from PyQt5 import QtGui
 from PyQt5.QtCore import pyqtSlot
 
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from config import config_manager
 from util.tt_logger import TTlog
 from util.slack import Slack
+from util.trading_calendar import TradingCalendar
 
 from database.db_manager import DBM
 from pymongo import MongoClient
@@ -42,10 +42,11 @@ class TopTrader(QMainWindow, ui):
         # self.setupUi(self)  # load app screen
         self.logger = TTlog().logger
         self.dbm = DBM('TopTrader')
+        self.calendar = TradingCalendar()
         self.mongo = MongoClient()
         self.db = self.mongo.TopTrader
         self.slack = Slack(config_manager.get_slack_token())
-        self.kw = Kiwoom()
+        self.kw = get_kiwoom()
         self.login()
         self.main()
 
@@ -60,11 +61,9 @@ class TopTrader(QMainWindow, ui):
         :param screen_no:
         :return:
         """
-        ret, cur = self.dbm.check_tick_cache(code, date, tick="1")
+        tick_data = self.dbm.get_tick_doc(code, date, tick="1")
 
-        if ret:
-            tick_data = cur.next()
-        else:
+        if tick_data is None:
             base_date = datetime(date.year, date.month, date.day, 0, 0, 0)
             raw_data = self.kw.stock_price_by_tick(code, tick=tick, screen_no=screen_no, date=base_date)
             tick_data = {
@@ -88,13 +87,10 @@ class TopTrader(QMainWindow, ui):
         :param e_date:
         :return:
         """
-        s_base_date = datetime(s_date.year, s_date.month, s_date.day, 0, 0, 0)
-        e_base_date = datetime(e_date.year, e_date.month, e_date.day, 0, 0, 0)
-        days = (e_base_date - s_base_date).days + 1
-        date_list = [s_base_date + timedelta(days=x) for x in range(0, days)]
+        # 휴장일은 data 가 없으므로 TR 을 요청하지 않는다.
+        date_list = self.calendar.trading_days(s_date, e_date)
         for base_date in date_list:
-            ret, cur = self.dbm.check_tick_cache(code, base_date, tick="1")
-            if ret:
+            if self.dbm.check_tick_cache(code, base_date, tick="1"):
                 self.logger.debug("No need to save data. already has data in DB")
                 continue
 
@@ -117,6 +113,10 @@ class TopTrader(QMainWindow, ui):
         self.base_date = datetime(year, month, day)
         # 사용자 정의 부분_E
 
+        if not self.calendar.is_trading_day(self.base_date):
+            self.logger.info("{} is not a trading day. exit.".format(self.base_date))
+            exit(0)
+
         # kospi, kosdaq 모든 종목의 코드와 종목명 정보를 불러온다.
         self.stock_info = self.kw.get_stock_basic_info()
 
@@ -12,12 +12,11 @@ from database.db_manager import DBM
 # UI(PyQt5) module
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QAxContainer import *
 from PyQt5 import uic
 from PyQt5 import QtGui
 from PyQt5.QtCore import pyqtSlot
 
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from config import config_manager
 from util.tt_logger import TTlog
 from util.slack import Slack
@@ -17,7 +17,6 @@ import pandas as pd
 # UI(PyQt5) module
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QAxContainer import *
 from PyQt5 import uic
 from PyQt5 import QtGui
 from PyQt5.QtCore import pyqtSlot
@@ -39,7 +38,7 @@ from config import config_manager
 from util.tt_logger import TTlog
 
 # Kiwoom module
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from kiwoom.constant import KiwoomServerCheckTimeError
 
 
@@ -70,7 +69,7 @@ class TopTrader(QMainWindow, ui):
         self.slack = Slacker(config_manager.get_slack_token())
 
         # Kiwoom
-        self.kw = Kiwoom()
+        self.kw = get_kiwoom()
         self.login()
         self.stock_info = self.kw.get_stock_basic_info()
 
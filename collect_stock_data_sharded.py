@@ -0,0 +1,103 @@
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from config import config_manager
+from database.db_manager import DBM
+from database.lease_queue import LeaseQueue
+from util.slack import Slack
+from util import constant
+
+
+def start_worker(duration, worker_index, base_date):
+    cmd = [sys.executable, "collect_stock_data_worker.py", duration, str(worker_index), base_date.strftime("%Y%m%d")]
+    print(" ".join(cmd))
+    return subprocess.Popen(cmd)
+
+
+def main(duration_list):
+    """분봉 수집을 여러 Kiwoom session(worker process)으로 나누어 실행한다.
+
+    worker 는 MongoDB 의 공유 queue(collect_work_queue)에서 종목을 lease 하여 수집하므로,
+    worker 수만큼 TR 요청제한이 늘어나고, 죽은 worker 의 종목은 lease 가 만료되면 다른 worker 가 가져간다.
+    비정상 종료된 worker 는 다시 실행한다. (키움 서버 점검시간이면 delay 후 실행)
+    가져갈 종목이 없어서 종료된 worker 도 lease 중인 종목이 남아 있으면 lease 가 만료될 때 다시 실행하여,
+    죽은 worker 가 가지고 있던 종목을 가져가게 한다.
+
+    :param duration_list:
+    :return:
+    """
+    # 사용자 지정 변수__S
+    worker_cnt = 3  # 동시에 실행할 Kiwoom session 수 (계정/PC 별 자동로그인 설정 필요)
+    max_restart = 10  # worker 별 최대 재시작 횟수
+    check_interval = 30  # worker 상태 확인 주기(sec)
+    server_check_delay = 20 * 60  # 키움 서버 점검시간 delay(sec)
+    # 사용자 지정 변수__E
+
+    dbm = DBM('TopTrader')
+    slack = Slack(config_manager.get_slack_token())
+    base_date = datetime.today()
+
+    for duration in duration_list:
+        queue = LeaseQueue(dbm.db.collect_work_queue, LeaseQueue.make_job(duration, base_date), "coordinator")
+        slack.send_message("[Automation] Start to collect stock data with {} sessions -> {}".format(
+            worker_cnt, duration))
+
+        workers = {i: start_worker(duration, i, base_date) for i in range(worker_cnt)}
+        restart_cnt = {i: 0 for i in range(worker_cnt)}
+        waiting = {}  # worker index -> 다시 실행할 시각 (lease 중인 종목만 남아서 종료된 worker)
+        while bool(workers) or bool(waiting):
+            time.sleep(check_interval)
+            for i, restart_at in list(waiting.items()):
+                if datetime.now() < restart_at:
+                    continue
+                del waiting[i]
+                stats = queue.get_stats()
+                if stats[LeaseQueue.READY] == 0:
+                    if stats[LeaseQueue.LEASED] == 0:  # 모두 완료
+                        continue
+                    next_expiry = queue.next_expiry()
+                    if next_expiry is not None and next_expiry > datetime.now():  # 다른 worker 가 lease 를 연장함
+                        waiting[i] = next_expiry
+                        continue
+                workers[i] = start_worker(duration, i, base_date)
+            for i, proc in list(workers.items()):
+                ret = proc.poll()
+                if ret is None:
+                    continue
+                # 가져갈 종목이 없어서 종료
+                if ret == 0:
+                    stats = queue.get_stats()
+                    if stats[LeaseQueue.READY] == 0:
+                        del workers[i]
+                        # lease 중인 종목은 다른 worker 가 처리하고, 그 worker 가 죽었으면 lease 만료 후 다시 가져간다.
+                        if stats[LeaseQueue.LEASED] > 0:
+                            waiting[i] = queue.next_expiry() or datetime.now()
+                        continue
+                if ret == constant.EXIT_SESSION_REQUEST_LIMIT:  # 세션 최대 요청수 도달, 재시작 횟수에 넣지 않는다.
+                    print("worker{} reached the session request limit. restart.".format(i))
+                    workers[i] = start_worker(duration, i, base_date)
+                    continue
+                if restart_cnt[i] >= max_restart:
+                    print("worker{} exit({}). too many restarts.".format(i, ret))
+                    del workers[i]
+                    continue
+                if ret == constant.EXIT_SERVER_CHECK_TIME:
+                    print("Delay {} minutes due to Kiwoom server check time.".format(server_check_delay // 60))
+                    time.sleep(server_check_delay)
+                restart_cnt[i] += 1
+                workers[i] = start_worker(duration, i, base_date)
+            print("[{}] {}".format(duration, queue.get_stats()))
+
+        slack.send_message("[Automation] Complete to collect stock data -> {} {}".format(duration, queue.get_stats()))
+
+
+if __name__ == "__main__":
+    main([
+        "min1",
+        # "min3",
+        # "min5",
+        # "min10",
+        # "min60",
+    ])
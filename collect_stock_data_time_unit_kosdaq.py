@@ -11,17 +11,18 @@ import time
 # UI(PyQt5) module
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QAxContainer import *
 from PyQt5 import uic
 from PyQt5 import QtGui
 from PyQt5.QtCore import pyqtSlot
 
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from config import config_manager
 from util.tt_logger import TTlog
 from util.slack import Slack
+from util.trading_calendar import TradingCalendar
 
 from database.db_manager import DBM
+from database.backfill_planner import BackfillPlanner
 from pymongo import MongoClient
 import pymongo
 import random
@@ -43,10 +44,13 @@ class TopTrader(QMainWindow, ui):
         self.logger = TTlog(logger_name="TT"+duration).logger
         self.mongo = MongoClient()
         self.tt_db = self.mongo.TopTrader
+        self.dbm = DBM('TopTrader')
+        self.calendar = TradingCalendar()
         self.slack = Slack(config_manager.get_slack_token())
         today = datetime.today()
         self.end_date = datetime(today.year, today.month, today.day, 16, 0, 0)
-        self.kw = Kiwoom()
+        # collect_stock_data_kosdaq.py 가 다시 실행해도 직전 process 의 TR 요청시각을 이어서 사용한다.
+        self.kw = get_kiwoom(tr_history_name="time_unit_kosdaq_" + duration)
         self.login()
         self.get_screen_no = {
             "min1": "3000",
@@ -74,11 +78,9 @@ class TopTrader(QMainWindow, ui):
     def upsert_db(self, col, datas):
         self.logger.info("Upsert Data to DB")
         s_time = time.time()
-        for doc in datas:
-            # col.update(condition, new_data, upsert=True)
-            col.update({'date': doc['date'], 'code': doc['code']}, doc, upsert=True)
+        cnt = self.dbm.bulk_upsert(col, datas)
         e_time = time.time()
-        print("Time: ", int(e_time-s_time))
+        self.logger.info("{} docs, Time: {:.2f}".format(cnt, e_time - s_time))
 
     def get_stock_list(self, market):
         kospi_code_list = self.kw.get_code_list_by_market(market)
@@ -116,14 +118,61 @@ class TopTrader(QMainWindow, ui):
                     s_date, e_date, s_index = data['end_date'], self.end_date, data['last'] + 1
         return s_date, e_date, s_index, current_flag
 
+    def skip_non_trading_period(self, duration, stock_list, s_date, e_date):
+        """s_date ~ e_date 에 장운영시간이 없으면(주말, 휴장일) TR 을 요청하지 않고,
+        수집을 완료한 것으로 기록한 후 종료한다.
+
+        :param duration:
+        :param stock_list:
+        :param s_date:
+        :param e_date:
+        :return:
+        """
+        if self.calendar.has_session(s_date, e_date) or not bool(stock_list):
+            return
+        self.logger.info("[{}] {} ~ {}. no trading session. skip.".format(duration, s_date, e_date))
+        code, stock_name = stock_list[-1]
+        self.tt_db.time_series_temp2.update({'type': duration},
+                                            {'type': duration,
+                                             'code': code,
+                                             'stock_name': stock_name,
+                                             'last': len(stock_list) - 1,
+                                             'start_date': s_date,
+                                             'end_date': e_date,
+                                             'total': len(stock_list)},
+                                            upsert=True)
+        exit(0)
+
+    def save_progress(self, duration, code, stock_name, last, s_date, e_date, total):
+        """collect_stock_data.py 가 수집 완료 여부를 확인하는 진행상황(time_series_temp2)을 기록한다.
+
+        :param duration:
+        :param code: 마지막으로 수집한 종목
+        :param stock_name:
+        :param last: 마지막으로 수집한 index
+        :param s_date:
+        :param e_date:
+        :param total:
+        :return:
+        """
+        self.tt_db.time_series_temp2.update({'type': duration},
+                                            {'type': duration,
+                                             'code': code,
+                                             'stock_name': stock_name,
+                                             'last': last,
+                                             'start_date': s_date,
+                                             'end_date': e_date,
+                                             'total': total},
+                                            upsert=True)
+
     def collect_n_save_data_min(self, duration):
         """
-        코스피 종목의 분단위 데이터를 수집한다.
+        분단위 데이터를 종목별 high-water mark(마지막으로 저장된 봉) 이후만 수집한다. (BackfillPlanner)
 
-        1. 한번도 db에 저장한적이 없다면 6/1일부터 오늘까지의 데이터를 저장한다.
-        2. 지난번에 저장하다가 중간에 멈췄다면, 나머지 작업을 모두 완료 후, 해당시점의 e_date 부터 오늘까지의 데이터를 전 종목에 대해 저장한다.
-        3.   이번에 저장하다가 중간에 멈췄다면, 이전 e_date 부터 오늘까지의 데이터를 전 종목에 대해 저장한다.
-        4. 지난번에 저장을 완료했다면, 해당시점의 e_date 부터 오늘까지의 데이터를 전 종목에 대해 저장한다.
+        1. 한번도 db에 저장한적이 없는 종목은 7/23일부터 오늘까지의 데이터를 저장한다.
+        2. 저장한적이 있는 종목은 마지막으로 저장된 봉부터 오늘까지의 데이터를 저장한다.
+        3. 마지막으로 저장된 봉 이후에 장운영시간이 없는 종목(이미 최신인 종목)은 요청하지 않는다.
+        4. 마지막으로 저장된 봉이 오래된 종목부터 수집한다. 중간에 멈추면 다음 실행시 남은 종목만 다시 계획된다.
 
         :param duration: min1, min3, min5, min10, min60 중 하나의 값
         :return:
@@ -132,18 +181,6 @@ class TopTrader(QMainWindow, ui):
         # stock_list += self.get_stock_list(constant.KOSDAQ)
 
         stock_list = self.get_stock_list(constant.KOSDAQ)
-        cur = self.tt_db.time_series_temp2.find({'type': duration})
-        s_date, e_date, s_index, current_flag = self.get_last_data(cur, duration)
-
-        if not current_flag:
-            msg = "[{}] {} ~ {}. start to collect stock data. this is previous process.".format(
-                duration, s_date, e_date, e_date, self.end_date
-            )
-        else:
-            msg = "[{}] {} ~ {}. start to collect stock data. this is current process.".format(
-                duration, s_date, e_date
-            )
-        self.slack.log(msg)
 
         col = {
             "min1": self.tt_db.time_series_min1,
@@ -152,46 +189,65 @@ class TopTrader(QMainWindow, ui):
             "min10": self.tt_db.time_series_min10,
             "min60": self.tt_db.time_series_min60
         }[duration]
-        fn = self.kw.stock_price_by_min
-
-        total = len(stock_list)
-        msg = "[{}] {} / {} -> start to collect stock data".format(duration, s_index, total)
+        self.dbm.ensure_unique_index(col)
+        fn = self.kw.iter_stock_price_by_min
+
+        planner = BackfillPlanner(self.dbm, col, duration, first_date=datetime(2018, 7, 23, 0, 0, 0),
+                                  calendar=self.calendar)
+        plan = planner.plan(stock_list, self.end_date)
+        total = len(plan)
+        if total == 0:
+            self.logger.info("[{}] all stocks are up to date. ~ {}".format(duration, self.end_date))
+            code, stock_name = stock_list[-1] if bool(stock_list) else ("", "")
+            self.save_progress(duration, code, stock_name, len(stock_list) - 1, self.end_date, self.end_date,
+                               len(stock_list))
+            exit(0)
+
+        msg = "[{}] {} / {} stocks, {} ~ {}. start to collect stock data".format(
+            duration, total, len(stock_list), plan[0][2], self.end_date
+        )
         self.slack.log(msg)
 
-        for i, stock in enumerate(stock_list[s_index:], s_index):
-            code, stock_name = stock
+        # 수집에 실패한 종목, 하나라도 있으면 진행상황을 더 기록하지 않는다. (다음 실행에서 다시 수집)
+        # MAX_FAILURES 번 실패한 종목은 다시 수집하지 않으므로 진행상황을 계속 기록한다.
+        failed = []
+        for i, (code, stock_name, s_date) in enumerate(plan):
             self.logger.info("%s/%s - %s/%s" % (i, total, code, stock_name))
-            self.logger.info("period : {} ~ {}".format(s_date, e_date))
+            self.logger.info("period : {} ~ {}".format(s_date, self.end_date))
             self.logger.info("time_series_{}".format(duration))
 
+            # page 단위로 받아서 바로 저장한다. hwm 은 모든 page 를 저장한 후에만 갱신한다.
+            last_date = None
             try:
-                doc = fn(code, tick=duration.strip("min"), screen_no=self.get_screen_no[duration],
-                         start_date=s_date, end_date=e_date)
+                for doc in fn(code, tick=duration.strip("min"), screen_no=self.get_screen_no[duration],
+                              start_date=s_date, end_date=self.end_date):
+                    self.upsert_db(col, doc)
+                    if last_date is None:  # 최신 page 가 먼저 온다
+                        last_date = max(d['date'] for d in doc)
             except KiwoomServerCheckTimeError as e:
                 self.logger.error("[KiwoomServerCheckTimeError] {}".format(duration))
                 self.tt_db.urgent2.update({'type': 'error'},
-                                         {'type': 'error', 'error_code': e.error_code},
-                                         upsert=True)
+                                          {'type': 'error', 'error_code': e.error_code},
+                                          upsert=True)
                 exit(0)
+            except Exception as e:
+                self.logger.error("[{}] {} : {}".format(duration, code, e))
+                if planner.fail(code, self.end_date):
+                    self.logger.error("[{}] {} failed {} times. skip until {}".format(
+                        duration, code, planner.MAX_FAILURES, self.end_date))
+                else:
+                    failed.append(code)
+            else:
+                planner.update(code, last_date)
 
-            try:
-                self.upsert_db(col, doc)
-            except pymongo.errors.InvalidOperation as e:
-                # cannot do an empty bulk write ?
-                self.logger.error(e)
-
-            self.tt_db.time_series_temp2.update({'type': duration},
-                                               {'type': duration,
-                                                'code': code,
-                                                'stock_name': stock_name,
-                                                'last': i,
-                                                'start_date': s_date,
-                                                'end_date': e_date,
-                                                'total': total},
-                                               upsert=True)
+            # 실패한 종목 이후로 진행상황을 기록하면 collect_stock_data.py 가 완료로 보고 실패한 종목을 건너뛴다.
+            if not bool(failed):
+                self.save_progress(duration, code, stock_name, i, plan[0][2], self.end_date, total)
             self.tt_db.urgent2.update({'type': 'error'},
-                                     {'type': 'error', 'error_code': 0},
-                                     upsert=True)
+                                      {'type': 'error', 'error_code': 0},
+                                      upsert=True)
+        if bool(failed):
+            self.logger.error("[{}] {} stocks failed : {}".format(duration, len(failed), failed))
         exit(0)  # Program exit
 
     def collect_n_save_data(self, duration):
@@ -210,6 +266,7 @@ class TopTrader(QMainWindow, ui):
         stock_list += self.get_stock_list(constant.KOSDAQ)
         cur = self.tt_db.time_series_temp2.find({'type': duration})
         s_date, e_date, s_index, current_flag = self.get_last_data(cur, duration)
+        self.skip_non_trading_period(duration, stock_list, s_date, e_date)
 
         if not current_flag:
             msg = "[{}] {} ~ {}. start to collect stock data. this is previous process.".format(
@@ -227,6 +284,7 @@ class TopTrader(QMainWindow, ui):
             "month": self.tt_db.time_series_month,
             "year": self.tt_db.time_series_year
         }[duration]
+        self.dbm.ensure_unique_index(col)
 
         fn = {
             "day": self.kw.stock_price_by_day,
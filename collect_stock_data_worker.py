@@ -0,0 +1,125 @@
+# built-in module
+import sys
+from datetime import datetime
+
+# UI(PyQt5) module
+from PyQt5.QtWidgets import *
+from PyQt5 import uic
+
+from kiwoom.backend import get_kiwoom
+from config import config_manager
+from util.tt_logger import TTlog
+from util.trading_calendar import TradingCalendar
+
+from database.db_manager import DBM
+from database.backfill_planner import BackfillPlanner
+from database.lease_queue import LeaseQueue
+from kiwoom.constant import KiwoomServerCheckTimeError
+from util import constant
+
+# load main UI object
+ui = uic.loadUiType(config_manager.MAIN_UI_PATH)[0]
+
+SCREEN_NO_BASE = 7000  # worker 별 화면번호 : SCREEN_NO_BASE + worker index
+
+
+# main class
+class TopTrader(QMainWindow, ui):
+    """collect_stock_data_sharded.py 가 실행하는 분봉 수집 worker. (Kiwoom session 1개)
+
+        python collect_stock_data_worker.py {duration} {worker index} {YYYYMMDD}
+
+        1. 전 종목(get_stock_basic_info)의 수집 계획(BackfillPlanner)을 공유 queue(LeaseQueue)에 넣는다. (먼저 실행된 worker 만 추가됨)
+        2. queue 에서 종목을 하나씩 lease 하여 수집/저장하고 완료를 기록한다.
+        3. 남은 종목이 없으면 종료한다. 다른 worker 가 죽어서 lease 가 만료된 종목도 가져간다.
+    """
+    def __init__(self):
+        super().__init__()
+        self.duration, self.worker_index = sys.argv[1], int(sys.argv[2])
+        self.worker_id = "{}_worker{}".format(self.duration, self.worker_index)
+        self.logger = TTlog(logger_name="TT" + self.worker_id).logger
+        self.dbm = DBM('TopTrader')
+        self.calendar = TradingCalendar()
+        base_date = datetime.strptime(sys.argv[3], "%Y%m%d")
+        self.end_date = datetime(base_date.year, base_date.month, base_date.day, 16, 0, 0)
+        self.screen_no = str(SCREEN_NO_BASE + self.worker_index)
+        self.queue = LeaseQueue(self.dbm.db.collect_work_queue, LeaseQueue.make_job(self.duration, base_date),
+                                self.worker_id)
+        self.kw = get_kiwoom(tr_history_name=self.worker_id)
+        self.login()
+        self.collect_n_save_data_min()
+
+    def login(self):
+        err_code = self.kw.login()
+        if err_code != 0:
+            self.logger.error("Login Fail")
+            exit(-1)
+        self.logger.info("Login success")
+
+    def get_stock_list(self):
+        stock_info = self.kw.get_stock_basic_info()
+        stock_list = [(c, info['stock_name']) for c, info in stock_info.items()]
+        stock_list = [(c, name) for c, name in stock_list if not any(map(lambda x: x in name, constant.FILTER_KEYWORD))]
+        stock_list.sort()
+        return stock_list
+
+    def collect_n_save_data_min(self):
+        col = self.dbm.db.get_collection("time_series_" + self.duration)
+        self.dbm.ensure_unique_index(col)
+        planner = BackfillPlanner(self.dbm, col, self.duration, first_date=datetime(2018, 7, 23, 0, 0, 0),
+                                  calendar=self.calendar)
+        cnt = self.queue.push(planner.plan(self.get_stock_list(), self.end_date))
+        self.logger.info("[{}] {} stocks are added to {}. {}".format(
+            self.worker_id, cnt, self.queue.job, self.queue.get_stats()))
+
+        item = self.queue.lease()
+        while item is not None:
+            code, s_date = item['code'], item['s_date']
+            self.logger.info("[{}] {}/{} : {} ~ {}".format(self.worker_id, code, item['stock_name'], s_date,
+                                                          self.end_date))
+            last_date = None
+            try:
+                for doc in self.kw.iter_stock_price_by_min(code, tick=self.duration.strip("min"),
+                                                           screen_no=self.screen_no,
+                                                           start_date=s_date, end_date=self.end_date):
+                    self.dbm.bulk_upsert(col, doc)
+                    if last_date is None:  # 최신 page 가 먼저 온다
+                        last_date = max(d['date'] for d in doc)
+                    self.queue.renew(code)
+            except KiwoomServerCheckTimeError:
+                self.logger.error("[KiwoomServerCheckTimeError] {}".format(self.worker_id))
+                self.queue.release(code, failed=False)
+                exit(constant.EXIT_SERVER_CHECK_TIME)  # collect_stock_data_sharded.py 에서 delay 후 재시작
+            except SystemExit:
+                # 세션 최대 요청수 도달(TrScheduler.check_session_request) 등으로 종료하면 바로 다른 worker 가 가져가게 한다.
+                self.queue.release(code, failed=False)
+                raise
+            except Exception as e:
+                self.logger.error("[{}] {} : {}".format(self.worker_id, code, e))
+                self.queue.release(code)
+            else:
+                planner.update(code, last_date)
+                self.queue.complete(code)
+            item = self.queue.lease()
+
+        self.logger.info("[{}] no more stocks. {}".format(self.worker_id, self.queue.get_stats()))
+        exit(0)  # Program exit
+
+
+# Print Exception Setting
+sys._excepthook = sys.excepthook
+
+
+def exception_hook(exctype, value, traceback):
+    sys._excepthook(exctype, value, traceback)
+    sys.exit(1)
+
+
+sys.excepthook = exception_hook
+
+if __name__ == "__main__":
+    global app
+    app = QApplication(sys.argv)
+    tt = TopTrader()
+    tt.show()
+    sys.exit(app.exec_())
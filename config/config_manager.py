@@ -15,10 +15,16 @@ ACCOUNT_MONITOR = True
 ROOT_PATH = os.path.dirname(os.path.abspath(__file__)).replace("config", "")
 CFG_PATH = os.path.join(ROOT_PATH, "config")
 STOCK_INFO = {}
+TRADING_CALENDAR_FILE = "krx_calendar.json"  # CFG_PATH 아래의 KRX 휴장일/장운영시간 파일
 
 # runtime mode
 MODE = ""
 
+# Kiwoom backend (모두 빈 값이면 실제 Kiwoom OCX 사용)
+KIWOOM_REPLAY_PATH = os.environ.get("KIWOOM_REPLAY_PATH", "")  # 녹화 파일을 재생하는 ReplayKiwoom 사용
+KIWOOM_REPLAY_LATENCY = float(os.environ.get("KIWOOM_REPLAY_LATENCY", "0"))  # ReplayKiwoom TR 지연시간(sec)
+KIWOOM_RECORD_PATH = os.environ.get("KIWOOM_RECORD_PATH", "")  # 실제 Kiwoom 의 응답/실시간 이벤트를 녹화
+
 
 def get_slack_token():
     global SLACK_TOKEN
@@ -0,0 +1,80 @@
+from util.trading_calendar import TradingCalendar
+
+
+class BackfillPlanner(object):
+    """종목별 high-water mark(마지막으로 저장된 봉의 date)를 기준으로 수집할 구간만 계획한다.
+
+        전 종목에 대해 같은 기간을 다시 요청하지 않고, 종목마다 hwm ~ end_date 만 요청한다.
+        hwm 이후 장운영시간이 없는 종목(이미 최신인 종목)은 TR 을 요청하지 않으며,
+        hwm 이 오래된 종목(가장 많이 밀린 종목)부터 수집한다.
+        같은 end_date 까지 MAX_FAILURES 번 수집에 실패한 종목(거래정지, 상장폐지 등)은 더 계획하지 않는다.
+        hwm 봉은 수집 당시 장중이었을 수 있으므로 begin_date 에 포함해서 다시 받는다.
+        opt10080 은 begin_date 보다 오래된 page 에 도달하면 tr_next 요청을 멈추므로 저장된 구간은 다시 받지 않는다.
+
+        >>> planner = BackfillPlanner(dbm, dbm.db.time_series_min1, "min1", first_date=datetime(2018, 7, 23))
+        >>> for code, stock_name, s_date in planner.plan(stock_list, end_date):
+        >>>     docs = kw.stock_price_by_min(code, "1", screen_no, s_date, end_date)
+        >>>     planner.update(code, max(doc['date'] for doc in docs) if docs else None)
+    """
+    MAX_FAILURES = 3
+
+    def __init__(self, dbm, col, unit, first_date, calendar=None):
+        """
+
+        :param dbm: DBM
+        :param col: 봉 data 가 저장되는 collection
+        :param unit: 봉 단위 (min1, min3, ...)
+        :param first_date: hwm 이 없는 종목(한번도 저장하지 않은 종목)의 수집 시작일
+        :param calendar: None 이면 TradingCalendar()
+        """
+        self.dbm = dbm
+        self.col = col
+        self.unit = unit
+        self.first_date = first_date
+        self.calendar = calendar if calendar is not None else TradingCalendar()
+        self.hwm = self.dbm.get_high_water_marks(self.col, self.unit)
+
+    def get_start_date(self, code):
+        return self.hwm.get(code, self.first_date)
+
+    def plan(self, stock_list, end_date):
+        """수집이 필요한 종목과 시작일
+
+        :param stock_list: [(code, stock_name), ...]
+        :param end_date:
+        :return: [(code, stock_name, s_date), ...] s_date 가 오래된 순
+        """
+        failures = self.dbm.get_backfill_failures(self.unit, end_date)
+        ret = []
+        for code, stock_name in stock_list:
+            if failures.get(code, 0) >= self.MAX_FAILURES:
+                continue
+            s_date = self.get_start_date(code)
+            if s_date < end_date and self.calendar.has_session(s_date, end_date):
+                ret.append((code, stock_name, s_date))
+        ret.sort(key=lambda x: (x[2], x[0]))
+        return ret
+
+    def update(self, code, last_date):
+        """수집한 봉 중 가장 최근 date 로 hwm 을 갱신한다.
+        page 단위로 저장하는 경우, 종목의 모든 page 를 저장한 후에 호출해야 중간에 빠진 구간이 생기지 않는다.
+
+        :param code:
+        :param last_date: 저장한 봉 중 가장 최근 date (data 가 없으면 None)
+        :return: 갱신된 hwm
+        """
+        if last_date is None:
+            return self.hwm.get(code)
+        self.dbm.save_high_water_mark(self.unit, code, last_date)
+        if code not in self.hwm or self.hwm[code] < last_date:
+            self.hwm[code] = last_date
+        return self.hwm[code]
+
+    def fail(self, code, end_date):
+        """종목의 수집 실패를 기록한다.
+
+        :param code:
+        :param end_date:
+        :return: MAX_FAILURES 번 실패하여 더 이상 다시 수집하지 않으면 True
+        """
+        return self.dbm.save_backfill_failure(self.unit, code, end_date) >= self.MAX_FAILURES
@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+
+class BarBuilder(object):
+    """OnReceiveRealData(주식체결) 이벤트로부터 종목별 초/분봉(OHLCV)을 실시간으로 만든다.
+
+        봉은 opt10080(주식분봉) 과 같이 구간이 끝나는 시각을 date 로 사용한다. (ex. 09:00:00 ~ 09:00:59 -> 09:01:00)
+        다음 구간의 체결이 오거나 close_bars() 에서 구간이 지나면 완성된 봉을 unit 별 writer 로 넘긴다.
+        timer 에서는 로컬 시각이 아니라 받은 체결시각(거래소 시각)을 기준으로 닫는다. (close_due_bars)
+        이미 완성된 구간의 체결이 늦게 도착하면 저장된 봉을 덮어쓰지 않도록 버리고 late 로 집계한다.
+        저장되는 doc 은 time_series_min* 과 같은 형태이다.
+
+        {'code': 종목코드, 'date': 봉 종료시각, '시가': xx, '고가': xx, '저가': xx, '현재가': 종가, '거래량': xx}
+
+        >>> writers = {unit: RealtimeWriter(dbm.col_table[unit], upsert_keys=('code', 'date')) for unit in BarBuilder.UNITS}
+        >>> builder = BarBuilder(writers)
+        >>> kw.reg_callback("OnReceiveRealData", "", builder.on_real_data)
+    """
+    UNITS = {
+        "sec1": 1,
+        "min1": 60,
+        "min3": 180,
+        "min5": 300,
+        "min10": 600,
+        "min30": 1800
+    }  # unit -> 봉 구간(sec)
+    CLOSE_DELAY = 2  # 구간이 끝난 후 늦게 도착하는 체결을 기다리는 시간(sec)
+
+    def __init__(self, writers):
+        """
+
+        :param writers: {unit: 완성된 봉 doc 을 put() 으로 받는 객체(RealtimeWriter), ...}
+        """
+        self.writers = writers
+        self.bars = {unit: {} for unit in writers}  # unit -> {code: [시작시각, 시가, 고가, 저가, 종가, 거래량]}
+        self.last_start = {unit: {} for unit in writers}  # unit -> {code: 마지막으로 완성된 봉의 시작시각}
+        self.last_timestamp = None  # 받은 체결 중 가장 최근 체결시각
+        self.ticks = 0
+        self.late = 0
+
+    @staticmethod
+    def get_bar_start(timestamp, seconds):
+        """timestamp 가 속한 봉의 시작시각
+
+        :param timestamp:
+        :param seconds: 봉 구간(sec)
+        :return:
+        """
+        elapsed = timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+        return timestamp.replace(microsecond=0) - timedelta(seconds=elapsed % seconds)
+
+    def on_real_data(self, data):
+        """OnReceiveRealData callback (RealDecoder 로 변환된 doc)
+
+        :param data:
+        :return:
+        """
+        if data.get('real_type') != "주식체결":
+            return
+        self.update(data['code'], data['timestamp'], data['현재가'], abs(data['거래량']))
+
+    def update(self, code, timestamp, price, volume):
+        """체결 1건을 모든 unit 의 봉에 반영한다.
+
+        :param code:
+        :param timestamp: 체결시각
+        :param price: 체결가
+        :param volume: 체결량
+        :return:
+        """
+        self.ticks += 1
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        for unit, code_bars in self.bars.items():
+            start = self.get_bar_start(timestamp, self.UNITS[unit])
+            bar = code_bars.get(code)
+            last_start = self.last_start[unit].get(code)
+            if bar is None or start > bar[0]:
+                if bar is not None:
+                    self.complete(unit, code, bar)
+                elif last_start is not None and start <= last_start:
+                    self.late += 1
+                    continue
+                code_bars[code] = [start, price, price, price, price, volume]
+            elif start < bar[0]:
+                self.late += 1
+            else:
+                if price > bar[2]:
+                    bar[2] = price
+                if price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += volume
+
+    def complete(self, unit, code, bar):
+        start, open_, high, low, close, volume = bar
+        self.last_start[unit][code] = start
+        self.writers[unit].put({
+            'code': code,
+            'date': start + timedelta(seconds=self.UNITS[unit]),
+            '시가': float(open_),
+            '고가': float(high),
+            '저가': float(low),
+            '현재가': float(close),
+            '거래량': float(volume)
+        })
+
+    def close_bars(self, now):
+        """now 까지 구간이 끝난 봉을 완성한다. (체결이 뜸한 종목의 마지막 봉)
+
+        :param now:
+        :return: 완성한 봉 수
+        """
+        cnt = 0
+        for unit, code_bars in self.bars.items():
+            seconds = self.UNITS[unit]
+            for code in [code for code, bar in code_bars.items() if bar[0] + timedelta(seconds=seconds) <= now]:
+                self.complete(unit, code, code_bars.pop(code))
+                cnt += 1
+        return cnt
+
+    def close_due_bars(self, now):
+        """최근 체결시각(거래소 시각)에서 CLOSE_DELAY 가 지난 시각까지 구간이 끝난 봉을 완성한다.
+        로컬 시각으로 닫으면 거래소 시각보다 빠르거나 전송이 늦은 체결이 late 로 버려지므로,
+        최근 체결시각과 now 중 이른 시각을 기준으로 한다.
+
+        :param now: 로컬 시각
+        :return: 완성한 봉 수
+        """
+        if self.last_timestamp is None:
+            return 0
+        return self.close_bars(min(now, self.last_timestamp) - timedelta(seconds=self.CLOSE_DELAY))
@@ -1,11 +1,43 @@
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from singleton_decorator import singleton
 from datetime import datetime
+from database.tick_cache import TickCache
+from database.tick_store import TickStore
 from util.tt_logger import TTlog
 
 @singleton
 class DBM():
+    BULK_WRITE_SIZE = 1000  # bulk_upsert 의 batch 크기
+
+    # collection 별 index 정의 : {collection 명: [(index 필드, unique 여부), ...]}
+    # DBM 의 query 패턴이 바뀌면 함께 수정해야 한다. (diagnose_queries 로 확인)
+    INDEXES = dict(
+        [("time_series_tick" + tick, [(('code', 'date'), True)]) for tick in ["1", "3", "5", "10", "30"]] +
+        [("time_series_sec1", [(('code', 'date'), True)])] +
+        [("time_series_min" + m, [(('code', 'date'), True)]) for m in ["1", "3", "5", "10", "30", "60"]] +
+        [("time_series_" + d, [(('code', 'date'), True)]) for d in ["day", "week", "month", "year"]] +
+        [
+            ("real_condi_search", [(('condi_name', 'event', 'date'), False),
+                                   (('date', 'event'), False),
+                                   (('condi_index', 'date'), False)]),
+            ("real_condi_search_cache", [(('date',), True)]),
+            ("collect_tick_data_history", [(('code', 'date', 'tick'), True)]),
+            ("collect_tick_data_status", [(('date', 'tick'), True)]),
+            ("backfill_hwm", [(('unit', 'code'), True)]),
+            ("collect_work_queue", [(('job', 'code'), True), (('job', 'status', 's_date'), False)]),
+            ("stock_information", [(('code',), False)]),
+            ("trading_history", [(('date',), False)]),
+            ("strategy_sweep", [(('sweep_id', 'rank'), False)]),
+            ("realtime_stream", [(('code', 'timestamp'), False)])
+        ]
+    )
+
+    # MongoDB time-series collection 으로 생성할 collection : {collection 명: (timeField, metaField)}
+    TIME_SERIES_COLLECTIONS = {
+        "realtime_stream": ('timestamp', 'code')
+    }
+
     def __init__(self, dbname, host=None, port=None):
         """DBM 생성자, dbname을 인자로 받는다.
 
@@ -23,6 +55,7 @@ class DBM():
             "tick5": self.db.time_series_tick5,
             "tick10": self.db.time_series_tick10,
             "tick30": self.db.time_series_tick30,
+            "sec1": self.db.time_series_sec1,
             "min1": self.db.time_series_min1,
             "min3": self.db.time_series_min3,
             "min5": self.db.time_series_min5,
@@ -30,7 +63,110 @@ class DBM():
             "min30": self.db.time_series_min30,
             "real_condi_search": self.db.real_condi_search
         }
+        self.tick_cache = TickCache()
+        self.tick_store = TickStore()  # tick data 로 만든 time_series_sec1 (trading.stock 이 저장)
         self.logger = TTlog(logger_name="DB").logger
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """INDEXES 에 정의된 모든 index 를 생성한다. (이미 있는 index 는 그대로 둔다)
+
+        :return:
+        """
+        # index 를 만들면 일반 collection 이 생성되므로, time-series collection 을 먼저 만든다.
+        for col_name, (time_field, meta_field) in self.TIME_SERIES_COLLECTIONS.items():
+            self.ensure_time_series_collection(col_name, time_field, meta_field)
+        for col_name, index_list in self.INDEXES.items():
+            for keys, unique in index_list:
+                self.ensure_index(self.db[col_name], keys, unique)
+
+    def diagnose_queries(self):
+        """DBM 의 query method 들이 사용하는 query 를 explain() 하여 실행계획을 반환한다.
+        index 를 사용하지 않는(COLLSCAN) query 는 warning 로그를 남긴다.
+        query 에 사용할 code, date 값은 각 collection 의 임의의 doc 에서 가져온다.
+
+        :return: [{'method', 'collection', 'stages', 'collscan', 'docs_examined', 'n_returned', 'time_ms'}, ...]
+        """
+        ret = []
+        for method, col, query, sort in self.gen_sample_queries():
+            cur = col.find(query)
+            if bool(sort):
+                cur = cur.sort(sort)
+            plan = cur.explain()
+            stages = self.get_plan_stages(plan['queryPlanner']['winningPlan'])
+            stats = plan.get('executionStats', {})
+            info = {
+                'method': method,
+                'collection': col.name,
+                'stages': stages,
+                'collscan': 'COLLSCAN' in stages,
+                'docs_examined': stats.get('totalDocsExamined'),
+                'n_returned': stats.get('nReturned'),
+                'time_ms': stats.get('executionTimeMillis')
+            }
+            if info['collscan']:
+                self.logger.warning("[COLLSCAN] {} : {} {}".format(method, col.name, query))
+            elif not bool(stages):
+                self.logger.warning("[UNKNOWN PLAN] {} : {} {} {}".format(method, col.name, query, plan))
+            else:
+                self.logger.info("[{}] {} : {} {}".format("/".join(stages), method, col.name, query))
+            ret.append(info)
+        return ret
+
+    def gen_sample_queries(self):
+        """diagnose_queries 에서 사용할 (method 명, collection, query, sort) list 를 생성한다.
+
+        :return:
+        """
+        queries = []
+        tick = self.db.time_series_tick1.find_one({}, {'_id': 0, 'code': 1, 'date': 1})
+        if bool(tick):
+            code, date = tick['code'], tick['date']
+            queries += [
+                ('check_tick_cache', self.db.time_series_tick1, {'code': code, 'date': date}, None),
+                ('get_tick_doc', self.db.time_series_tick1, {'code': code, 'date': date}, None),
+                ('get_tick_data', self.db.time_series_tick1, {'code': code, 'date': date}, None),
+                ('already_collect_tick_data', self.db.collect_tick_data_history,
+                 {'code': code, 'date': date, 'tick': "1"}, None),
+                ('get_collect_tick_data_status', self.db.collect_tick_data_status, {'date': date, 'tick': "1"}, None),
+                ('get_code_list_condi_search_result', self.db.real_condi_search_cache, {'date': date}, None)
+            ]
+
+        rcs = self.db.real_condi_search.find_one({}, {'_id': 0, 'date': 1, 'condi_name': 1, 'condi_index': 1})
+        if bool(rcs):
+            date = rcs['date']
+            s_date = datetime(date.year, date.month, date.day, 9, 0, 0)
+            e_date = datetime(date.year, date.month, date.day, 15, 30, 0)
+            queries += [
+                ('get_real_condi_search_data', self.db.real_condi_search,
+                 {'date': {'$gte': s_date, '$lte': e_date}, 'event': 'I', 'condi_name': rcs['condi_name']},
+                 [('date', pymongo.ASCENDING)]),
+                ('get_code_list_of_rcs', self.db.real_condi_search, {'date': {'$gte': s_date, '$lte': e_date}}, None),
+                ('get_condi_result', self.db.real_condi_search,
+                 {'date': {'$gte': s_date, '$lte': e_date}, 'event': 'I'}, None),
+                ('code_list_by_condi_id', self.db.real_condi_search,
+                 {'condi_index': rcs['condi_index'], 'date': date}, None)
+            ]
+
+        for col_name in ["time_series_min1", "time_series_day"]:
+            doc = self.db[col_name].find_one({}, {'_id': 0, 'code': 1, 'date': 1})
+            if bool(doc):
+                queries.append(('bulk_upsert', self.db[col_name], {'code': doc['code'], 'date': doc['date']}, None))
+        return queries
+
+    def get_plan_stages(self, plan):
+        """explain() 의 winningPlan 에서 stage 이름을 바깥쪽부터 순서대로 반환한다.
+        SBE engine(MongoDB 5.0+)의 winningPlan 은 stage tree 가 queryPlan 아래에 있다.
+
+        :param plan:
+        :return: ex) ['FETCH', 'IXSCAN']
+        """
+        plan = plan.get('queryPlan', plan)
+        stages = [plan.get('stage')]
+        for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+            if bool(child):
+                stages += self.get_plan_stages(child)
+        return [stage for stage in stages if bool(stage)]
 
     def get_unique_data(self, col, query=None):
         """collection의 특정 필드값을 unique 하게 얻고 싶을때 사용
@@ -53,20 +189,29 @@ class DBM():
         return self.col_table[time_unit]
 
     def check_tick_cache(self, code, date, tick="1"):
-        """특정 종목의 하루단위 tick data가 DB에 있는지 확인하고,
-        DB에 있으면 cur를 반환한다.
+        """특정 종목의 하루단위 tick data가 DB에 있는지 확인한다.
+        (tick data 는 가져오지 않고, index 만으로 확인한다.)
 
         :param code:
         :param date:
         :param tick:
-        :return:
+        :return: bool
         """
         col = self.get_time_series_collection("tick" + tick)
         date = datetime(date.year, date.month, date.day, 0, 0, 0)
-        cur = col.find({'code': code, 'date': date})
-        if cur.count() != 0:
-            return True, cur
-        return False, None
+        return col.count_documents({'code': code, 'date': date}, limit=1) != 0
+
+    def get_tick_doc(self, code, date, tick="1"):
+        """특정 종목의 하루단위 tick data doc 을 반환한다.
+
+        :param code:
+        :param date:
+        :param tick:
+        :return: DB 에 없으면 None
+        """
+        col = self.get_time_series_collection("tick" + tick)
+        date = datetime(date.year, date.month, date.day, 0, 0, 0)
+        return col.find_one({'code': code, 'date': date}, {'_id': 0})
 
     def save_force(self, col, data, search_condition):
         try:
@@ -74,6 +219,127 @@ class DBM():
         except Exception as e:
             col.update(search_condition, data, upsert=True)
 
+    def ensure_time_series_collection(self, col_name, time_field, meta_field):
+        """time-series collection 을 생성한다. (MongoDB 5.0 이상, 이미 있거나 지원하지 않으면 일반 collection 사용)
+
+        :param col_name:
+        :param time_field: 시각 필드
+        :param meta_field: 시계열을 구분하는 필드 (ex. code)
+        :return:
+        """
+        if col_name in self.db.list_collection_names():
+            return
+        try:
+            self.db.create_collection(col_name, timeseries={
+                'timeField': time_field, 'metaField': meta_field, 'granularity': 'seconds'})
+        except pymongo.errors.PyMongoError as e:
+            self.logger.warning("[{}] time-series collection is not supported : {}".format(col_name, e))
+
+    def ensure_index(self, col, keys, unique=False):
+        """collection 에 복합 index 를 생성한다. (이미 있으면 아무 동작도 하지 않음)
+
+        :param col: collection 객체
+        :param keys: index 필드
+        :param unique: unique index 여부
+        :return:
+        """
+        try:
+            col.create_index([(key, pymongo.ASCENDING) for key in keys], unique=unique)
+        except pymongo.errors.OperationFailure as e:
+            # unique index 인데 중복된 doc 이 이미 저장되어 있는 경우 등
+            self.logger.error("[{}] fail to create index {} : {}".format(col.name, keys, e))
+
+    def ensure_unique_index(self, col, keys=('code', 'date')):
+        """collection 에 unique 복합 index 를 생성한다. (이미 있으면 아무 동작도 하지 않음)
+
+        :param col: collection 객체
+        :param keys: index 필드
+        :return:
+        """
+        self.ensure_index(col, keys, unique=True)
+
+    def bulk_upsert(self, col, docs, keys=('code', 'date'), batch_size=None):
+        """keys 가 같은 doc 은 갱신, 없으면 추가한다.
+        doc 마다 update 를 호출하지 않고 batch_size 단위의 unordered bulk_write 로 묶어서 보낸다.
+
+        :param col: collection 객체
+        :param docs: 저장할 doc list
+        :param keys: doc 을 식별하는 필드 (unique index 필드)
+        :param batch_size: None 이면 BULK_WRITE_SIZE
+        :return: upsert 또는 변경된 doc 수
+        """
+        batch_size = batch_size if bool(batch_size) else self.BULK_WRITE_SIZE
+        docs = list(docs)
+        cnt = 0
+        for i in range(0, len(docs), batch_size):
+            requests = [UpdateOne({key: doc[key] for key in keys}, {'$set': doc}, upsert=True)
+                        for doc in docs[i:i + batch_size]]
+            ret = col.bulk_write(requests, ordered=False)
+            cnt += ret.upserted_count + ret.modified_count
+        return cnt
+
+    def get_high_water_marks(self, col, unit):
+        """unit 별 종목의 마지막으로 저장된 봉 date (backfill_hwm)
+        한번도 기록하지 않은 unit 이면 col 에서 종목별 최대 date 를 구해서 기록한다. ((code, date) index 사용)
+
+        :param col: 봉 data 가 저장되는 collection
+        :param unit: 봉 단위 (min1, min3, ...)
+        :return: {code: date, ...}
+        """
+        # 수집 실패 횟수만 기록된 종목(save_backfill_failure)은 hwm 이 없다.
+        hwm = {doc['code']: doc['date']
+               for doc in self.db.backfill_hwm.find({'unit': unit, 'date': {'$ne': None}}, {'_id': 0})}
+        if bool(hwm):
+            return hwm
+
+        pipeline = [
+            # (code, date) index 순서 그대로 정렬해야 index 를 사용한다.
+            {'$sort': {'code': 1, 'date': 1}},
+            {'$group': {'_id': '$code', 'date': {'$last': '$date'}}}
+        ]
+        hwm = {doc['_id']: doc['date'] for doc in col.aggregate(pipeline, allowDiskUse=True)}
+        if bool(hwm):
+            self.bulk_upsert(self.db.backfill_hwm,
+                             [{'unit': unit, 'code': code, 'date': date} for code, date in hwm.items()],
+                             keys=('unit', 'code'))
+        return hwm
+
+    def save_high_water_mark(self, unit, code, date):
+        """종목의 hwm 을 갱신한다. (기존 값보다 최근인 경우에만)
+
+        :param unit:
+        :param code:
+        :param date: 저장한 봉 중 가장 최근 date
+        :return:
+        """
+        self.db.backfill_hwm.update_one({'unit': unit, 'code': code}, {'$max': {'date': date}}, upsert=True)
+
+    def save_backfill_failure(self, unit, code, end_date):
+        """종목의 수집 실패 횟수를 hwm 과 같이 기록한다. (end_date 가 바뀌면 다시 센다)
+
+        :param unit:
+        :param code:
+        :param end_date: 수집 종료일
+        :return: end_date 까지 수집하다 실패한 횟수
+        """
+        ret = self.db.backfill_hwm.update_one({'unit': unit, 'code': code, 'fail_date': end_date},
+                                              {'$inc': {'failures': 1}})
+        if ret.matched_count == 1:
+            return self.db.backfill_hwm.find_one({'unit': unit, 'code': code})['failures']
+        self.db.backfill_hwm.update_one({'unit': unit, 'code': code},
+                                        {'$set': {'fail_date': end_date, 'failures': 1}}, upsert=True)
+        return 1
+
+    def get_backfill_failures(self, unit, end_date):
+        """end_date 까지 수집하다 실패한 종목별 횟수
+
+        :param unit:
+        :param end_date:
+        :return: {code: 실패 횟수, ...}
+        """
+        return {doc['code']: doc['failures']
+                for doc in self.db.backfill_hwm.find({'unit': unit, 'fail_date': end_date}, {'_id': 0})}
+
     def get_tick_data(self, code, date, tick="1"):
         col = self.get_time_series_collection("tick" + tick)
         base_date = datetime(date.year, date.month, date.day)
@@ -81,11 +347,31 @@ class DBM():
             'code': code,
             'date': base_date
         }
-        cur = col.find(query)
-        if cur.count() == 0:
+        doc = col.find_one(query, {'_id': 0, 'time_series_1tick': 1})
+        if doc is None:
             return []
+        return doc["time_series_1tick"]
 
-        return cur.next()["time_series_1tick"]
+    def get_tick_columns(self, code, date, tick="1"):
+        """특정 종목의 하루단위 tick data 를 column(memory-mapped array) 형태로 반환한다.
+        처음 읽을때 DB 에서 가져와 local cache(TickCache)에 저장하고, 이후에는 cache 만 읽는다.
+
+            {'timestamp': datetime64[ns] array, '현재가': float64 array, '거래량': int64 array}
+
+        :param code:
+        :param date:
+        :param tick:
+        :return: DB 에 data 가 없으면 None
+        """
+        base_date = datetime(date.year, date.month, date.day)
+        columns = self.tick_cache.load(code, base_date, tick)
+        if columns is not None:
+            return columns
+
+        tick_data = self.get_tick_data(code, base_date, tick)
+        if not bool(tick_data):
+            return None
+        return self.tick_cache.save(code, base_date, tick_data, tick)
 
     def save_tick_data(self, data, tick="1"):
         col = self.get_time_series_collection("tick" + tick)
@@ -93,6 +379,10 @@ class DBM():
             col.insert(data)
         except Exception as e:
             col.update({'date': data['date'], 'code': data['code']}, data, upsert=True)
+        # 이전 tick data 로 만든 cache 는 지운다.
+        self.tick_cache.remove(data['code'], data['date'], tick)
+        if tick == "1":
+            self.tick_store.discard(data['code'], data['date'])
 
     def get_code_list_of_rcs(self, s_date, e_date):
         cur = self.db.real_condi_search.find({'date': {'$gte': s_date, '$lte': e_date}}, {'code':1, '_id': 0})
@@ -102,10 +392,10 @@ class DBM():
 
     def get_code_list_condi_search_result(self, date):
         # cache
-        cur = self.db.real_condi_search_cache.find({'date': date})
-        if cur.count() != 0:
+        doc = self.db.real_condi_search_cache.find_one({'date': date}, {'_id': 0, 'code_list': 1})
+        if doc is not None:
             self.logger.debug("hit cache (real_condi_search_cache)")
-            code_list = cur.next()['code_list']
+            code_list = doc['code_list']
         else:
             s_date = datetime(date.year, date.month, date.day, 9, 0, 0)
             e_date = datetime(date.year, date.month, date.day, 16, 0, 0)
@@ -138,8 +428,8 @@ class DBM():
         return code_list
 
     def already_collect_tick_data(self, code, date, tick="1"):
-        cur = self.db.collect_tick_data_history.find({'code': code, 'date': date, 'tick': tick})
-        return cur.count() != 0
+        query = {'code': code, 'date': date, 'tick': tick}
+        return self.db.collect_tick_data_history.count_documents(query, limit=1) != 0
 
     def save_collect_tick_data_history(self, code, date, tick="1"):
         self.db.collect_tick_data_history.update({'code': code, 'date': date, 'tick': tick},
@@ -154,11 +444,10 @@ class DBM():
         )
 
     def get_collect_tick_data_status(self, date, tick="1"):
-        cur = self.db.collect_tick_data_status.find({'date': date, 'tick': tick})
-        if cur.count() == 0:
+        doc = self.db.collect_tick_data_status.find_one({'date': date, 'tick': tick}, {'_id': 0, 'status': 1})
+        if doc is None:
             return "NEVER_STARTED"
-        data = cur.next()
-        return data['status']
+        return doc['status']
 
     def get_real_condi_search_data(self, date, condi_name):
         y, m, d = date.year, date.month, date.day
@@ -170,6 +459,40 @@ class DBM():
         query = {'date': {'$gte': s_date, '$lte': e_date}, 'event': 'I', 'condi_name': condi_name}
         cur = self.db.real_condi_search.find(query)\
             .sort('date', pymongo.ASCENDING)
-        if cur.count() == 0:
-            return []
         return list(cur)
+
+    def get_stock_info(self):
+        """stock_information 컬렉션으로부터 주식 기본정보를 dict 형태로 반환한다.
+        (Kiwoom.get_stock_basic_info 와 같은 형태)
+
+        :return:
+        """
+        cur = self.db.stock_information.find({}, {'_id': 0, 'code': 1, 'stock_name': 1, 'market': 1})
+        return {doc['code']: {'stock_name': doc['stock_name'], 'market': doc['market']} for doc in cur}
+
+    def get_condi_info(self, s_date, e_date):
+        """기간내 실시간 조건검색 이력이 있는 조건검색식 정보를 반환한다.
+        (Kiwoom.get_condition_load 와 같은 형태)
+
+        :param s_date:
+        :param e_date:
+        :return: {condi_name: condi_index, ...}
+        """
+        query = {'date': {'$gte': s_date, '$lte': e_date}, 'event': 'I'}
+        cur = self.db.real_condi_search.aggregate([
+            {'$match': query},
+            {'$group': {'_id': '$condi_name', 'condi_index': {'$first': '$condi_index'}}}
+        ])
+        return {doc['_id']: doc['condi_index'] for doc in cur}
+
+    def save_sweep_result(self, sweep_id, result):
+        """parameter sweep 결과(순위가 매겨진 doc list)를 strategy_sweep 컬렉션에 저장한다.
+
+        :param sweep_id:
+        :param result:
+        :return:
+        """
+        col = self.db.strategy_sweep
+        col.delete_many({'sweep_id': sweep_id})
+        if bool(result):
+            col.insert_many([dict(doc, sweep_id=sweep_id) for doc in result])
@@ -0,0 +1,141 @@
+from datetime import datetime
+from datetime import timedelta
+
+from pymongo import ReturnDocument
+
+
+class LeaseQueue(object):
+    """여러 collector process(Kiwoom session) 가 공유하는 MongoDB 작업 queue.
+
+        작업(종목)을 꺼낼 때 lease(worker, 만료시각)를 기록하고, 만료될 때까지 완료하지 못하면
+        (process 가 죽은 경우 등) 다른 worker 가 다시 가져간다. 같은 job 을 여러 worker 가 동시에 push 해도
+        (job, code) 별로 하나만 저장된다.
+
+        {'job': job, 'code': 종목코드, 'stock_name': 종목명, 's_date': 수집 시작일,
+         'status': 'ready' | 'leased' | 'done' | 'failed', 'worker': worker_id, 'lease_until': 만료시각, 'attempts': 횟수}
+
+        >>> queue = LeaseQueue(dbm.db.collect_work_queue, "min1_20180802", worker_id="worker0")
+        >>> queue.push(planner.plan(stock_list, end_date))
+        >>> item = queue.lease()
+        >>> while item is not None:
+        >>>     ...
+        >>>     queue.complete(item['code'])
+        >>>     item = queue.lease()
+    """
+    READY = "ready"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+    MAX_ATTEMPTS = 3  # 이 횟수만큼 실패한 작업은 failed 로 남긴다.
+
+    def __init__(self, col, job, worker_id, lease_sec=300):
+        """
+
+        :param col: queue collection (DBM.INDEXES 의 collect_work_queue)
+        :param job: 작업 묶음 이름 (ex. min1_20180802)
+        :param worker_id: lease 를 가진 worker 이름
+        :param lease_sec: lease 유지시간(sec), renew() 없이 지나면 다른 worker 가 가져갈 수 있다.
+        """
+        self.col = col
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_sec = lease_sec
+
+    @staticmethod
+    def make_job(duration, date):
+        return "{}_{}".format(duration, date.strftime("%Y%m%d"))
+
+    def push(self, plan):
+        """작업을 추가한다. 이미 있는 (job, code) 는 그대로 둔다.
+
+        :param plan: [(code, stock_name, s_date), ...] (BackfillPlanner.plan)
+        :return: 새로 추가된 작업 수
+        """
+        cnt = 0
+        for code, stock_name, s_date in plan:
+            ret = self.col.update_one({'job': self.job, 'code': code},
+                                      {'$setOnInsert': {'job': self.job,
+                                                        'code': code,
+                                                        'stock_name': stock_name,
+                                                        's_date': s_date,
+                                                        'status': self.READY,
+                                                        'worker': None,
+                                                        'lease_until': None,
+                                                        'attempts': 0}},
+                                      upsert=True)
+            cnt += 1 if ret.upserted_id is not None else 0
+        return cnt
+
+    def lease(self):
+        """대기중이거나 lease 가 만료된 작업 중 s_date 가 가장 오래된 작업을 가져간다.
+
+        :return: 작업 doc, 남은 작업이 없으면 None
+        """
+        now = datetime.now()
+        query = {
+            'job': self.job,
+            '$or': [{'status': self.READY},
+                    {'status': self.LEASED, 'lease_until': {'$lt': now}}]
+        }
+        update = {
+            '$set': {'status': self.LEASED, 'worker': self.worker_id,
+                     'lease_until': now + timedelta(seconds=self.lease_sec)},
+            '$inc': {'attempts': 1}
+        }
+        return self.col.find_one_and_update(query, update, sort=[('s_date', 1), ('code', 1)],
+                                            return_document=ReturnDocument.AFTER)
+
+    def renew(self, code):
+        """lease 를 연장한다. (page 를 받을 때마다 호출)
+
+        :param code:
+        :return: lease 를 아직 가지고 있으면 True
+        """
+        ret = self.col.update_one(self.owned(code),
+                                  {'$set': {'lease_until': datetime.now() + timedelta(seconds=self.lease_sec)}})
+        return ret.matched_count == 1
+
+    def complete(self, code):
+        ret = self.col.update_one(self.owned(code), {'$set': {'status': self.DONE, 'lease_until': None}})
+        return ret.matched_count == 1
+
+    def release(self, code, failed=True):
+        """작업을 대기상태로 돌려놓는다. 다른 worker 가 다시 가져갈 수 있다.
+
+        :param code:
+        :param failed: True 이면 실패로 집계하여 MAX_ATTEMPTS 번 실패한 작업은 failed 로 남기고,
+                       False 이면 (process 종료 등) 이번 lease 를 시도횟수에서 뺀다.
+        :return:
+        """
+        if not failed:
+            self.col.update_one(self.owned(code), {'$set': {'status': self.READY, 'worker': None, 'lease_until': None},
+                                                   '$inc': {'attempts': -1}})
+            return
+        doc = self.col.find_one(self.owned(code), {'attempts': 1})
+        if doc is None:
+            return
+        status = self.FAILED if doc['attempts'] >= self.MAX_ATTEMPTS else self.READY
+        self.col.update_one(self.owned(code), {'$set': {'status': status, 'worker': None, 'lease_until': None}})
+
+    def next_expiry(self):
+        """lease 중인 작업 중 가장 먼저 만료되는 시각
+
+        :return: lease 중인 작업이 없으면 None
+        """
+        doc = self.col.find_one({'job': self.job, 'status': self.LEASED}, {'lease_until': 1},
+                                sort=[('lease_until', 1)])
+        return doc['lease_until'] if doc is not None else None
+
+    def owned(self, code):
+        return {'job': self.job, 'code': code, 'status': self.LEASED, 'worker': self.worker_id}
+
+    def get_stats(self):
+        """status 별 작업 수
+
+        :return: {'ready': x, 'leased': x, 'done': x, 'failed': x}
+        """
+        stats = {status: 0 for status in [self.READY, self.LEASED, self.DONE, self.FAILED]}
+        pipeline = [{'$match': {'job': self.job}}, {'$group': {'_id': '$status', 'cnt': {'$sum': 1}}}]
+        for doc in self.col.aggregate(pipeline):
+            stats[doc['_id']] = doc['cnt']
+        return stats
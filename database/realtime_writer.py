@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import deque
+
+import pymongo
+from pymongo import UpdateOne
+
+from util.tt_logger import TTlog
+
+
+class RealtimeWriter(object):
+    """실시간 data 를 ring buffer 에 쌓아두고, background thread 가 insert_many 로 모아서 저장한다.
+
+        put() 은 buffer 에 추가만 하므로 Qt event thread(OnReceiveRealData callback)가 DB 응답을 기다리지 않는다.
+        buffer 가 batch_size 만큼 쌓이거나 flush_interval(sec) 이 지나면 저장한다.
+        buffer 가 capacity 를 넘으면 새 data 는 버리고 dropped 로 집계한다. (get_stats 로 확인)
+        upsert_keys 를 주면 insert_many 대신 keys 가 같은 doc 을 갱신하는 unordered bulk_write 로 저장한다.
+
+        >>> writer = RealtimeWriter(dbm.db.realtime_stream)
+        >>> writer.start()
+        >>> writer.put({'code': code, 'real_type': real_type, 'timestamp': now, ...})
+        >>> writer.stop()
+    """
+    CAPACITY = 1000000
+    BATCH_SIZE = 1000
+    FLUSH_INTERVAL = 1.0  # sec
+    RETRY_INTERVAL = 1.0  # DB 장애시 재시도 간격(sec)
+    STOP_RETRY = 3  # 종료시 남은 data 저장 재시도 횟수
+
+    def __init__(self, col, capacity=None, batch_size=None, flush_interval=None, logger=None, upsert_keys=None):
+        """
+
+        :param col: 저장할 collection 객체
+        :param capacity: buffer 최대 크기
+        :param batch_size: insert_many 1회당 최대 doc 수
+        :param flush_interval: 최대 저장 주기(sec)
+        :param logger:
+        :param upsert_keys: doc 을 식별하는 필드 (ex. ('code', 'date')), None 이면 insert
+        """
+        self.col = col
+        self.upsert_keys = upsert_keys
+        self.capacity = capacity if bool(capacity) else self.CAPACITY
+        self.batch_size = batch_size if bool(batch_size) else self.BATCH_SIZE
+        self.flush_interval = flush_interval if bool(flush_interval) else self.FLUSH_INTERVAL
+        self.logger = logger if logger is not None else TTlog().logger
+        self.buffer = deque()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.stats = {
+            'enqueued': 0,  # buffer 에 추가된 doc 수
+            'written': 0,  # 저장된 doc 수
+            'dropped': 0,  # buffer 가 가득차서 버린 doc 수
+            'failed': 0,  # 저장에 실패하여 버린 doc 수 (중복 등)
+            'flushes': 0,  # insert_many 호출 수
+            'errors': 0,  # DB 오류 횟수
+            'max_depth': 0,  # 최대 buffer 크기
+            'last_flush_ms': 0.0  # 마지막 insert_many 소요시간
+        }
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="RealtimeWriter", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """writer thread 를 멈춘다. buffer 에 남은 data 는 모두 저장한 후 종료한다.
+
+        :param timeout: thread 종료 대기시간(sec)
+        :return:
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.wakeup.set()
+        self.thread.join(timeout)
+
+    def put(self, doc):
+        """buffer 에 doc 을 추가한다. (DB 에 접근하지 않음)
+
+        :param doc:
+        :return: buffer 가 가득차서 버린 경우 False
+        """
+        depth = len(self.buffer)
+        if depth >= self.capacity:
+            self.stats['dropped'] += 1
+            return False
+        self.buffer.append(doc)
+        self.stats['enqueued'] += 1
+        if depth + 1 > self.stats['max_depth']:
+            self.stats['max_depth'] = depth + 1
+        if depth + 1 >= self.batch_size:
+            self.wakeup.set()
+        return True
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if not self.flush():
+                time.sleep(self.RETRY_INTERVAL)
+
+        for _ in range(self.STOP_RETRY):
+            if self.flush():
+                break
+            time.sleep(self.RETRY_INTERVAL)
+        else:
+            self.logger.error("[RealtimeWriter] {} docs are not saved.".format(len(self.buffer)))
+
+    def flush(self):
+        """buffer 의 doc 을 batch_size 단위로 저장한다.
+
+        :return: DB 오류로 저장하지 못한 경우 False (doc 은 buffer 에 되돌려 놓는다)
+        """
+        while bool(self.buffer):
+            batch = []
+            while bool(self.buffer) and len(batch) < self.batch_size:
+                batch.append(self.buffer.popleft())
+
+            start = time.time()
+            try:
+                self.write(batch)
+                self.stats['written'] += len(batch)
+            except pymongo.errors.BulkWriteError as e:
+                # 중복 등 doc 자체의 오류는 재시도해도 실패하므로 버린다.
+                inserted = len(batch) - len(e.details.get('writeErrors', []))
+                self.stats['written'] += inserted
+                self.stats['failed'] += len(batch) - inserted
+                self.stats['errors'] += 1
+                self.logger.error("[RealtimeWriter] {} docs failed: {}".format(
+                    len(batch) - inserted, e.details.get('writeErrors', [])[:1]))
+            except pymongo.errors.PyMongoError as e:
+                # 접속 오류 등은 buffer 에 되돌려 놓고 다음에 다시 저장한다.
+                self.buffer.extendleft(reversed(batch))
+                self.stats['errors'] += 1
+                self.logger.error("[RealtimeWriter] {}".format(e))
+                return False
+            self.stats['flushes'] += 1
+            self.stats['last_flush_ms'] = round((time.time() - start) * 1000, 2)
+        return True
+
+    def write(self, batch):
+        if self.upsert_keys is None:
+            self.col.insert_many(batch, ordered=False)
+        else:
+            self.col.bulk_write([UpdateOne({key: doc[key] for key in self.upsert_keys}, {'$set': doc}, upsert=True)
+                                 for doc in batch], ordered=False)
+
+    def get_stats(self):
+        """backpressure 확인용 통계
+
+        :return:
+        """
+        return dict(self.stats, depth=len(self.buffer))
@@ -0,0 +1,72 @@
+import os
+import pdb
+import uuid
+
+import numpy as np
+
+from config import config_manager as cfg_mgr
+
+
+class TickCache(object):
+    """time_series_tick* 컬렉션의 (code, date) 별 tick data 를 column 단위 .npy 파일로 보관하는 local cache
+
+        {path}/tick{tick}/{yyyymmdd}/{code}.timestamp.npy  : int64 (datetime64[ns])
+        {path}/tick{tick}/{yyyymmdd}/{code}.price.npy      : float64 (현재가)
+        {path}/tick{tick}/{yyyymmdd}/{code}.volume.npy     : int64 (거래량)
+
+        저장된 column 은 memory-mapped array 로 반환하므로 BSON decoding 없이 바로 사용할 수 있다.
+    """
+    COLUMNS = [('timestamp', 'timestamp', np.int64), ('현재가', 'price', np.float64), ('거래량', 'volume', np.int64)]
+
+    def __init__(self, path=None):
+        self.path = path if bool(path) else os.path.join(cfg_mgr.ROOT_PATH, "cache")
+
+    def get_file_path(self, code, date, tick, name):
+        return os.path.join(self.path, "tick" + tick, date.strftime("%Y%m%d"), "{}.{}.npy".format(code, name))
+
+    def has(self, code, date, tick="1"):
+        return all(os.path.exists(self.get_file_path(code, date, tick, name)) for _, name, _ in self.COLUMNS)
+
+    def load(self, code, date, tick="1"):
+        """cache 된 column 들을 read-only memory-map 으로 연다.
+
+        :param code:
+        :param date:
+        :param tick:
+        :return: {'timestamp': datetime64[ns] array, '현재가': array, '거래량': array}, cache 가 없으면 None
+        """
+        if not self.has(code, date, tick):
+            return None
+        columns = {col: np.load(self.get_file_path(code, date, tick, name), mmap_mode='r')
+                   for col, name, _ in self.COLUMNS}
+        columns['timestamp'] = columns['timestamp'].view('datetime64[ns]')
+        return columns
+
+    def save(self, code, date, tick_data, tick="1"):
+        """DB 의 tick data(list of dict)를 column 으로 변환하여 저장한다.
+        timestamp column 을 마지막에 rename 하므로, has() 가 True 이면 모든 column 이 완성된 상태이다.
+
+        :param code:
+        :param date:
+        :param tick_data: [{'timestamp': datetime, '현재가': xx, '거래량': xx}, ...]
+        :param tick:
+        :return:
+        """
+        arrays = {
+            'timestamp': np.array([d['timestamp'] for d in tick_data], dtype='datetime64[ns]').view(np.int64),
+            '현재가': np.array([d['현재가'] for d in tick_data], dtype=np.float64),
+            '거래량': np.array([d['거래량'] for d in tick_data], dtype=np.int64)
+        }
+        for col, name, dtype in reversed(self.COLUMNS):
+            file_path = self.get_file_path(code, date, tick, name)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = "{}.{}.tmp.npy".format(file_path[:-4], uuid.uuid4().hex)
+            np.save(tmp_path, np.ascontiguousarray(arrays[col], dtype=dtype))
+            os.replace(tmp_path, file_path)
+        return self.load(code, date, tick)
+
+    def remove(self, code, date, tick="1"):
+        for _, name, _ in self.COLUMNS:
+            file_path = self.get_file_path(code, date, tick, name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
@@ -0,0 +1,100 @@
+import os
+import pdb
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from config import config_manager as cfg_mgr
+
+
+class TickStore(object):
+    """(code, date) 별 초단위 현재가 array 를 memory-mapped .npy 파일로 저장하고,
+    여러 process 가 같은 파일을 mmap 으로 attach 하여 zero-copy 로 공유하게 해주는 저장소
+
+        {path}/{yyyymmdd}/{code}.price.npy  : 09:00:00 ~ 15:30:00 초단위 현재가 (float64)
+        {path}/{yyyymmdd}/{code}.tick.npy   : 1tick 체결이 발생한 시점의 09:00:00 으로부터 경과 초 (int32)
+
+        >>> store = TickStore()
+        >>> store.put(code, date, price_arr, tick_secs)
+        >>> price_arr, tick_secs = store.attach(code, date)
+    """
+
+    def __init__(self, path=None):
+        self.path = path if bool(path) else os.path.join(cfg_mgr.ROOT_PATH, "cache", "sec1")
+
+    @staticmethod
+    def get_base_time(date):
+        return datetime(date.year, date.month, date.day, 9, 0, 0)
+
+    def get_file_path(self, code, date, name):
+        return os.path.join(self.path, date.strftime("%Y%m%d"), "{}.{}.npy".format(code, name))
+
+    def has(self, code, date):
+        return os.path.exists(self.get_file_path(code, date, "price")) and \
+            os.path.exists(self.get_file_path(code, date, "tick"))
+
+    def put(self, code, date, price_arr, tick_secs):
+        """초단위 현재가 array 와 1tick 체결시점(경과 초) array 를 저장한다.
+        두 array 를 모두 임시파일에 쓴 후 tick, price 순서로 rename 하므로, has() 가 True 이면 두 파일 모두 완성된 상태이다.
+        (여러 process 가 동시에 저장하거나 저장 도중 종료되어도 깨진 파일을 attach 하지 않는다.)
+
+        :param code:
+        :param date:
+        :param price_arr:
+        :param tick_secs:
+        :return:
+        """
+        files = []
+        try:
+            for name, arr, dtype in [("tick", tick_secs, np.int32), ("price", price_arr, np.float64)]:
+                file_path = self.get_file_path(code, date, name)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                tmp_path = "{}.{}.tmp.npy".format(file_path[:-4], uuid.uuid4().hex)
+                files.append((tmp_path, file_path))
+                np.save(tmp_path, np.ascontiguousarray(arr, dtype=dtype))
+            for tmp_path, file_path in files:
+                os.replace(tmp_path, file_path)
+        finally:
+            for tmp_path, _ in files:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def attach(self, code, date):
+        """저장된 array 를 read-only memory-map 으로 연다. (복사 없음)
+
+        :param code:
+        :param date:
+        :return: (price_arr, tick_secs), 저장된 data 가 없으면 None
+        """
+        if not self.has(code, date):
+            return None
+        price_arr = np.load(self.get_file_path(code, date, "price"), mmap_mode='r')
+        tick_secs = np.load(self.get_file_path(code, date, "tick"), mmap_mode='r')
+        return price_arr, tick_secs
+
+    def discard(self, code, date):
+        """종목의 저장된 array 를 삭제한다. (원본 tick data 가 다시 저장된 경우)
+        price 를 먼저 지우므로 삭제 도중에도 has() 는 False 이다.
+
+        :param code:
+        :param date:
+        :return:
+        """
+        for name in ["price", "tick"]:
+            file_path = self.get_file_path(code, date, name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def remove(self, date):
+        """특정일의 저장된 array 를 모두 삭제한다.
+
+        :param date:
+        :return:
+        """
+        dir_path = os.path.join(self.path, date.strftime("%Y%m%d"))
+        if not os.path.isdir(dir_path):
+            return
+        for filename in os.listdir(dir_path):
+            os.remove(os.path.join(dir_path, filename))
+        os.rmdir(dir_path)
@@ -0,0 +1,24 @@
+from config import config_manager as cfg_mgr
+
+
+def get_kiwoom(tr_history_name=None):
+    """설정(config_manager.KIWOOM_*)에 따라 Kiwoom backend 를 생성한다.
+
+        - KIWOOM_REPLAY_PATH : 녹화 파일을 재생하는 ReplayKiwoom (Windows OCX 없이 동작)
+        - KIWOOM_RECORD_PATH : 실제 Kiwoom 의 TR 응답과 실시간 이벤트를 녹화
+        - 그 외 : 실제 Kiwoom
+
+    :param tr_history_name: TR 요청시각을 저장할 이름 (Kiwoom 참고), ReplayKiwoom 은 사용하지 않음
+    :return:
+    """
+    if bool(cfg_mgr.KIWOOM_REPLAY_PATH):
+        from kiwoom.replay import ReplayKiwoom
+        return ReplayKiwoom(cfg_mgr.KIWOOM_REPLAY_PATH, latency=cfg_mgr.KIWOOM_REPLAY_LATENCY)
+
+    # QAxContainer 는 Windows 에서만 import 할 수 있으므로 필요할 때 import 한다.
+    from kiwoom.kw import Kiwoom
+    kw = Kiwoom(tr_history_name)
+    if bool(cfg_mgr.KIWOOM_RECORD_PATH):
+        from kiwoom.replay import KiwoomRecorder
+        KiwoomRecorder(kw, cfg_mgr.KIWOOM_RECORD_PATH)
+    return kw
@@ -0,0 +1,123 @@
+import time
+from collections import defaultdict
+
+
+class ConditionState(object):
+    def __init__(self):
+        self.delivered = None  # 마지막으로 전달한 event_type ("I" / "D")
+        self.delivered_at = float("-inf")
+        self.pending = None  # window 안에서 받은 마지막 event
+        self.scheduled = False
+
+
+class ConditionCoalescer(object):
+    """OnReceiveRealCondition event 를 (code, condi_index) 별로 모아서, 상태가 바뀐 경우만 구독자에게 전달한다.
+
+        - 마지막으로 전달한 상태와 같은 event(I → I)는 버린다.
+        - 전달 후 window(sec) 안에 들어온 event 는 바로 전달하지 않고 마지막 event 만 기억했다가,
+          window 가 끝날 때 상태가 바뀌었으면 전달한다. (I → D → I 는 한번의 I 로 합쳐진다.)
+        - event 하나를 subscribe() 한 모든 구독자(전략)에게 전달한다. condi_index 를 주면 해당 조건식 event 만 받는다.
+
+        >>> coalescer = ConditionCoalescer(window=1.0, schedule=lambda sec, fn: QTimer.singleShot(int(sec * 1000), fn))
+        >>> kw.reg_callback("OnReceiveRealCondition", "", coalescer.on_event)
+        >>> coalescer.subscribe(self.search_condi)
+    """
+    WINDOW = 1.0  # sec
+
+    def __init__(self, window=None, schedule=None, clock=time.time):
+        """
+
+        :param window: event 를 합치는 구간(sec)
+        :param schedule: window 가 끝난 후 flush 를 예약하는 함수 fn(sec, callback),
+                         None 이면 같은 종목의 다음 event 나 flush() 호출시 전달한다.
+        :param clock: 현재시각(epoch sec)을 반환하는 함수
+        """
+        self.window = window if window is not None else self.WINDOW
+        self.schedule = schedule
+        self.clock = clock
+        self.states = defaultdict(ConditionState)  # (code, condi_index) -> ConditionState
+        self.subscribers = []  # [(fn, condi_index)]
+        self.stats = {
+            'received': 0,  # 받은 event 수
+            'delivered': 0,  # 구독자에게 전달한 event 수
+            'duplicated': 0,  # 이미 전달한 상태와 같아서 버린 event 수
+            'coalesced': 0  # window 안에서 합쳐진 event 수
+        }
+        self.condi_stats = defaultdict(lambda: {'received': 0, 'delivered': 0})
+
+    def subscribe(self, fn, condi_index=None):
+        """
+
+        :param fn: event 를 받을 함수 fn(event_data)
+        :param condi_index: 받을 조건식 index, None 이면 모든 조건식
+        :return:
+        """
+        if (fn, condi_index) not in self.subscribers:
+            self.subscribers.append((fn, condi_index))
+
+    def on_event(self, event_data):
+        """OnReceiveRealCondition callback
+
+        :param event_data: {"code": code, "event_type": "I" / "D", "condi_name": condi_name, "condi_index": condi_index}
+        :return:
+        """
+        self.stats['received'] += 1
+        self.condi_stats[event_data["condi_index"]]['received'] += 1
+        key = (event_data["code"], event_data["condi_index"])
+        state = self.states[key]
+        now = self.clock()
+        if self.schedule is None and state.pending is not None and now - state.delivered_at >= self.window:
+            self.flush_key(key)
+        if now - state.delivered_at >= self.window and state.pending is None:
+            if event_data["event_type"] == state.delivered:
+                self.stats['duplicated'] += 1
+                return
+            self.deliver(state, event_data, now)
+            return
+
+        # window 안의 event 는 마지막 것만 남긴다.
+        if state.pending is not None:
+            self.stats['coalesced'] += 1
+        state.pending = event_data
+        if self.schedule is not None and not state.scheduled:
+            state.scheduled = True
+            self.schedule(max(0.0, state.delivered_at + self.window - now), lambda: self.flush_key(key))
+
+    def deliver(self, state, event_data, now):
+        state.delivered = event_data["event_type"]
+        state.delivered_at = now
+        self.stats['delivered'] += 1
+        self.condi_stats[event_data["condi_index"]]['delivered'] += 1
+        for fn, condi_index in self.subscribers:
+            if condi_index is None or condi_index == event_data["condi_index"]:
+                fn(event_data)
+
+    def flush_key(self, key):
+        """window 가 끝난 종목의 마지막 event 를 전달한다. (상태가 그대로면 버린다)
+
+        :param key: (code, condi_index)
+        :return:
+        """
+        state = self.states[key]
+        state.scheduled = False
+        event_data, state.pending = state.pending, None
+        if event_data is None:
+            return
+        if event_data["event_type"] == state.delivered:
+            self.stats['coalesced'] += 1
+            return
+        self.deliver(state, event_data, self.clock())
+
+    def flush(self):
+        """window 가 끝난 모든 종목의 event 를 전달한다.
+
+        :return:
+        """
+        now = self.clock()
+        for key, state in list(self.states.items()):
+            if state.pending is not None and now - state.delivered_at >= self.window:
+                self.flush_key(key)
+
+    def get_stats(self):
+        return dict(self.stats, pending=sum(1 for state in self.states.values() if state.pending is not None),
+                    condi=dict(self.condi_stats))
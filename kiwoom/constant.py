@@ -45,6 +45,17 @@ class KiwoomServerCheckTimeError(Exception):
         return self.msg
 
 
+class KiwoomTrBusyError(Exception):
+    """
+    다른 TR 이 요청제한을 기다리거나 응답을 기다리는 중에 (Qt event 로) 중첩된 TR 을 요청한 경우
+    """
+    def __init__(self, msg):
+        self.msg = "[KiwoomTrBusyError] %s" % msg
+
+    def __str__(self):
+        return self.msg
+
+
 class MarketNameError(Exception):
     """Market 명(kospi, kosdaq)을 잘못 명시한 경우
 
@@ -60,6 +71,12 @@ class MarketNameError(Exception):
 KOSPI="0"
 KOSDAQ="10"
 
+# SetRealReg 화면번호 1개당 최대 등록 종목수
+MAX_REAL_REG_CODE_CNT = 100
+
+# 로그인 session 당 최대 화면번호 수
+MAX_SCREEN_CNT = 200
+
 class ReturnCode(object):
     """ 키움 OpenApi+ 함수들이 반환하는 값 """
     OP_ERR_NONE = 0  # 정상처리
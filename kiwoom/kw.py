@@ -13,12 +13,15 @@ import logging.config
 from pprint import pprint
 from kiwoom import custom_error
 from kiwoom.tr import TrManager
-from kiwoom.tr import TrController
+from kiwoom.real_decoder import RealDecoder
+from kiwoom.screen_pool import ScreenPool
+from kiwoom.tr_scheduler import SlidingWindowLimiter, TrScheduler
 from collections import deque
 import datetime as datetime_module
 from datetime import datetime
 from datetime import timedelta
 from dateutil.relativedelta import relativedelta
+from config import config_manager
 from kiwoom import constant
 from util import common
 from kiwoom.logger import KWlog
@@ -28,17 +31,31 @@ from singleton_decorator import singleton
 
 @singleton
 class Kiwoom(QAxWidget):
-    def __init__(self):
+    def __init__(self, tr_history_name=None):
+        """
+
+        :param tr_history_name: TR 요청시각을 저장할 이름(worker id, 계좌 등), 재시작한 process 가 같은 이름으로 이어서 요청한다.
+                                None 이면 저장하지 않는다. (process 마다 다른 login session 이므로 이름을 같이 쓰면 안됨)
+        """
         super().__init__()
         self.logger = KWlog().logger
         self.tr_mgr = TrManager(self)
         self.chejan = Chejan(self)
+        self.real_decoder = RealDecoder()
+        self.screen_pool = ScreenPool()
         self.evt_loop = QEventLoop()  # lock/release event loop
+        self.tr_inputs = []  # _comm_rq_data 에서 요청제한을 기다린 후 입력할 SetInputValue 값 [(id, value), ...]
+        self.tr_in_flight = False  # TR 응답을 기다리는 중
+        self.tr_rqname = None  # 응답을 기다리는 TR 의 rqname
         self.ret_data = None
         self.req_queue = deque(maxlen=10)
         self._create_kiwoom_instance()
         self._set_signal_slots()
-        self.tr_controller = TrController(self)
+        store_path = None
+        if bool(tr_history_name):
+            store_path = os.path.join(config_manager.ROOT_PATH, "cache", "tr_history_{}.json".format(tr_history_name))
+        limiter = SlidingWindowLimiter(store_path=store_path)
+        self.tr_controller = TrScheduler(limiter, sleep=self.wait, max_session_request=999, logger=self.logger)
         self.acc_no = ""
         self.event_callback_fn = {
             "OnEventConnect": {},
@@ -85,13 +102,10 @@ class Kiwoom(QAxWidget):
         :param real_type str: 실시간 타입(KOA의 실시간 목록 참조)
         :param real_data str: 실시간 데이터 전문
         """
-        self.logger.info("code: {}".format(code))
-        self.logger.info("real_type: {}".format(real_type))
-        self.logger.info("real_data: {}".format(real_data))
-
-        # callback
-        self.logger.info("[OnReceiveRealData] Notify Callback methods..")
-        self.notify_callback('OnReceiveRealData', real_data)
+        # tick 마다 호출되므로 INFO 로그를 남기지 않는다. (Qt event thread 지연 방지)
+        # callback (FID 별로 변환한 doc 을 전달한다.)
+        self.notify_callback('OnReceiveRealData',
+                             self.real_decoder.to_doc(code, real_type, real_data, datetime.now()))
 
 
         #
@@ -518,6 +532,7 @@ class Kiwoom(QAxWidget):
                                    screen_no, condi_name, condi_index, search_type)
             if ret == 0:
                 raise constant.KiwoomProcessingError("sendCondition(): 조건검색 요청 실패")
+            self.screen_pool.adopt(screen_no, condi_name)
             self.logger.debug("  ==================> [IMPORTANT] EVENT_LOOP -> LOCK")
             time.sleep(0.5)
             self.evt_loop.exec_()  # lock event
@@ -537,6 +552,7 @@ class Kiwoom(QAxWidget):
         self.logger.info("Stop to Real Condition(%s) Search !" % condi_name)
         self.dynamicCall("SendConditionStop(QString, QString, int)",
                          screen_no, condi_name, condi_index)
+        self.screen_pool.release(screen_no)
 
     def get_per_info(self, per_condi):
         """
@@ -707,15 +723,38 @@ class Kiwoom(QAxWidget):
             start_date = datetime(date.year, date.month, date.day, 9, 0, 0)
             end_date = datetime(date.year, date.month, date.day, 16, 0, 0)
 
-        while True:
-            curr_result = self.tr_mgr.opt10079('주식틱봉', code, tick, screen_no, start_date, end_date)
-            if not bool(curr_result):
-                break
-            self.ret_data += curr_result
-            end_date = self.ret_data[-1]['date'] - timedelta(seconds=int(tick))
-            time.sleep(0.2)  # delay
+        # opt10079 는 start_date 에 도달할 때까지 tr_next 로 이어서 받으므로 한번만 요청한다. (오류가 나면 [])
+        self.ret_data = self.tr_mgr.opt10079('주식틱봉', code, tick, screen_no, start_date, end_date)
         return self.ret_data
 
+    @avoid_server_check_time
+    @common.type_check
+    def iter_stock_price_by_tick(self, code: str, tick: str, screen_no: str, start_date: datetime = None, end_date: datetime = None, date: datetime = None):
+        """stock_price_by_tick 과 같은 data 를 tr 요청 page 단위로 넘겨주는 generator.
+        start_date 에 도달하면 다음 page 를 요청하지 않으며, 받은 page 는 바로 저장하고 버릴 수 있다.
+        TR 요청 오류는 그대로 raise 되므로, 끝까지 받았는지는 호출하는 쪽에서 확인해야 한다.
+
+        >>> for rows in kw.iter_stock_price_by_tick(code, "1", screen_no, date=base_date):
+        >>>     dbm.bulk_upsert(col, rows)
+
+        :param str code: 주식코드
+        :param str tick: Tick 단위(1, 3, 5, 10, 30)
+        :param str screen_no: 화면번호
+        :param datetime start_date: oldest date of user request
+        :param datetime end_date: newest date of user request
+        :param datetime date: specific date of user request
+        :return: [data, ...] page 단위, 최신순
+        """
+        if not((bool(start_date) and bool(end_date)) or bool(date)):
+            self.logger.error("call this function with (start_date, end_date) or (date) params")
+            exit(-1)
+
+        if bool(date):
+            start_date = datetime(date.year, date.month, date.day, 9, 0, 0)
+            end_date = datetime(date.year, date.month, date.day, 16, 0, 0)
+
+        return self.tr_mgr.iter_chart_pages("opt10079", '주식틱봉', code, tick, screen_no, start_date, end_date)
+
     @avoid_server_check_time
     @common.type_check
     def stock_price_by_min(self, code: str, tick: str, screen_no: str, start_date: datetime, end_date: datetime):
@@ -728,17 +767,25 @@ class Kiwoom(QAxWidget):
         :param datetime end_date: newest date of user request
         :return:
         """
-        self.ret_data = []
-        while True:
-            # self.logger.info("Do Transition opt10080")
-            curr_result = self.tr_mgr.opt10080('주식분봉', code, tick, screen_no, start_date, end_date)
-            if not bool(curr_result):
-                break
-            self.ret_data += curr_result
-            end_date = self.ret_data[-1]['date'] - timedelta(minutes=int(tick))
-            time.sleep(0.2)  # delay
+        # opt10080 은 최신 봉부터 start_date 에 도달할 때까지 tr_next 로 이어서 받으므로 한번만 요청한다.
+        # (다시 요청하면 최신 봉부터 같은 page 들을 처음부터 다시 받게 된다)
+        self.ret_data = self.tr_mgr.opt10080('주식분봉', code, tick, screen_no, start_date, end_date)
         return self.ret_data
 
+    @avoid_server_check_time
+    @common.type_check
+    def iter_stock_price_by_min(self, code: str, tick: str, screen_no: str, start_date: datetime, end_date: datetime):
+        """stock_price_by_min 과 같은 data 를 tr 요청 page 단위로 넘겨주는 generator. (iter_stock_price_by_tick 참고)
+
+        :param str code: 주식코드
+        :param str tick: 분단위(1, 3, 5, 10, 15, 30, 45, 60)
+        :param str screen_no: 화면번호
+        :param datetime start_date: oldest date of user request
+        :param datetime end_date: newest date of user request
+        :return: [data, ...] page 단위, 최신순
+        """
+        return self.tr_mgr.iter_chart_pages("opt10080", '주식분봉', code, tick, screen_no, start_date, end_date)
+
     @avoid_server_check_time
     @common.type_check
     def stock_price_by_day(self, code: str, screen_no: str, start_date: datetime, end_date: datetime):
@@ -758,7 +805,6 @@ class Kiwoom(QAxWidget):
                 break
             self.ret_data += curr_result
             end_date = self.ret_data[-1]['date'] - timedelta(days=1)
-            time.sleep(0.2)  # delay
         return self.ret_data
 
     @avoid_server_check_time
@@ -780,7 +826,6 @@ class Kiwoom(QAxWidget):
                 break
             self.ret_data += curr_result
             end_date = self.ret_data[-1]['date'] - timedelta(weeks=1)
-            time.sleep(0.2)  # delay
         return self.ret_data
 
     @avoid_server_check_time
@@ -802,7 +847,6 @@ class Kiwoom(QAxWidget):
                 break
             self.ret_data += curr_result
             end_date = self.ret_data[-1]['date'] - relativedelta(months=1)
-            time.sleep(0.2)  # delay
         return self.ret_data
 
 
@@ -822,7 +866,6 @@ class Kiwoom(QAxWidget):
 
         self.ret_data = []
         self.ret_data = self.tr_mgr.opt20002('업종별주가요청', market, code, screen_no)
-        time.sleep(0.2)  # delay
         return self.ret_data
 
     @avoid_server_check_time
@@ -836,7 +879,6 @@ class Kiwoom(QAxWidget):
         """
         self.ret_data = []
         self.ret_data = self.tr_mgr.opt20003('전업종지수요청', code, screen_no)
-        time.sleep(0.2)  # delay
         return self.ret_data
 
     # def job_categ_index_by_min(self):
@@ -974,6 +1016,8 @@ class Kiwoom(QAxWidget):
         """
         self.logger.info("dynamic Call - SetRealReg")
         ret = self.dynamicCall("SetRealReg(QString, QString, QString, QString)", screen_no, codes, fids, reg_type)
+        if ret == constant.ReturnCode.OP_ERR_NONE:
+            self.screen_pool.add_real(screen_no, codes.split(";"), reg_type)
         return ret
 
     def set_real_remove(self, screen_no, code):
@@ -984,6 +1028,36 @@ class Kiwoom(QAxWidget):
         :param code: str - 종목코드 또는 "ALL" 키워드 사용가능
         """
         self.dynamicCall("SetRealRemove(QString, QString)", screen_no, code)
+        self.screen_pool.remove_real(screen_no, code)
+
+    def reg_real(self, code_list, fids):
+        """종목 list 를 화면번호 pool 에서 빌린 화면번호로 나누어(화면번호당 MAX_REAL_REG_CODE_CNT 종목) 실시간 등록한다.
+        이미 등록된 종목은 다시 등록하지 않는다.
+
+        :param list code_list: 종목코드 list
+        :param str fids: fid 리스트(fid;fid;...)
+        :return: 등록한 화면번호 list
+        """
+        screens = []
+        for screen_no, codes, reg_type in self.screen_pool.pack(code_list):
+            ret = self.set_real_reg(screen_no, ";".join(codes), fids, reg_type)
+            if ret != constant.ReturnCode.OP_ERR_NONE:
+                self.logger.error("[reg_real] {} : {}".format(screen_no, constant.ReturnCode.CAUSE.get(ret, ret)))
+                if screen_no not in self.screen_pool.real_codes:
+                    self.screen_pool.release(screen_no)
+                continue
+            screens.append(screen_no)
+        return screens
+
+    def remove_real(self, code):
+        """reg_real 로 등록한 종목의 실시간 등록을 해제한다.
+
+        :param str code: 종목코드
+        :return:
+        """
+        screen_no = self.screen_pool.code_screen.get(code)
+        if screen_no is not None:
+            self.set_real_remove(screen_no, code)
 
     def set_account(self, acc_no):
         self.acc_no = acc_no
@@ -1025,7 +1099,8 @@ class Kiwoom(QAxWidget):
     def 매도취소(self, code, quantity):
         self.send_order("매도취소", "4013", self.acc_no, 4, code, quantity, 0, "00", "")
 
-    def send_order(self, rqname, screen_no, acc_no, order_type, code, quantity, price, hoga_gubun, orig_order_no):
+    def send_order(self, rqname, screen_no, acc_no, order_type, code, quantity, price, hoga_gubun, orig_order_no,
+                   expire_at=None):
         """
         매도/매수 주문 함수
         주문유형(order_type) (1:신규매수, 2:신규매도, 3:매수취소, 4:매도취소, 5:매수정정, 6:매도정정)
@@ -1043,9 +1118,12 @@ class Kiwoom(QAxWidget):
         :param price: int -
         :param hoga_gubun: str -
         :param orig_order_no: str -
-        :return:
+        :param expire_at: float - 주문 유효시각(epoch sec), 요청제한을 기다린 후 이 시각이 지났으면 주문하지 않는다.
+        :return: 주문하지 않은 경우 None
         """
-        self.tr_controller.prevent_excessive_request()
+        self.tr_controller.acquire(TrScheduler.PRIORITY_ORDER)
+        if expire_at is not None and time.time() > expire_at:
+            return None
         ret = self.dynamicCall("SendOrder(QString, QString, QString, int, QString, int, int, QString, QString)",
                                [rqname, screen_no, acc_no, order_type, code, quantity, price, hoga_gubun, orig_order_no])
         return ret
@@ -1127,11 +1205,24 @@ class Kiwoom(QAxWidget):
     def _set_input_value(self, id, value):
         """
         Tran 입력 값을 서버통신 전에 입력한다
+        요청제한을 기다리는 동안 처리된 event 의 다른 TR 이 입력값을 덮어쓰지 않도록,
+        값은 모아두었다가 _comm_rq_data 에서 요청 직전에 입력한다.
         :param id: string - 아이템 명
         :param value: string - 입력값
         :return: None
         """
-        self.dynamicCall("SetInputValue(QString, QString)", id, value)
+        self.tr_inputs.append((id, value))
+
+    def wait(self, sec):
+        """sec 동안 Qt event 를 처리하면서 기다린다. (TrScheduler 의 sleep 함수)
+        대량조회 요청이 기다리는 동안에도 timer, 실시간 event 에서 발생한 주문/계좌조회 요청이 먼저 처리될 수 있다.
+
+        :param sec:
+        :return:
+        """
+        loop = QEventLoop()
+        QTimer.singleShot(max(1, int(sec * 1000)), loop.quit)
+        loop.exec_()
 
     def _comm_rq_data(self, rqname, trcode, next, screen_no):
         """
@@ -1142,14 +1233,44 @@ class Kiwoom(QAxWidget):
         :param screen_no: string - 화면번호
         :return:
         """
-        self.tr_controller.prevent_excessive_request()
-        ret_code = self.dynamicCall("CommRqData(QString, QString, int, QString)", rqname, trcode, int(next), screen_no)
-        time.sleep(0.2)  # avoid over request
+        inputs, self.tr_inputs = self.tr_inputs, []
+        self.acquire_tr(self.tr_controller.get_priority(trcode))
+        for id, value in inputs:
+            self.dynamicCall("SetInputValue(QString, QString)", id, value)
+        return self.request_tr(rqname, lambda: self.dynamicCall("CommRqData(QString, QString, int, QString)",
+                                                                rqname, trcode, int(next), screen_no))
 
-        # when receive data, invoke self._on_receive_tr_data
-        self.logger.debug("  ==================> [IMPORTANT] EVENT_LOOP -> LOCK")
-        time.sleep(0.5)
-        self.evt_loop.exec_()
+    def acquire_tr(self, priority):
+        """TR 요청제한을 기다린다.
+
+        기다리는 동안 처리된 Qt event(timer 등)에서 다른 TR 이 실행될 수 있으므로, 연속조회 중인 결과(tr_ret_data)를
+        기다리기 전 상태로 되돌린다. 응답을 기다리는 중(tr_in_flight)에는 다른 TR 을 요청할 수 없다.
+
+        :param priority:
+        :return:
+        """
+        if self.tr_in_flight:
+            raise constant.KiwoomTrBusyError("waiting for the response of {}".format(self.tr_rqname))
+        ret_data, tr_next = self.tr_mgr.tr_ret_data, self.tr_mgr.tr_next
+        self.tr_controller.acquire(priority)
+        self.tr_mgr.tr_ret_data, self.tr_mgr.tr_next = ret_data, tr_next
+
+    def request_tr(self, rqname, request):
+        """TR 을 요청하고 응답(_on_receive_tr_data)이 올 때까지 기다린다.
+
+        :param rqname:
+        :param request: CommRqData/CommKwRqData 를 호출하는 함수
+        :return: request 의 return code
+        """
+        self.tr_in_flight, self.tr_rqname = True, rqname
+        try:
+            ret_code = request()
+
+            # when receive data, invoke self._on_receive_tr_data
+            self.logger.debug("  ==================> [IMPORTANT] EVENT_LOOP -> LOCK")
+            self.evt_loop.exec_()
+        finally:
+            self.tr_in_flight, self.tr_rqname = False, None
         return ret_code
 
     def _comm_kw_rq_data(self, rqname, code_list, screen_no, type_flag, next):
@@ -1163,12 +1284,10 @@ class Kiwoom(QAxWidget):
         :return:
         """
         code_cnt = len(code_list.strip(";").split(";"))
-        ret_code = self.dynamicCall("CommKwRqData(QString, int, int, int, QString, QString)",
-                                    code_list, next, code_cnt, type_flag, rqname, screen_no)
-        self.logger.debug("  ==================> [IMPORTANT] EVENT_LOOP -> LOCK")
-        time.sleep(0.5)
-        self.evt_loop.exec_()
-        return ret_code
+        self.acquire_tr(TrScheduler.PRIORITY_DEFAULT)
+        return self.request_tr(rqname, lambda: self.dynamicCall(
+            "CommKwRqData(QString, int, int, int, QString, QString)",
+            code_list, next, code_cnt, type_flag, rqname, screen_no))
 
     def _get_repeat_cnt(self, trcode, rqname):
         """
@@ -0,0 +1,191 @@
+import time
+from collections import deque
+
+from kiwoom.constant import KiwoomTrBusyError
+from util.tt_logger import TTlog
+
+
+class OrderIntent(object):
+    def __init__(self, rqname, screen_no, order_type, code, quantity, price, hoga_gubun, history=None):
+        self.rqname = rqname
+        self.screen_no = screen_no
+        self.order_type = order_type
+        self.code = code
+        self.quantity = quantity
+        self.price = price
+        self.hoga_gubun = hoga_gubun
+        self.history = history  # 주문 후 trading_history 에 저장할 doc
+        self.enqueued_at = time.time()
+
+    def __repr__(self):
+        return "OrderIntent({}, {}, {}주)".format(self.rqname, self.code, self.quantity)
+
+
+class OrderGateway(object):
+    """주문 요청(OrderIntent)을 queue 에 쌓아두고, dispatcher 가 Kiwoom.send_order 로 하나씩 보낸다.
+
+        OnReceiveRealCondition/OnReceiveRealData callback 은 buy()/sell() 로 queue 에 넣기만 하고 바로 return 하므로,
+        주문 요청제한(TrScheduler.PRIORITY_ORDER)을 기다리는 동안에도 다른 조건검색/체결 event 를 처리할 수 있다.
+        (Kiwoom.wait 가 Qt event 를 처리하면서 기다리는 동안 들어온 주문은 같은 dispatch 에서 이어서 보낸다.)
+        KOA(OCX) 는 Qt event thread 에서만 호출할 수 있으므로 dispatcher 도 schedule 로 event thread 에 예약한다.
+
+        - 매도 주문을 매수 주문보다 먼저 보낸다.
+        - 같은 종목의 매수 주문이 queue 에 있으면 중복 매수 주문은 버린다.
+        - 매수신호 후 max_delay(sec) 가 지난 매수 주문은 보내지 않고 버린다. (매수신호 → 주문 지연시간 상한)
+          queue 에서 기다린 시간과 주문 요청제한을 기다린 시간을 모두 포함하여, SendOrder 직전에 확인한다.
+        - 주문 이력(trading_history)은 writer(RealtimeWriter) 로 모아서 background thread 가 저장한다.
+
+        >>> gateway = OrderGateway(kw, writer, schedule=lambda fn: QTimer.singleShot(0, fn))
+        >>> gateway.buy(code, 20, history={'code': code, 'trade': 'buy', ...})
+    """
+    BUY_SCREEN_NO = "4001"  # Kiwoom.시장가_신규매수
+    SELL_SCREEN_NO = "4011"  # Kiwoom.시장가_신규매도
+    MAX_DELAY = 3.0  # sec
+
+    def __init__(self, kw, writer=None, schedule=None, max_delay=None, on_drop=None, logger=None):
+        """
+
+        :param kw: Kiwoom (send_order, acc_no)
+        :param writer: 주문 이력을 저장할 RealtimeWriter, None 이면 저장하지 않음
+        :param schedule: dispatch 함수를 event thread 에 예약하는 함수 fn(dispatch), None 이면 바로 dispatch 한다.
+        :param max_delay: 매수 주문의 최대 대기시간(sec)
+        :param on_drop: 매수 주문을 보내지 못하고 버린 경우(지연, 주문 실패) 호출되는 함수 fn(intent)
+        :param logger:
+        """
+        self.kw = kw
+        self.writer = writer
+        self.schedule = schedule
+        self.on_drop = on_drop
+        self.max_delay = max_delay if bool(max_delay) else self.MAX_DELAY
+        self.logger = logger if logger is not None else TTlog().logger
+        self.sell_queue = deque()
+        self.buy_queue = deque()
+        self.pending_buy = set()  # buy_queue 에 있는 종목코드
+        self.scheduled = False
+        self.dispatching = False
+        self.stats = {
+            'submitted': 0,  # queue 에 추가된 주문 수
+            'sent': 0,  # send_order 성공
+            'failed': 0,  # send_order 실패
+            'duplicated': 0,  # 같은 종목 매수 주문이 있어서 버린 수
+            'expired': 0,  # max_delay 가 지나서 버린 매수 주문 수
+            'max_depth': 0,  # 최대 queue 크기
+            'max_latency_ms': 0.0,  # queue 에 추가된 후 send_order 까지 최대 지연시간
+            'last_latency_ms': 0.0
+        }
+
+    def buy(self, code, quantity, history=None):
+        """시장가 신규매수 주문을 queue 에 넣는다.
+
+        :param code:
+        :param quantity:
+        :param history: trading_history doc
+        :return: 중복 주문이라 버린 경우 False
+        """
+        if code in self.pending_buy:
+            self.stats['duplicated'] += 1
+            return False
+        self.pending_buy.add(code)
+        self.buy_queue.append(OrderIntent("시장가_신규매수", self.BUY_SCREEN_NO, 1, code, quantity, 0, "03", history))
+        self.submitted()
+        return True
+
+    def sell(self, code, quantity, history=None):
+        """시장가 신규매도 주문을 queue 에 넣는다.
+
+        :param code:
+        :param quantity:
+        :param history: trading_history doc
+        :return:
+        """
+        self.sell_queue.append(OrderIntent("시장가_신규매도", self.SELL_SCREEN_NO, 2, code, quantity, 0, "03", history))
+        self.submitted()
+        return True
+
+    def submitted(self):
+        self.stats['submitted'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], len(self))
+        if self.schedule is None:
+            self.dispatch()
+        elif not self.scheduled:
+            self.scheduled = True
+            self.schedule(self.dispatch)
+
+    def push_front(self, intent):
+        if intent.order_type == 1:
+            self.pending_buy.add(intent.code)
+            self.buy_queue.appendleft(intent)
+        else:
+            self.sell_queue.appendleft(intent)
+
+    def __len__(self):
+        return len(self.sell_queue) + len(self.buy_queue)
+
+    def pop(self):
+        if bool(self.sell_queue):
+            return self.sell_queue.popleft()
+        intent = self.buy_queue.popleft()
+        self.pending_buy.discard(intent.code)
+        return intent
+
+    def dispatch(self):
+        """queue 가 빌 때까지 주문을 보낸다.
+
+        send_order 가 요청제한으로 기다리는 동안 Qt event 가 처리되어 dispatch 가 다시 호출될 수 있으므로,
+        이미 dispatch 중이면 바로 return 하고 바깥 dispatch 가 이어서 보낸다.
+
+        :return:
+        """
+        self.scheduled = False
+        if self.dispatching:
+            return
+        self.dispatching = True
+        try:
+            while bool(self):
+                if not self.send(self.pop()):
+                    break
+        finally:
+            self.dispatching = False
+
+    def send(self, intent):
+        """
+
+        :param intent:
+        :return: 다른 TR 을 기다리는 중이라 보내지 못한 경우 False (queue 에 되돌려 놓고 다시 예약한다)
+        """
+        expire_at = intent.enqueued_at + self.max_delay if intent.order_type == 1 else None
+        try:
+            ret = self.kw.send_order(intent.rqname, intent.screen_no, self.kw.acc_no, intent.order_type, intent.code,
+                                     intent.quantity, intent.price, intent.hoga_gubun, "", expire_at=expire_at)
+        except KiwoomTrBusyError as e:
+            self.logger.info("[OrderGateway] {} : {}".format(intent, e))
+            self.push_front(intent)
+            if self.schedule is not None and not self.scheduled:
+                self.scheduled = True
+                self.schedule(self.dispatch)
+            return False
+
+        latency_ms = round((time.time() - intent.enqueued_at) * 1000, 2)
+        if ret is None:
+            self.stats['expired'] += 1
+            self.logger.info("[OrderGateway] {} 주문 지연({}ms)으로 매수하지 않습니다.".format(intent, latency_ms))
+            self.dropped(intent)
+            return True
+        self.stats['last_latency_ms'] = latency_ms
+        self.stats['max_latency_ms'] = max(self.stats['max_latency_ms'], latency_ms)
+        if ret != 0:
+            self.stats['failed'] += 1
+            self.logger.error("[OrderGateway] {} 주문 실패 : {}".format(intent, ret))
+            self.dropped(intent)
+            return True
+        self.stats['sent'] += 1
+        if self.writer is not None and intent.history is not None:
+            self.writer.put(intent.history)
+        return True
+
+    def dropped(self, intent):
+        if intent.order_type == 1 and self.on_drop is not None:
+            self.on_drop(intent)
+
+    def get_stats(self):
+        return dict(self.stats, depth=len(self))
@@ -0,0 +1,160 @@
+from datetime import datetime
+
+from kiwoom.constant import RealType
+
+# 부호(+/-)가 상승/하락 표시일 뿐인 가격 필드 (절대값 사용)
+ABS_FIELDS = {"현재가", "시가", "고가", "저가", "기준가", "상한가", "하한가", "예상체결가", "체결가", "단위체결가", "주문가격",
+              "(최우선)매도호가", "(최우선)매수호가"} | \
+             {"{}호가{}".format(t, i) for t in ["매도", "매수"] for i in range(1, 11)}
+
+# HHMMSS 형태의 체결/호가 시각 필드 (수신일자와 합쳐서 datetime 으로 변환)
+TIME_FIELDS = {"체결시간", "호가시간", "주문/체결시간"}
+
+# 숫자처럼 보여도 문자열로 보관해야 하는 필드
+STR_SUFFIXES = ("번호", "코드", "명", "구분", "상태", "Text", "일", "시간", "정보", "단위", "Extra")
+STR_FIELDS = {"종목코드,업종코드", "신용구분(실시간", "대출일(실시간"} | \
+             {"{}거래원{}".format(t, i) for t in ["매도", "매수"] for i in range(1, 6)}
+
+
+def to_abs(v):
+    v = v.strip()
+    if not bool(v):
+        return 0
+    try:
+        return abs(int(v))
+    except ValueError:
+        return abs(float(v))
+
+
+def to_float(v):
+    v = v.strip()
+    return float(v) if bool(v) else 0.0
+
+
+def to_number(v):
+    v = v.strip()
+    if not bool(v):
+        return 0
+    try:
+        return int(v)
+    except ValueError:
+        try:
+            return float(v)
+        except ValueError:
+            return v
+
+
+def to_str(v):
+    return v.strip()
+
+
+def get_converter(field):
+    """필드명으로부터 변환함수를 선택한다.
+
+    :param field:
+    :return:
+    """
+    if field in TIME_FIELDS:
+        return None  # decode 에서 수신일자와 합쳐서 변환
+    if field in ABS_FIELDS:
+        return to_abs
+    if field in STR_FIELDS or field.endswith(STR_SUFFIXES):
+        return to_str
+    if "율" in field or "률" in field or "강도" in field or "비율" in field:
+        return to_float
+    return to_number
+
+
+class RealDecoder(object):
+    """OnReceiveRealData 의 real_data(tab 으로 구분된 문자열)를 real_type 별 typed tuple 로 변환한다.
+
+        RealType.REALTYPE 의 FID 순서대로 필드별 변환함수를 미리 만들어두고(compile),
+        이벤트마다 split 후 변환함수만 적용한다.
+        같은 real_type 에 필드명이 같은 FID 가 있으면 두번째부터 '필드명_FID' 로 구분한다.
+        (ex. 주식호가잔량의 FID 23, 291 예상체결가 -> '예상체결가', '예상체결가_291')
+
+        >>> decoder = RealDecoder()
+        >>> decoder.get_fields("주식체결")
+        ('체결시간', '현재가', '전일대비', ...)
+        >>> decoder.decode("주식체결", real_data, received)
+        (datetime(2018, 8, 2, 9, 0, 1), 10500, 150, 1.45, ...)
+    """
+
+    def __init__(self, realtype=None):
+        """
+
+        :param realtype: {real_type: {fid: 필드명, ...}, ...} (None 이면 RealType.REALTYPE)
+        """
+        realtype = realtype if bool(realtype) else RealType.REALTYPE
+        self.fields = {}  # real_type -> (필드명, ...)
+        self.converters = {}  # real_type -> (변환함수, ...)
+        self.time_index = {}  # real_type -> 시각 필드 위치 (없으면 None)
+        for real_type, fid_table in realtype.items():
+            fields = self.make_fields(fid_table)
+            self.fields[real_type] = fields
+            self.converters[real_type] = tuple(get_converter(fid_table[fid]) for fid in fid_table)
+            self.time_index[real_type] = next((i for i, f in enumerate(fields) if f in TIME_FIELDS), None)
+
+    @staticmethod
+    def make_fields(fid_table):
+        """FID 순서의 필드명 tuple, 중복된 필드명은 FID 를 붙여서 구분한다.
+
+        :param fid_table: {fid: 필드명, ...}
+        :return:
+        """
+        fields = []
+        for fid, field in fid_table.items():
+            fields.append(field if field not in fields else "{}_{}".format(field, fid))
+        return tuple(fields)
+
+    def get_fields(self, real_type):
+        return self.fields.get(real_type)
+
+    @staticmethod
+    def to_datetime(v, received):
+        """HHMMSS 를 수신일자의 datetime 으로 변환한다.
+
+        :param v:
+        :param received:
+        :return:
+        """
+        v = v.strip()
+        if len(v) != 6 or not v.isdigit():
+            return received
+        return datetime(received.year, received.month, received.day, int(v[0:2]), int(v[2:4]), int(v[4:6]))
+
+    def decode(self, real_type, real_data, received):
+        """
+
+        :param real_type:
+        :param real_data: 실시간 데이터 전문
+        :param received: 수신시각
+        :return: get_fields(real_type) 순서의 tuple, 정의되지 않은 real_type 이면 None
+        """
+        converters = self.converters.get(real_type)
+        if converters is None:
+            return None
+        values = real_data.split("\t")
+        return tuple(conv(v) if conv is not None else self.to_datetime(v, received)
+                     for conv, v in zip(converters, values))
+
+    def to_doc(self, code, real_type, real_data, received):
+        """DB 에 저장할 doc 으로 변환한다.
+        timestamp 는 체결/호가 시각이 있으면 그 시각, 없으면 수신시각이다.
+
+        :param code:
+        :param real_type:
+        :param real_data:
+        :param received:
+        :return: {'code', 'real_type', 'timestamp', 필드명: 값, ...}
+        """
+        doc = {'code': code, 'real_type': real_type, 'timestamp': received}
+        values = self.decode(real_type, real_data, received)
+        if values is None:
+            doc['real_data'] = real_data
+            return doc
+        doc.update(zip(self.fields[real_type], values))
+        time_index = self.time_index[real_type]
+        if time_index is not None and time_index < len(values):
+            doc['timestamp'] = values[time_index]
+        return doc
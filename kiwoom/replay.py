@@ -0,0 +1,415 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from functools import wraps
+
+from kiwoom.logger import KWlog
+from kiwoom.screen_pool import ScreenPool
+from kiwoom.tr_scheduler import SlidingWindowLimiter, TrScheduler
+from singleton_decorator import singleton
+
+# 녹화/재생 대상 Kiwoom public method (서버에 요청하여 결과를 받는 함수)
+RECORD_METHODS = [
+    "get_connect_state", "get_server_gubun", "get_login_info", "get_stock_basic_info", "get_master_stock_name",
+    "get_theme_group_list", "get_theme_group_code_list", "get_code_list_by_market", "get_branch_code_name",
+    "get_condition_load", "get_condition_name_list", "get_stock_infos", "send_condition",
+    "get_per_info", "get_basic_info", "get_chegyul_info", "get_hoga_info",
+    "rapidly_rising_price_stock", "rapidly_swing_price_stock_detail", "rapidly_rising_vol_stock",
+    "stock_price_by_tick", "stock_price_by_min", "stock_price_by_day", "stock_price_by_week", "stock_price_by_month",
+    "job_categ_price", "job_categ_index",
+    "계좌수익률요청", "당일실현손익상세요청", "계좌평가현황요청", "계좌평가잔고내역요청",
+    "get_master_listed_stock_cnt", "get_master_construction", "get_master_listed_stock_date",
+    "get_master_last_price", "get_master_stock_state", "send_order",
+]
+
+# 녹화/재생 대상 Kiwoom generator method (page 단위로 받는 함수, 모든 page 를 list 로 녹화)
+RECORD_ITER_METHODS = ["iter_stock_price_by_tick", "iter_stock_price_by_min"]
+
+# 녹화/재생 대상 실시간 이벤트
+REAL_EVENTS = ["OnReceiveRealData", "OnReceiveRealCondition", "OnReceiveChejanData"]
+
+TR_FILE = "tr.jsonl"
+EVENT_FILE = "events.jsonl"
+
+
+def encode(obj):
+    """json 으로 저장할 수 없는 값(datetime, tuple, set)을 변환한다.
+
+    :param obj:
+    :return:
+    """
+    if isinstance(obj, datetime):
+        return {'__datetime__': obj.isoformat()}
+    if isinstance(obj, (tuple, set)):
+        return list(obj)
+    if hasattr(obj, 'item'):  # numpy scalar
+        return obj.item()
+    raise TypeError("{} is not JSON serializable".format(type(obj)))
+
+
+def decode(obj):
+    if '__datetime__' in obj:
+        return datetime.strptime(obj['__datetime__'].replace('T', ' '), "%Y-%m-%d %H:%M:%S" +
+                                 (".%f" if '.' in obj['__datetime__'] else ""))
+    return obj
+
+
+def make_key(method, args, kwargs):
+    """호출 인자로부터 녹화된 응답을 찾기 위한 key 를 만든다.
+
+    :param method:
+    :param args:
+    :param kwargs:
+    :return:
+    """
+    return json.dumps([method, list(args), kwargs], default=encode, ensure_ascii=False, sort_keys=True)
+
+
+class KiwoomRecorder(object):
+    """실제 Kiwoom 의 TR 응답과 실시간 이벤트를 파일로 녹화한다. (ReplayKiwoom 으로 재생)
+
+        {path}/tr.jsonl     : {"method", "args", "kwargs", "ret", "tr_cnt", "elapsed"}
+        {path}/events.jsonl : {"time", "event", "key", "data"}
+
+        >>> kw = KiwoomRecorder(Kiwoom(), "D:/work/replay/20180802").kw
+    """
+
+    def __init__(self, kw, path):
+        """
+
+        :param kw: Kiwoom
+        :param path: 녹화 파일을 저장할 directory
+        """
+        self.kw = kw
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.tr_file = open(os.path.join(path, TR_FILE), "a", encoding="utf-8")
+        self.event_file = open(os.path.join(path, EVENT_FILE), "a", encoding="utf-8")
+
+        for method in RECORD_METHODS:
+            setattr(kw, method, self.wrap(method, getattr(kw, method)))
+        for method in RECORD_ITER_METHODS:
+            setattr(kw, method, self.wrap_iter(method, getattr(kw, method)))
+        for event in REAL_EVENTS:
+            kw.reg_callback(event, "", self.gen_event_recorder(event))
+
+    def write(self, f, doc):
+        with self.lock:
+            f.write(json.dumps(doc, default=encode, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def wrap(self, method, fn):
+        """Kiwoom method 의 호출 인자와 결과, 실제 TR 요청횟수, 응답시간을 기록하는 함수로 감싼다.
+
+        :param method:
+        :param fn:
+        :return:
+        """
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            tr_cnt = self.kw.tr_controller.req_cnt
+            start = time.time()
+            ret = fn(*args, **kwargs)
+            self.write(self.tr_file, {
+                'method': method, 'args': list(args), 'kwargs': kwargs, 'ret': ret,
+                'tr_cnt': self.kw.tr_controller.req_cnt - tr_cnt,
+                'elapsed': round(time.time() - start, 3)
+            })
+            return ret
+        return wrapper
+
+    def wrap_iter(self, method, fn):
+        """page 를 넘겨주는 generator method 를 감싼다. 끝까지 받은 경우에만 page list 를 기록한다.
+
+        :param method:
+        :param fn:
+        :return:
+        """
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            tr_cnt = self.kw.tr_controller.req_cnt
+            start = time.time()
+            pages = []
+            for page in fn(*args, **kwargs):
+                pages.append(page)
+                yield page
+            self.write(self.tr_file, {
+                'method': method, 'args': list(args), 'kwargs': kwargs, 'ret': pages,
+                'tr_cnt': self.kw.tr_controller.req_cnt - tr_cnt,
+                'elapsed': round(time.time() - start, 3)
+            })
+        return wrapper
+
+    def gen_event_recorder(self, event):
+        def record(data):
+            self.write(self.event_file, {'time': time.time(), 'event': event, 'key': None, 'data': data})
+        return record
+
+    def close(self):
+        self.tr_file.close()
+        self.event_file.close()
+
+
+@singleton
+class ReplayKiwoom(object):
+    """KiwoomRecorder 로 녹화한 파일을 재생하는 Kiwoom 대체 backend (QAxWidget/Windows OCX 불필요)
+
+        Kiwoom 과 같은 public API 를 제공하므로 collector, TrScheduler, 자동매매 loop 를
+        증권사 서버없이 Linux 에서 end-to-end 로 benchmark 할 수 있다.
+
+        - TR 응답 : 같은 인자로 녹화된 응답을 녹화된 순서대로 반환한다. (마지막 응답은 반복)
+        - 요청제한 : 녹화 당시의 TR 요청횟수만큼 TrScheduler.acquire() 를 호출하여 실제 요청제한을 재현한다.
+        - 지연시간 : latency(sec) 를 주면 TR 요청마다 기다린다.
+        - 실시간 : play_events() 로 녹화된 실시간 이벤트를 녹화 당시의 간격(speed 배속)으로 callback 에 전달한다.
+
+        >>> kw = ReplayKiwoom("D:/work/replay/20180802", latency=0.05)
+        >>> kw.stock_price_by_min("005930", "1", "1000", start_date, end_date)
+        >>> kw.play_events(speed=10)
+    """
+
+    def __init__(self, path, latency=0.0, limiter=None, sleep=time.sleep):
+        """
+
+        :param path: 녹화 파일이 있는 directory
+        :param latency: TR 요청 1회당 지연시간(sec)
+        :param limiter: SlidingWindowLimiter (None 이면 요청제한 없음)
+        :param sleep: sec 만큼 기다리는 함수
+        """
+        self.logger = KWlog().logger
+        self.path = path
+        self.latency = latency
+        self.sleep = sleep
+        if limiter is None:
+            limiter = SlidingWindowLimiter(limits=[(1, 0)], margin=0)
+        self.tr_controller = TrScheduler(limiter, sleep=sleep, logger=self.logger)
+        self.acc_no = ""
+        self.real_reg = defaultdict(set)  # screen_no -> {code, ...}
+        self.screen_pool = ScreenPool()
+        self.orders = []  # send_order 로 요청된 주문
+        self.event_callback_fn = {
+            "OnEventConnect": {},
+            "OnReceiveTrData": {},
+            "OnReceiveRealData": [],
+            "OnReceiveRealCondition": [],
+            "OnReceiveTrCondition": {},
+            "OnReceiveConditionVer": {},
+            "OnReceiveChejanData": [],
+            "OnReceiveMsg": {},
+        }
+        self.responses = defaultdict(deque)  # key -> deque([(ret, tr_cnt), ...])
+        self.events = []
+        self.load()
+
+    def load(self):
+        """녹화 파일을 읽는다.
+
+        :return:
+        """
+        tr_path = os.path.join(self.path, TR_FILE)
+        if os.path.exists(tr_path):
+            with open(tr_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    doc = json.loads(line, object_hook=decode)
+                    key = make_key(doc['method'], doc['args'], doc['kwargs'])
+                    self.responses[key].append((doc['ret'], doc.get('tr_cnt', 1)))
+
+        event_path = os.path.join(self.path, EVENT_FILE)
+        if os.path.exists(event_path):
+            with open(event_path, encoding="utf-8") as f:
+                self.events = [json.loads(line, object_hook=decode) for line in f if line.strip()]
+            self.events.sort(key=lambda x: x['time'])
+        self.logger.info("[ReplayKiwoom] {} responses, {} events loaded from {}".format(
+            sum(len(q) for q in self.responses.values()), len(self.events), self.path))
+
+    def replay(self, method, args, kwargs, priority=None):
+        """녹화된 응답을 요청제한과 지연시간을 적용하여 반환한다.
+
+        :param method:
+        :param args:
+        :param kwargs:
+        :param priority: TrScheduler 우선순위
+        :return: 녹화된 응답이 없으면 None
+        """
+        queue = self.responses.get(make_key(method, args, kwargs))
+        if not bool(queue):
+            self.logger.warning("[ReplayKiwoom] No recorded response: {}{}".format(method, tuple(args)))
+            return None
+        ret, tr_cnt = queue.popleft() if len(queue) > 1 else queue[0]
+        for _ in range(tr_cnt):
+            self.tr_controller.acquire(priority)
+            if self.latency > 0:
+                self.sleep(self.latency)
+        return ret
+
+    def __getattr__(self, name):
+        # 별도 구현이 없는 녹화 대상 method 는 녹화된 응답을 그대로 반환한다.
+        if name not in RECORD_METHODS:
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            return self.replay(name, args, kwargs)
+        return method
+
+    # public kiwoom api
+    def login(self):
+        return 0
+
+    def set_account(self, acc_no):
+        self.acc_no = acc_no
+
+    def stock_price_by_tick(self, *args, **kwargs):
+        return self.replay("stock_price_by_tick", args, kwargs, TrScheduler.PRIORITY_BULK) or []
+
+    def stock_price_by_min(self, *args, **kwargs):
+        return self.replay("stock_price_by_min", args, kwargs, TrScheduler.PRIORITY_BULK) or []
+
+    def iter_stock_price_by_tick(self, *args, **kwargs):
+        yield from self.replay_pages("iter_stock_price_by_tick", "stock_price_by_tick", args, kwargs)
+
+    def iter_stock_price_by_min(self, *args, **kwargs):
+        yield from self.replay_pages("iter_stock_price_by_min", "stock_price_by_min", args, kwargs)
+
+    def replay_pages(self, method, list_method, args, kwargs):
+        """녹화된 page 들을 재생한다. page 단위 녹화가 없으면 list_method 의 녹화를 한 page 로 넘긴다.
+
+        :param method: iter_* method
+        :param list_method: 같은 data 를 list 로 반환하는 method
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        if bool(self.responses.get(make_key(method, args, kwargs))):
+            pages = self.replay(method, args, kwargs, TrScheduler.PRIORITY_BULK)
+        else:
+            ret = self.replay(list_method, args, kwargs, TrScheduler.PRIORITY_BULK)
+            pages = [ret] if bool(ret) else []
+        for page in pages:
+            yield page
+
+    def stock_price_by_day(self, *args, **kwargs):
+        return self.replay("stock_price_by_day", args, kwargs, TrScheduler.PRIORITY_BULK) or []
+
+    def send_condition(self, screen_no, condi_name, condi_index, search_type):
+        self.screen_pool.adopt(screen_no, condi_name)
+        return self.replay("send_condition", (screen_no, condi_name, condi_index, search_type), {}) or []
+
+    def send_condition_stop(self, screen_no, condi_name, condi_index):
+        self.logger.info("Stop to Real Condition(%s) Search !" % condi_name)
+        self.screen_pool.release(screen_no)
+
+    def set_real_reg(self, screen_no, codes, fids, reg_type):
+        if str(reg_type) == "0":
+            self.real_reg[screen_no].clear()
+        self.real_reg[screen_no].update(code for code in codes.split(";") if bool(code))
+        self.screen_pool.add_real(screen_no, codes.split(";"), reg_type)
+        return 0
+
+    def set_real_remove(self, screen_no, code):
+        screens = list(self.real_reg.keys()) if screen_no == "ALL" else [screen_no]
+        for screen in screens:
+            if code == "ALL":
+                self.real_reg[screen].clear()
+            else:
+                self.real_reg[screen].discard(code)
+        self.screen_pool.remove_real(screen_no, code)
+
+    def reg_real(self, code_list, fids):
+        return [screen_no for screen_no, codes, reg_type in self.screen_pool.pack(code_list)
+                if self.set_real_reg(screen_no, ";".join(codes), fids, reg_type) == 0]
+
+    def remove_real(self, code):
+        screen_no = self.screen_pool.code_screen.get(code)
+        if screen_no is not None:
+            self.set_real_remove(screen_no, code)
+
+    def send_order(self, rqname, screen_no, acc_no, order_type, code, quantity, price, hoga_gubun, orig_order_no,
+                   expire_at=None):
+        """주문은 서버로 보내지 않고 기록만 한다. (체결은 녹화된 OnReceiveChejanData 이벤트로 재생)
+
+        :return: 0 (성공), expire_at 이 지나서 주문하지 않은 경우 None
+        """
+        self.tr_controller.acquire(TrScheduler.PRIORITY_ORDER)
+        if expire_at is not None and time.time() > expire_at:
+            return None
+        if self.latency > 0:
+            self.sleep(self.latency)
+        self.orders.append({
+            'time': datetime.now(), 'rqname': rqname, 'screen_no': screen_no, 'acc_no': acc_no,
+            'order_type': order_type, 'code': code, 'quantity': quantity, 'price': price,
+            'hoga_gubun': hoga_gubun, 'orig_order_no': orig_order_no
+        })
+        return 0
+
+    def 시장가_신규매수(self, code, quantity):
+        self.send_order("시장가_신규매수", "4001", self.acc_no, 1, code, quantity, 0, "03", "")
+
+    def 지정가_신규매수(self, code, quantity, price):
+        self.send_order("지정가_신규매수", "4002", self.acc_no, 1, code, quantity, price, "00", "")
+
+    def 매수취소(self, code, quantity):
+        self.send_order("매수취소", "4003", self.acc_no, 3, code, quantity, 0, "00", "")
+
+    def 시장가_신규매도(self, code, quantity):
+        self.send_order("시장가_신규매도", "4011", self.acc_no, 2, code, quantity, 0, "03", "")
+
+    def 지정가_신규매도(self, code, quantity, price):
+        self.send_order("지정가_신규매도", "4012", self.acc_no, 2, code, quantity, price, "00", "")
+
+    def 매도취소(self, code, quantity):
+        self.send_order("매도취소", "4013", self.acc_no, 4, code, quantity, 0, "00", "")
+
+    def play_events(self, speed=1.0, limit=None):
+        """녹화된 실시간 이벤트를 등록된 callback 에 전달한다.
+
+        :param speed: 재생 배속 (None 또는 0 이면 기다리지 않고 최대한 빠르게 전달)
+        :param limit: 최대 이벤트 수 (None 이면 모두)
+        :return: 전달한 이벤트 수
+        """
+        events = self.events if limit is None else self.events[:limit]
+        start_time, start_clock = None, time.time()
+        for evt in events:
+            if bool(speed):
+                start_time = evt['time'] if start_time is None else start_time
+                wait = (evt['time'] - start_time) / speed - (time.time() - start_clock)
+                if wait > 0:
+                    self.sleep(wait)
+            self.notify_callback(evt['event'], evt['data'], evt.get('key'))
+        return len(events)
+
+    def reg_callback(self, event, key, fn):
+        """특정 이벤트 발생시 호출한 callback 함수를 등록한다.
+
+        :param event:
+        :param key: 일반적으로 screen_no 를 사용하면 된다.
+        :param fn:
+        :return:
+        """
+        if event in ["OnReceiveTrCondition", "OnReceiveTrData"]:
+            self.event_callback_fn[event][key] = fn
+        else:  # OnReceiveRealCondition, OnReceiveChejanData, OnReceiveRealData
+            if fn not in self.event_callback_fn[event]:
+                self.event_callback_fn[event].append(fn)
+
+    def notify_callback(self, event, data, key=None):
+        """특정 이벤트로 등록한 callback 함수를 호출한다.
+
+        :param event:
+        :param data:
+        :param key: 일반적으로 screen_no 를 사용하면 된다.
+        :return:
+        """
+        if event in ["OnReceiveTrCondition", "OnReceiveTrData"]:
+            if key in self.event_callback_fn[event]:
+                self.event_callback_fn[event][key](data)
+        else:  # OnReceiveRealCondition, OnReceiveChejanData, OnReceiveRealData
+            for fn in self.event_callback_fn[event]:
+                fn(data)
+
+    def get_curr_price(self, code):
+        return 10000
@@ -0,0 +1,140 @@
+from collections import deque
+
+from kiwoom import constant
+
+
+class ScreenPool(object):
+    """Kiwoom 화면번호 pool
+
+        같은 화면번호로 다시 요청하면 진행중인 요청/실시간 등록이 취소되므로, 동시에 쓰는 화면번호는 겹치지 않게 빌려준다.
+
+        - lease/release : TR, 조건검색 등 화면번호 1개를 혼자 쓰는 경우
+        - pack : 실시간 등록(SetRealReg) 종목을 화면번호당 MAX_REAL_REG_CODE_CNT 종목까지 채워서 나눈다.
+        - add_real/remove_real : SetRealReg/SetRealRemove 결과를 기록하고, 종목이 모두 해제된 화면번호는 pool 로 돌려준다.
+
+        >>> pool = ScreenPool()
+        >>> for screen_no, codes, reg_type in pool.pack(code_list):
+        >>>     kw.set_real_reg(screen_no, ";".join(codes), fids, reg_type)
+    """
+    FIRST_SCREEN_NO = 2000  # pool 이 사용하는 화면번호 : 2000 ~ 2000 + MAX_SCREEN_CNT - 1 (고정 화면번호와 겹치지 않는 구간)
+
+    def __init__(self, first=FIRST_SCREEN_NO, cnt=constant.MAX_SCREEN_CNT, max_codes=constant.MAX_REAL_REG_CODE_CNT):
+        """
+
+        :param first: 첫 화면번호
+        :param cnt: 화면번호 수
+        :param max_codes: 화면번호당 최대 실시간 등록 종목수
+        """
+        self.screens = {str(n) for n in range(first, first + cnt)}
+        self.free = deque(sorted(self.screens))
+        self.max_codes = max_codes
+        self.leased = {}  # screen_no -> owner
+        self.real_codes = {}  # screen_no -> {code, ...} 실시간 등록 종목
+        self.code_screen = {}  # code -> screen_no
+
+    def lease(self, owner=""):
+        """사용하지 않는 화면번호를 빌린다.
+
+        :param owner: 사용처 (log/get_stats 용)
+        :return: 화면번호
+        """
+        if not bool(self.free):
+            raise constant.KiwoomProcessingError("화면번호가 부족합니다. (사용중 {}개)".format(len(self.leased)))
+        screen_no = self.free.popleft()
+        self.leased[screen_no] = owner
+        return screen_no
+
+    def adopt(self, screen_no, owner=""):
+        """pool 밖에서 정한 화면번호를 사용중으로 기록한다. (pool 구간의 번호면 빌려주지 않음)
+
+        :param screen_no:
+        :param owner:
+        :return:
+        """
+        screen_no = str(screen_no)
+        if screen_no in self.leased:
+            return
+        if screen_no in self.free:
+            self.free.remove(screen_no)
+        self.leased[screen_no] = owner
+
+    def release(self, screen_no):
+        """화면번호를 돌려준다. 등록된 실시간 종목 기록도 지운다.
+
+        :param screen_no:
+        :return:
+        """
+        screen_no = str(screen_no)
+        for code in self.real_codes.pop(screen_no, set()):
+            if self.code_screen.get(code) == screen_no:
+                del self.code_screen[code]
+        if self.leased.pop(screen_no, None) is not None and screen_no in self.screens:
+            self.free.append(screen_no)
+
+    def pack(self, codes):
+        """실시간 등록할 종목을 화면번호별로 나눈다. 이미 등록된 종목은 제외하고,
+        빈 자리가 있는 실시간 화면번호부터 채운 후 새 화면번호를 빌린다.
+
+        :param codes: [code, ...]
+        :return: [(화면번호, [code, ...], 실시간등록타입), ...] 새 화면번호면 "0", 추가 등록이면 "1"
+        """
+        codes = [c for c in dict.fromkeys(codes) if c not in self.code_screen]
+        ret = []
+        for screen_no, reg_codes in self.real_codes.items():
+            if not bool(codes):
+                break
+            n = self.max_codes - len(reg_codes)
+            if n > 0:
+                ret.append((screen_no, codes[:n], "1"))
+                codes = codes[n:]
+        for i in range(0, len(codes), self.max_codes):
+            ret.append((self.lease("real"), codes[i:i + self.max_codes], "0"))
+        return ret
+
+    def add_real(self, screen_no, codes, reg_type):
+        """SetRealReg 로 등록한 종목을 기록한다.
+
+        :param screen_no:
+        :param codes: [code, ...]
+        :param reg_type: "0" 이면 화면번호의 기존 등록을 대체한다.
+        :return:
+        """
+        screen_no = str(screen_no)
+        self.adopt(screen_no, self.leased.get(screen_no, "real"))
+        if str(reg_type) == "0":
+            for code in self.real_codes.pop(screen_no, set()):
+                if self.code_screen.get(code) == screen_no:
+                    del self.code_screen[code]
+        reg_codes = self.real_codes.setdefault(screen_no, set())
+        for code in codes:
+            if bool(code):
+                reg_codes.add(code)
+                self.code_screen[code] = screen_no
+
+    def remove_real(self, screen_no, code):
+        """SetRealRemove 로 해제한 종목을 지우고, 종목이 남지 않은 화면번호는 돌려준다.
+
+        :param screen_no: 화면번호 또는 "ALL"
+        :param code: 종목코드 또는 "ALL"
+        :return:
+        """
+        screens = list(self.real_codes.keys()) if screen_no == "ALL" else [str(screen_no)]
+        for screen in screens:
+            reg_codes = self.real_codes.get(screen)
+            if reg_codes is None:
+                continue
+            if code == "ALL":
+                reg_codes = set()
+            elif code in reg_codes:
+                reg_codes.discard(code)
+                del self.code_screen[code]
+            if not bool(reg_codes):
+                self.release(screen)
+
+    def get_stats(self):
+        return {
+            'free': len(self.free),
+            'leased': len(self.leased),
+            'real_screens': len(self.real_codes),
+            'real_codes': len(self.code_screen)
+        }
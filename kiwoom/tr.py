@@ -122,6 +122,10 @@ class TrManager():
         @wraps(f)
         def wrapper(*args, **kwargs):
             self = args[0]
+            if self.kw.tr_in_flight:
+                # 응답을 기다리는 TR 의 결과를 지우지 않도록 중첩된 TR 은 거절한다.
+                raise constant.KiwoomTrBusyError("waiting for the response of {}".format(self.kw.tr_rqname))
+            self.kw.tr_inputs = []
             self.tr_ret_data = []
             ret = f(*args, **kwargs)
             return ret
@@ -141,6 +145,10 @@ class TrManager():
         """
         self.logger.info("(!)[Callback] _on_receive_tr_data")
         self.logger.info("trcode : {}".format(trcode))
+        if self.kw.tr_in_flight and rqname != self.kw.tr_rqname:
+            # 조회 응답을 기다리는 중에 받은 주문(SendOrder) 응답 등은 조회결과/event loop 를 건드리지 않는다.
+            self.logger.info("[OnReceiveTrData] {} is not the pending request({})".format(rqname, self.kw.tr_rqname))
+            return
         try:
             # dispatch async kiwoom transaction
             post_fn_name = "post_{}".format(trcode.lower())
@@ -152,7 +160,6 @@ class TrManager():
         except Exception as e:
             self.logger.error(e)
         self.logger.info("  ========================> [IMPORTANT] EVENT_LOOP -> RELEASE")
-        time.sleep(0.5)
         self.kw.evt_loop.exit()  # release event loop
 
         # callback
@@ -316,7 +323,41 @@ class TrManager():
             d[8] = abs(int(d[8]))
             self.tr_ret_data.append(dict(zip(f, d)))
 
-    @init_tr_ret_data
+    def iter_chart_pages(self, trcode, rqname, code, tick, screen_no, begin_date, end_date):
+        """틱봉/분봉 차트 TR(opt10079, opt10080)을 page(tr 요청 1회) 단위로 요청하여 하나씩 넘겨주는 generator.
+        data 는 최신순으로 오므로, page 의 가장 오래된 data 가 begin_date 에 도달하면 다음 page 를 요청하지 않는다.
+        page 마다 tr_ret_data 를 비우므로 전체 구간을 memory 에 쌓지 않는다.
+        (generator 를 끝까지 소비하기 전에 다른 TR 을 요청하면 안된다.)
+
+        :param trcode: opt10079 또는 opt10080
+        :param rqname: str - 요청명
+        :param code: str - 주식코드
+        :param tick: str - 틱/분 단위
+        :param screen_no: str - 화면번호
+        :param begin_date: datetime - oldest date of user request
+        :param end_date: datetime - newest date of user request
+        :return: [begin_date <= date <= end_date 인 data, ...] page 단위, 최신순
+        """
+        next = 0
+        while True:
+            self.tr_ret_data = []
+            self.kw.code = code
+            self.kw._set_input_values([("종목코드", code), ("틱범위", tick), ("수정주가구분", "0")])
+            ret_code = self.kw._comm_rq_data(rqname, trcode, next, screen_no)  # lock event loop
+            if ReturnCode.OP_ERR_NONE != ret_code:
+                raise Exception("[KiWoom Error][{}] {}".format(trcode, ReturnCode.CAUSE[ret_code]))
+
+            # data(self.tr_ret_data) is set when post_tr_function
+            page = self.tr_ret_data
+            if not bool(page):
+                return
+            rows = [d for d in page if begin_date <= d['date'] <= end_date]
+            if bool(rows):
+                yield rows
+            if self.tr_next != '2' or page[-1]['date'] <= begin_date:
+                return
+            next = 2
+
     def opt10079(self, rqname, code, tick, screen_no, begin_date, end_date):
         """
         특정 주식종목의 틱봉 데이터를 요청하는 함수.
@@ -328,24 +369,11 @@ class TrManager():
         :param end_date: datetime - newest date of user request
         :return:
         """
-        def tr_process(rqname, code, tick, screen_no, next):
-            self.kw.code = code
-            self.kw._set_input_values([("종목코드", code), ("틱범위", tick), ("수정주가구분", "0")])
-            ret_code = self.kw._comm_rq_data(rqname, "opt10079", next, screen_no)  # lock event loop
-            if ReturnCode.OP_ERR_NONE != ret_code:
-                raise Exception("[KiWoom Error][opt10079] %s" % ReturnCode.CAUSE[ret_code])
+        ret = []
         try:
-            tr_process(rqname, code, tick, screen_no, 0)
-            if self.tr_next == '0':
-                return [d for d in self.tr_ret_data if begin_date <= d['date'] <= end_date]
-
-            if bool(begin_date) and begin_date >= self.tr_ret_data[-1]['date']:
-                return [d for d in self.tr_ret_data if begin_date <= d['date'] <= end_date]
-
-            while self.tr_next == '2' and begin_date < self.tr_ret_data[-1]['date']:
-                tr_process(rqname, code, tick, screen_no, 2)
-
-            return [d for d in self.tr_ret_data if begin_date <= d['date'] <= end_date]
+            for rows in self.iter_chart_pages("opt10079", rqname, code, tick, screen_no, begin_date, end_date):
+                ret += rows
+            return ret
         except Exception as e:
             self.logger.error(e)
 
@@ -368,7 +396,6 @@ class TrManager():
             self.tr_ret_data.append(stock_data)
         self.tr_next = next
 
-    @init_tr_ret_data
     def opt10080(self, rqname, code, tick, screen_no, begin_date, end_date):
         """
         특정 주식종목의 분봉 데이터를 요청하는 함수.
@@ -380,25 +407,11 @@ class TrManager():
         :param end_date: datetime - newest date of user request
         :return:
         """
-        def tr_process(rqname, code, tick, screen_no, next):
-            self.kw.code = code
-            self.kw._set_input_values([("종목코드", code), ("틱범위", tick), ("수정주가구분", "0")])
-            ret_code = self.kw._comm_rq_data(rqname, "opt10080", next, screen_no)  # lock event loop
-            if ReturnCode.OP_ERR_NONE != ret_code:
-                raise Exception("[KiWoom Error][opt10080] %s" % ReturnCode.CAUSE[ret_code])
+        ret = []
         try:
-            tr_process(rqname, code, tick, screen_no, 0)
-            # data(self.tr_ret_data) is set when post_tr_function
-            if self.tr_next == '0':
-                return [d for d in self.tr_ret_data if begin_date <= d['date'] <= end_date]
-
-            if bool(begin_date) and begin_date >= self.tr_ret_data[-1]['date']:
-                return [d for d in self.tr_ret_data if begin_date <= d['date'] <= end_date]
-
-            while self.tr_next == '2' and begin_date < self.tr_ret_data[-1]['date']:
-                tr_process(rqname, code, tick, screen_no, 2)
-
-            return [d for d in self.tr_ret_data if begin_date <= d['date'] <= end_date]
+            for rows in self.iter_chart_pages("opt10080", rqname, code, tick, screen_no, begin_date, end_date):
+                ret += rows
+            return ret
         except Exception as e:
             self.logger.error(e)
 
@@ -1047,42 +1060,3 @@ class TrManager():
         self.logger.info("kosdaq stock sell order is completed. (rqname: {})".format(rqname))
         self.tr_ret_data = []
 
-
-class TrController(object):
-    LATEST = -1
-    REQ_CNT = 0
-
-    def __init__(self, kw):
-        self.kw = kw
-        self.logger = self.kw.logger
-        self.queue_size = 1000
-        self.queue = deque(maxlen=self.queue_size)
-        self.now = datetime.now()
-        # count, time(sec), delay(sec)
-        self.req_limit_setting = [
-            (5, 2, 1),
-            (100, 70, 20),
-            (200, 150, 20),
-            (700, 600, 30)
-        ]
-        self.queue += [self.now] * self.queue_size
-
-    def prevent_excessive_request(self):
-        self.REQ_CNT += 1
-        self.queue.append(datetime.now())
-        if self.REQ_CNT >= 999:
-            print("=" * 50)
-            print(" ---- 1000번 요청했음 ---- 프로그램 종료합니다. ")
-            print("=" * 50)
-            exit(0)
-
-        tmp = 0
-        print("Req Count: %s" % self.REQ_CNT)
-        for cnt, dur_cfg, delay in self.req_limit_setting:
-            if self.REQ_CNT < cnt:
-                continue
-            spend = (self.queue[self.LATEST] - self.queue[-cnt]).seconds
-            if (tmp+spend) < dur_cfg:
-                print("[Delay] %s sec" % delay)
-                time.sleep(delay)
-                tmp += spend
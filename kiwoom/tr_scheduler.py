@@ -0,0 +1,241 @@
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from kiwoom.constant import KiwoomTrBusyError
+from util import constant
+
+
+class SlidingWindowLimiter(object):
+    """Kiwoom TR 요청 제한을 정확한 sliding window 로 계산한다.
+
+        (5회/2초), (100회/70초), (200회/150초), (700회/600초)
+        최근 cnt 번째 요청시각 + 구간(sec) 이 지나야 다음 요청이 가능하므로,
+        모든 구간에 대해 그 시각의 최대값까지만 기다리면 된다.
+
+        store_path 를 주면 요청시각을 파일에 저장하고 시작할때 다시 읽어온다.
+        process 가 재시작되어도 직전 process 의 요청을 고려하여 가장 빠른 안전한 속도로 이어서 요청한다.
+    """
+    KIWOOM_LIMITS = [(5, 2), (100, 70), (200, 150), (700, 600)]  # (요청횟수, 구간(sec))
+
+    def __init__(self, limits=None, margin=0.05, clock=time.time, store_path=None):
+        """
+
+        :param limits: [(요청횟수, 구간(sec)), ...]
+        :param margin: 서버와의 시간오차를 고려한 여유시간(sec)
+        :param clock: 현재시각(epoch sec)을 반환하는 함수
+        :param store_path: 요청시각을 저장할 파일 경로 (None 이면 저장하지 않음)
+        """
+        self.limits = limits if bool(limits) else self.KIWOOM_LIMITS
+        self.margin = margin
+        self.clock = clock
+        self.store_path = store_path
+        self.history = deque(maxlen=max(cnt for cnt, _ in self.limits))
+        self.load()
+
+    def load(self):
+        """저장된 요청시각 중 가장 긴 구간 안에 있는 것만 읽어온다.
+
+        :return:
+        """
+        if not bool(self.store_path) or not os.path.exists(self.store_path):
+            return
+        try:
+            with open(self.store_path) as f:
+                history = json.load(f)
+        except (ValueError, OSError):
+            # 저장 도중 종료되어 깨진 파일은 무시한다.
+            return
+        oldest = self.clock() - max(duration for _, duration in self.limits) - self.margin
+        self.history.extend(sorted(t for t in history if t >= oldest))
+
+    def save(self):
+        """요청시각을 파일에 저장한다. 임시파일에 쓴 후 rename 하므로 파일이 깨지지 않는다.
+
+        :return:
+        """
+        if not bool(self.store_path):
+            return
+        dir_path = os.path.dirname(self.store_path)
+        if bool(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(self.store_path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(list(self.history), f)
+        os.replace(tmp_path, self.store_path)
+
+    def get_wait_time(self, now=None):
+        """다음 요청을 보내기 위해 기다려야 하는 최소 시간(sec)을 반환한다.
+
+        :param now:
+        :return:
+        """
+        now = self.clock() if now is None else now
+        wait = 0.0
+        for cnt, duration in self.limits:
+            if len(self.history) >= cnt:
+                wait = max(wait, self.history[-cnt] + duration + self.margin - now)
+        return wait
+
+    def record(self, now=None):
+        """요청을 보낸 시각을 기록한다.
+
+        :param now:
+        :return:
+        """
+        self.history.append(self.clock() if now is None else now)
+        self.save()
+
+
+class TrScheduler(object):
+    """TR 요청을 우선순위 순서로, 요청 제한(SlidingWindowLimiter)을 넘지 않는 가장 빠른 시점에 보낸다.
+
+        - acquire() : TR 을 보내기 직전에 호출, 보낼 수 있을때까지 최소 시간만 기다린다.
+                      기다리는 요청이 여럿이면 우선순위(숫자가 작을수록 먼저)가 높은 요청이 먼저 보낸다.
+        - submit()/run_pending() : TR 작업을 큐에 넣어두고 우선순위 순서로 실행한다.
+
+        sleep 함수를 Qt event 를 처리하는 함수로 주면, 대량조회가 기다리는 동안 주문/계좌조회가 먼저 처리된다.
+        clock, sleep 을 가짜 함수로 주면 실제 Kiwoom 없이 시험할 수 있다.
+    """
+    PRIORITY_ORDER = 0  # 주문
+    PRIORITY_ACCOUNT = 1  # 계좌/잔고 조회
+    PRIORITY_DEFAULT = 5
+    PRIORITY_BULK = 9  # 틱/분/일/주/월봉 등 대량 과거 데이터 조회
+
+    ACCOUNT_TRCODES = {"opt10075", "opt10077", "opt10085"}
+    BULK_TRCODES = {"opt10079", "opt10080", "opt10081", "opt10082", "opt10083", "opt10094"}
+
+    POLL_INTERVAL = 0.01  # 우선순위가 높은 요청을 기다릴때 확인 주기(sec)
+
+    def __init__(self, limiter=None, sleep=time.sleep, max_session_request=None, logger=None):
+        """
+
+        :param limiter: SlidingWindowLimiter (None 이면 Kiwoom 기본 제한)
+        :param sleep: sec 만큼 기다리는 함수
+        :param max_session_request: 한 process 에서 보낼 수 있는 최대 요청수 (None 이면 제한없음)
+        :param logger:
+        """
+        self.limiter = limiter if limiter is not None else SlidingWindowLimiter()
+        self.sleep = sleep
+        self.max_session_request = max_session_request
+        self.logger = logger
+        self.req_cnt = 0
+        self.seq = itertools.count()
+        self.waiting = []  # heap [(priority, seq, thread_id), ...]
+        self.jobs = []  # heap [(priority, seq, fn, args, kwargs, callback), ...]
+        self.job_priority = None  # run_pending 으로 실행중인 작업의 우선순위
+        self.lock = threading.RLock()
+
+    def get_priority(self, trcode):
+        """trcode 의 우선순위를 반환한다.
+        run_pending 으로 실행중인 작업 안에서 요청한 TR 은 작업의 우선순위를 따른다.
+
+        :param trcode:
+        :return:
+        """
+        if self.job_priority is not None:
+            return self.job_priority
+        trcode = trcode.lower()
+        if trcode.startswith("opw") or trcode in self.ACCOUNT_TRCODES:
+            return self.PRIORITY_ACCOUNT
+        if trcode in self.BULK_TRCODES:
+            return self.PRIORITY_BULK
+        return self.PRIORITY_DEFAULT
+
+    def is_my_turn(self, ticket):
+        """ticket 보다 우선순위가 높은 요청이 기다리고 있지 않은지 확인한다. (thread 와 관계없이 우선순위 순서)
+
+        :param ticket:
+        :return:
+        """
+        with self.lock:
+            return not any(other < ticket for other in self.waiting)
+
+    def acquire(self, priority=None):
+        """TR 요청을 보낼 수 있을 때까지 기다린 후, 요청시각을 기록한다.
+
+        :param priority: None 이면 PRIORITY_DEFAULT
+        :return: 기다린 시간(sec)
+        """
+        priority = self.PRIORITY_DEFAULT if priority is None else priority
+        ticket = (priority, next(self.seq), threading.get_ident())
+        with self.lock:
+            # 같은 thread 에서 우선순위가 같거나 높은 요청이 기다리는 중이면(sleep 중 처리된 event 에서 중첩 호출),
+            # 그 요청은 이 요청이 끝나야 진행할 수 있으므로 기다리지 않고 거절한다.
+            if any(other[2] == ticket[2] and other < ticket for other in self.waiting):
+                raise KiwoomTrBusyError("priority {} request while another request is waiting".format(priority))
+            heapq.heappush(self.waiting, ticket)
+
+        waited = 0.0
+        try:
+            while True:
+                with self.lock:
+                    wait = self.limiter.get_wait_time()
+                    if wait <= 0 and self.is_my_turn(ticket):
+                        self.check_session_request()
+                        self.limiter.record()
+                        self.req_cnt += 1
+                        break
+                wait = wait if wait > 0 else self.POLL_INTERVAL
+                self.sleep(wait)
+                waited += wait
+        finally:
+            with self.lock:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+
+        if self.logger is not None and waited > 0:
+            self.logger.debug("[TrScheduler] Req Count: {}, Delay: {:.2f} sec".format(self.req_cnt, waited))
+        return waited
+
+    def check_session_request(self):
+        """한 process 에서 보낼 수 있는 최대 요청수에 도달하면 process 를 종료한다.
+        (collector 는 종료 후 다시 시작되어 이어서 수집한다. 정상 종료(0)와 구분하도록 별도 exit code 를 쓴다.)
+
+        :return:
+        """
+        if self.max_session_request is None or self.req_cnt < self.max_session_request:
+            return
+        if self.logger is not None:
+            self.logger.info("[TrScheduler] {} requests in this session. exit.".format(self.req_cnt))
+        sys.exit(constant.EXIT_SESSION_REQUEST_LIMIT)
+
+    def submit(self, fn, *args, priority=None, callback=None, **kwargs):
+        """TR 작업을 큐에 넣는다. run_pending() 에서 우선순위 순서로 실행된다.
+
+        :param fn: TR 을 요청하는 함수 (ex. kw.stock_price_by_min)
+        :param priority: None 이면 PRIORITY_DEFAULT
+        :param callback: fn 의 결과를 받을 함수
+        :return:
+        """
+        priority = self.PRIORITY_DEFAULT if priority is None else priority
+        with self.lock:
+            heapq.heappush(self.jobs, (priority, next(self.seq), fn, args, kwargs, callback))
+
+    def run_pending(self, max_jobs=None):
+        """큐에 있는 TR 작업을 우선순위 순서로 실행한다.
+        실행 도중 submit 된 작업도 우선순위에 따라 바로 실행된다.
+
+        :param max_jobs: 최대 실행 작업수 (None 이면 큐가 빌 때까지)
+        :return: 실행한 작업수
+        """
+        cnt = 0
+        while max_jobs is None or cnt < max_jobs:
+            with self.lock:
+                if not self.jobs:
+                    break
+                priority, _, fn, args, kwargs, callback = heapq.heappop(self.jobs)
+            prev_priority, self.job_priority = self.job_priority, priority
+            try:
+                ret = fn(*args, **kwargs)
+            finally:
+                self.job_priority = prev_priority
+            if callback is not None:
+                callback(ret)
+            cnt += 1
+        return cnt
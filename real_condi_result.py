@@ -18,9 +18,9 @@ from pymongo import MongoClient
 from config import config_manager as cfg_mgr
 from database.db_manager import DBM
 # Kiwoom module
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from trading.condi import ConditionalSearch
-from trading.strategy import Strategy
+from trading.vector_strategy import VectorStrategy
 from util import common, constant
 from util.slack import Slack
 from util.tt_logger import TTlog
@@ -56,7 +56,7 @@ class TopTrader(QMainWindow, ui):
         self.slack = Slack(cfg_mgr.get_slack_token())
 
         # Kiwoom
-        self.kw = Kiwoom()
+        self.kw = get_kiwoom()
         self.login()
         cfg_mgr.STOCK_INFO = self.kw.get_stock_basic_info()
 
@@ -129,7 +129,7 @@ class TopTrader(QMainWindow, ui):
             condi = ConditionalSearch.get_instance(condi_index, condi_name)
 
             self.logger.info("=======[ Smulation(%s) Start! ]=======" % condi.condi_name)
-            strg = Strategy("short_trading.strategy", condi)
+            strg = VectorStrategy("short_trading.strategy", condi)
             strg.simulate(self.target_date)
             strg_list.append(strg)
             self.logger.info("=======[ Smulation(%s) End! ]=======" % condi.condi_name)
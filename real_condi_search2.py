@@ -14,14 +14,13 @@ import time
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
-from PyQt5.QAxContainer import *
 from PyQt5 import uic
 from PyQt5 import QtGui
 from PyQt5.QtCore import pyqtSlot
 
 from slacker import Slacker
 
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from kiwoom import constant
 from config import config_manager
 from util.tt_logger import TTlog
@@ -48,7 +47,7 @@ class TopTrader(QMainWindow, ui):
         self.mongo = MongoClient()
         self.tt_db = self.mongo.TopTrader
         self.slack = Slack(config_manager.get_slack_token())
-        self.kw = Kiwoom()
+        self.kw = get_kiwoom()
         self.login()
 
         # ready to search condi
@@ -64,7 +63,7 @@ class TopTrader(QMainWindow, ui):
         # self.screen_no = 4000
         # self.N1, self.N2 = 0, 10
 
-        self.screen_no = 4001
+        # self.screen_no = 4001
         self.N1, self.N2 = 10, 20
 
         self.real_condi_search()
@@ -125,10 +124,11 @@ class TopTrader(QMainWindow, ui):
         self.logger.info("실시간 조건 검색 시작합니다.")
         for condi_name, condi_id in list(condi_info.items())[self.N1:self.N2]:
             # 화면번호, 조건식이름, 조건식ID, 실시간조건검색(1)
+            screen_no = self.kw.screen_pool.lease(condi_name)
             self.logger.info("화면번호: {}, 조건식명: {}, 조건식ID: {}".format(
-                self.screen_no, condi_name, condi_id
+                screen_no, condi_name, condi_id
             ))
-            self.kw.send_condition(str(self.screen_no), condi_name, int(condi_id), 1)
+            self.kw.send_condition(screen_no, condi_name, int(condi_id), 1)
             time.sleep(0.5)
 
     def login(self):
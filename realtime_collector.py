@@ -4,24 +4,26 @@ import pdb
 import os
 import pandas as pd
 import time
+from datetime import datetime
 
 # UI(PyQt5) module
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
-from PyQt5.QAxContainer import *
 from PyQt5 import uic
 from PyQt5 import QtGui
 from PyQt5.QtCore import pyqtSlot
 
 from slacker import Slacker
 
-from kiwoom.kw import Kiwoom
+from kiwoom.backend import get_kiwoom
 from kiwoom import constant
 from config import config_manager
 from util.tt_logger import TTlog
 
 from database.db_manager import DBM
+from database.realtime_writer import RealtimeWriter
+from database.bar_builder import BarBuilder
 from pymongo import MongoClient
 import pymongo
 import random
@@ -37,8 +39,17 @@ class TopTrader(QMainWindow, ui):
         super().__init__()
         # self.setupUi(self)  # load app screen
         self.logger = TTlog().logger
-        self.db = MongoClient().TopTrader
-        self.kw = Kiwoom()
+        self.dbm = DBM('TopTrader')
+        self.writer = RealtimeWriter(self.dbm.db.realtime_stream, logger=self.logger)
+        self.writer.start()
+        # 실시간 체결로 초/분봉을 만들어 time_series_sec1, time_series_min* 에 저장한다.
+        self.bar_writers = {unit: RealtimeWriter(self.dbm.col_table[unit], logger=self.logger,
+                                                 upsert_keys=('code', 'date'))
+                            for unit in BarBuilder.UNITS}
+        for writer in self.bar_writers.values():
+            writer.start()
+        self.bar_builder = BarBuilder(self.bar_writers)
+        self.kw = get_kiwoom()
         self.login()
         self.realtime_stream()
         self.timer = None
@@ -65,18 +76,33 @@ class TopTrader(QMainWindow, ui):
         self.logger.info("")
         self.logger.info("="* 100)
         self.logger.info("Timer Call !")
+        self.logger.info("RealtimeWriter: {}".format(self.writer.get_stats()))
+        self.bar_builder.close_due_bars(datetime.now())
+        self.logger.info("BarBuilder: {} ticks, {} late".format(self.bar_builder.ticks, self.bar_builder.late))
         self.logger.info("=" * 100)
 
+    def closeEvent(self, event):
+        # buffer 에 남은 data 를 모두 저장한 후 종료한다.
+        self.kw.set_real_remove("ALL", "ALL")
+        self.bar_builder.close_bars(datetime.max)
+        for writer in [self.writer] + list(self.bar_writers.values()):
+            writer.stop()
+        super().closeEvent(event)
+
     def realtime_stream_callback(self, data):
-        self.logger.info("[realtime_stream_callback]")
-        self.logger.info("data: {}".format(data))
-        self.db.realtime_stream.insert({'real_data': data})
+        # data : RealDecoder 로 FID 별 변환된 doc {'code', 'real_type', 'timestamp', 필드명: 값, ...}
+        # Qt event thread 에서 호출되므로 buffer 에 넣기만 하고, 저장은 RealtimeWriter thread 가 한다.
+        self.writer.put(data)
 
     def realtime_stream(self):
-        code_list = "066570;000030;000270;000660;005930;068270;045390;064350;011390;025560"
-        screen_no = "6001"
+        code_list = ["066570", "000030", "000270", "000660", "005930", "068270", "045390", "064350", "011390", "025560"]
+        fids = "10;11;12;13;14;16;17;27;28;"
         self.kw.reg_callback("OnReceiveRealData", "", self.realtime_stream_callback)
-        self.kw.set_real_reg(screen_no, code_list, "10;11;12;13;14;16;17;27;28;", 0)
+        self.kw.reg_callback("OnReceiveRealData", "", self.bar_builder.on_real_data)
+
+        # 화면번호 pool 에서 화면번호당 최대 100종목씩 나누어 등록한다.
+        screens = self.kw.reg_real(code_list, fids)
+        self.logger.info("real reg : {} codes, screens {}".format(len(code_list), screens))
 
 
 # Print Exception Setting
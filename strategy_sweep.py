@@ -0,0 +1,58 @@
+# built-in module
+import pdb
+import sys
+from datetime import datetime
+from datetime import timedelta
+
+# My modules
+from config import config_manager as cfg_mgr
+from database.db_manager import DBM
+from trading.sweep import StrategySweep
+from util import constant
+from util.trading_calendar import TradingCalendar
+from util.tt_logger import TTlog
+
+
+def main():
+    # 목표 !!!
+    # 기간내 모든 조건검색식에 대해 전략 parameter 조합별 성과를 분석한다. (Kiwoom 로그인 불필요)
+    logger = TTlog(logger_name="TTSweep").logger
+    dbm = DBM('TopTrader')
+    cfg_mgr.MODE = constant.RELEASE
+
+    # 사용자 지정 변수__S
+    strategy_cfg = "short_trading.strategy"
+    s_date = datetime(2018, 8, 1)
+    e_date = datetime(2018, 8, 31)
+    grid = {
+        'sell_at_rising': [
+            [[1.5, 50], [2.0, 100]],
+            [[2.0, 50], [3.0, 100]],
+            [[3.0, 100]]
+        ],
+        'sell_at_falling': [
+            [[-2.0, 50], [-3.0, 100]],
+            [[-1.5, 100]]
+        ],
+        'max_holding_period': [300, 600, 1200],
+        'max_buy_price_per_stock': [200000],
+        'trading_time': [
+            [["09:00:00", "09:30:00"], ["12:30:00", "12:50:00"]],
+            [["09:00:00", "10:00:00"]]
+        ]
+    }
+    # 사용자 지정 변수__E
+
+    date_list = TradingCalendar().trading_days(s_date, e_date)
+    condi_info = dbm.get_condi_info(s_date, e_date + timedelta(days=1))
+
+    sweep_id = "{}_{}_{}".format(strategy_cfg.replace(".strategy", ""),
+                                 s_date.strftime("%Y%m%d"), e_date.strftime("%Y%m%d"))
+    result = StrategySweep(strategy_cfg, grid, condi_info, date_list).run(sweep_id)
+    for doc in result[:10]:
+        logger.info("[{}] {} {} 총누적손익: {:.0f}, 승률: {}".format(doc['rank'], doc['condi_name'], doc['params'],
+                                                                  doc['총누적손익'], doc['승률']))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import time
+
+from kiwoom.constant import KiwoomTrBusyError
+from kiwoom.real_decoder import to_abs, to_str
+from trading.position_book import to_code
+
+
+class AccountSnapshot(object):
+    """계좌평가현황(opw00004) 결과를 메모리에 가지고 있는 계좌정보 service
+
+        - 읽기(peek, get)는 메모리의 snapshot 을 돌려주고, updated_at 으로 얼마나 최신인지 알 수 있다.
+        - OnReceiveChejanData 잔고통보(gubun=1)의 보유수량, 매입단가, 예수금을 snapshot 에 바로 반영한다.
+        - get() 은 snapshot 이 ttl(sec) 보다 오래되었거나, 체결 후 아직 TR 로 확인하지 않은 경우에만 TR 을 요청한다.
+        - 매수주문은 reserve() 로 주문금액을 잡아두고, D+2추정예수금에 아직 반영되지 않은 금액만큼 available() 에서 뺀다.
+          체결된 금액은 체결 후에 조회한 TR 결과에 반영될 때까지 잡아둔다. (schedule 을 주면 체결 후 바로 다시 조회)
+          (주문/체결 후 예수금이 줄기 전에 들어온 매수신호들이 같은 예수금을 보고 매수하지 않도록 한다.)
+
+        매매/화면 등 계좌정보가 필요한 곳은 이 객체 하나를 같이 쓰므로, 각자 TR 을 요청하거나
+        서로 다른 시점의 계좌정보(예수금)를 보는 일이 없다.
+
+        >>> account = AccountSnapshot(kw, acc_no, ttl=30, schedule=lambda sec, fn: QTimer.singleShot(int(sec * 1000), fn))
+        >>> kw.reg_callback("OnReceiveChejanData", "", account.on_chejan_data)
+        >>> account.get()["계좌정보"]["예수금"]
+        >>> if account.available() >= amount: account.reserve(code, quantity, price)
+    """
+    TTL = 30  # sec
+    RESERVE_TIMEOUT = 60  # 주문체결 통보가 없는 매수주문의 미체결 금액을 잡아두는 시간(sec)
+    REFRESH_DELAY = 1.0  # 매수 체결 후 TR 로 다시 조회하기까지 기다리는 시간(sec)
+
+    def __init__(self, kw, acc_no, ttl=None, screen_no="6001", schedule=None, logger=None):
+        """
+
+        :param kw: Kiwoom
+        :param acc_no: 계좌번호
+        :param ttl: TR 로 다시 조회하기 전까지 snapshot 을 그대로 쓰는 시간(sec)
+        :param screen_no:
+        :param schedule: 매수 체결 후 refresh 를 예약하는 함수 fn(sec, callback),
+                         None 이면 다음 get() 으로 조회할 때까지 체결 금액을 잡아둔다.
+        :param logger:
+        """
+        self.kw = kw
+        self.acc_no = acc_no
+        self.ttl = ttl if ttl is not None else self.TTL
+        self.screen_no = screen_no
+        self.schedule = schedule
+        self.scheduled = False
+        self.logger = logger
+        self.data = {"계좌정보": {}, "종목정보": []}
+        self.updated_at = 0.0  # 마지막 TR 조회 시각(epoch sec)
+        self.changed_at = 0.0  # 마지막으로 snapshot 이 바뀐 시각 (TR 조회 또는 잔고통보)
+        self.dirty = True  # 체결 후 아직 TR 로 확인하지 않음
+        # 종목코드 -> 매수주문 {'price': 단가, 'remain': 미체결수량, 'filled': 체결량, 'reflected': snapshot 에 반영된 체결량,
+        #                       'at': 갱신시각, 'filled_at': 마지막 체결시각}
+        self.reserved = {}
+        self.stats = {'tr': 0, 'hit': 0, 'chejan': 0}
+
+    def age(self):
+        """마지막 TR 조회 후 지난 시간(sec)"""
+        return time.time() - self.updated_at
+
+    def is_stale(self, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        return self.dirty or self.age() > max_age
+
+    def peek(self):
+        """TR 요청 없이 메모리의 snapshot 을 돌려준다. (실시간 event callback 에서 사용)
+
+        :return: {'계좌정보': {...}, '종목정보': [...]}
+        """
+        return self.data
+
+    def get(self, max_age=None):
+        """snapshot 이 max_age(sec, 기본값 ttl) 보다 오래되었거나 체결이 있었으면 TR 로 다시 조회한 후 돌려준다.
+
+        :param max_age:
+        :return: {'계좌정보': {...}, '종목정보': [...]}
+        """
+        if self.is_stale(max_age):
+            self.refresh()
+        else:
+            self.stats['hit'] += 1
+        return self.data
+
+    def refresh(self):
+        """계좌평가현황요청(opw00004) TR 로 snapshot 을 갱신한다.
+
+        :return: 조회에 실패하면 False (이전 snapshot 을 유지)
+        """
+        if self.logger is not None:
+            self.logger.info("계좌평가현황요청")
+        self.stats['tr'] += 1
+        requested_at = time.time()
+        try:
+            ret = self.kw.계좌평가현황요청("계좌평가현황요청", self.acc_no, "", "1", self.screen_no)
+        except KiwoomTrBusyError as e:
+            # 다른 TR 을 기다리는 중에 timer 에서 호출된 경우, 이전 snapshot 을 쓰고 다음에 다시 조회한다.
+            if self.logger is not None:
+                self.logger.info("{}".format(e))
+            return False
+        if not bool(ret) or not bool(ret.get("계좌정보")):
+            if self.logger is not None:
+                self.logger.error("계좌정보를 제대로 받아오지 못했습니다.")
+            return False
+        self.data = ret
+        self.updated_at = self.changed_at = time.time()
+        self.dirty = False
+        # 요청 전에 체결된 수량은 이번 조회의 D+2추정예수금에 반영되어 있다.
+        for order in self.reserved.values():
+            if order['filled_at'] <= requested_at:
+                order['reflected'] = order['filled']
+        return True
+
+    def refresh_reserved(self):
+        """매수 체결 후 예약된 refresh. 실패하면(다른 TR 대기중 등) 다시 예약한다.
+
+        :return:
+        """
+        self.scheduled = False
+        if not self.refresh():
+            self.schedule_refresh()
+
+    def schedule_refresh(self):
+        if self.schedule is None or self.scheduled:
+            return
+        if any(order['filled'] > order['reflected'] for order in self.reserved.values()):
+            self.scheduled = True
+            self.schedule(self.REFRESH_DELAY, self.refresh_reserved)
+
+    def reserve(self, code, quantity, price):
+        """매수주문의 주문금액을 잡아둔다.
+
+        :param code:
+        :param quantity: 주문수량
+        :param price: 주문단가 (시장가 주문은 상한가)
+        :return: 잡아둔 금액
+        """
+        self.reserved[code] = {'price': price, 'remain': quantity, 'filled': 0, 'reflected': 0,
+                               'at': time.time(), 'filled_at': 0.0}
+        return price * quantity
+
+    def release(self, code):
+        """보내지 못한 매수주문의 주문금액을 돌려놓는다.
+
+        :param code:
+        :return:
+        """
+        self.reserved.pop(code, None)
+
+    def reserved_amount(self):
+        """snapshot 에 아직 반영되지 않은 매수주문 금액 합계 (미체결 + 조회 전 체결)
+        RESERVE_TIMEOUT 동안 주문체결 통보가 없는 미체결 수량은 버린다.
+
+        :return:
+        """
+        now = time.time()
+        for code, order in list(self.reserved.items()):
+            if bool(order['remain']) and now - order['at'] > self.RESERVE_TIMEOUT:
+                order['remain'] = 0
+            if not bool(order['remain']) and order['reflected'] >= order['filled']:
+                del self.reserved[code]
+        return sum(order['price'] * (order['remain'] + order['filled'] - order['reflected'])
+                   for order in self.reserved.values())
+
+    def available(self):
+        """D+2추정예수금(없으면 예수금)에서 반영되지 않은 매수주문 금액을 뺀 금액
+        (opw00004 예수금은 결제일까지 줄지 않으므로 D+2추정예수금을 쓴다.)
+
+        :return:
+        """
+        계좌정보 = self.data["계좌정보"]
+        return 계좌정보.get("D+2추정예수금", 계좌정보.get("예수금", 0)) - self.reserved_amount()
+
+    def find(self, code):
+        for data in self.data["종목정보"]:
+            if to_code(data["종목코드"]) == code:
+                return data
+        return None
+
+    def on_chejan_data(self, data):
+        """OnReceiveChejanData callback (Chejan.make_data)
+
+            주문체결(gubun=0)에 체결량이 있으면 다음 get() 에서 TR 로 다시 확인하고,
+            매수주문은 미체결수량과 체결량을 기록한다. (체결 금액은 다음 TR 조회까지 잡아둔다)
+            잔고통보(gubun=1)는 해당 종목의 보유수량/평균단가와 예수금을 바로 반영한다.
+
+        :param data:
+        :return:
+        """
+        gubun = str(data.get('gubun'))
+        if gubun == "0":
+            if bool(to_abs(data.get('체결량', ""))):
+                self.dirty = True
+            order = self.reserved.get(to_code(data['종목코드']))
+            if to_str(data.get('매도수구분', "")) == "2" and order is not None:  # 1: 매도, 2: 매수
+                order['remain'] = to_abs(data.get('미체결수량', ""))
+                order['at'] = time.time()
+                filled = to_abs(data.get('체결량', ""))  # 주문의 누적 체결량
+                if filled > order['filled']:
+                    order['filled'], order['filled_at'] = filled, order['at']
+                    self.schedule_refresh()
+            return
+        if gubun != "1":
+            return
+
+        self.stats['chejan'] += 1
+        self.dirty = True
+        self.changed_at = time.time()
+        code = to_code(data['종목코드'])
+        quantity, avg_price = to_abs(data['보유수량']), to_abs(data['매입단가'])
+        curr_price = to_abs(data.get('현재가', ""))
+        if bool(to_str(data.get('예수금', ""))):
+            self.data["계좌정보"]["예수금"] = float(to_abs(data['예수금']))
+
+        stock = self.find(code)
+        if quantity <= 0:
+            if stock is not None:
+                self.data["종목정보"].remove(stock)
+            return
+        if stock is None:
+            # opw00004 와 같은 'A005930' 형태로 저장한다.
+            stock = {"종목코드": "A" + code, "종목명": to_str(data.get('종목명', "")), "현재가": float(avg_price)}
+            self.data["종목정보"].append(stock)
+        stock["보유수량"] = float(quantity)
+        stock["평균단가"] = float(avg_price)
+        stock["매입금액"] = float(quantity * avg_price)
+        if bool(curr_price):
+            stock["현재가"] = float(curr_price)
+        stock["평가금액"] = stock["현재가"] * quantity
+        stock["손익금액"] = stock["평가금액"] - stock["매입금액"]
+        stock["손익율"] = stock["손익금액"] / stock["매입금액"] * 100 if bool(stock["매입금액"]) else 0.0
+
+    def get_stats(self):
+        return dict(self.stats, age=round(self.age(), 1), dirty=self.dirty, reserved=self.reserved_amount())
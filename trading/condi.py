@@ -52,13 +52,8 @@ class ConditionalSearch(object):
         :param timestamp:
         :return:
         """
-        ret = []
-        for code, time_series in self.condi_hist.items():
-            if code in self.disable_code_list:
-                continue
-            if timestamp in time_series:
-                ret.append(Stock.get_instance(code))
-        return ret
+        code_list = self.condi_hist_index.get(timestamp, [])
+        return [Stock.get_instance(code) for code in code_list if code not in self.disable_code_list]
 
     def gen_condi_history(self, target_date):
         """조건검색식으로 부터 검색된 종목의 time series 정보를 생성
@@ -77,4 +72,10 @@ class ConditionalSearch(object):
                 continue
             code, timestamp = data['code'], data['date'].replace(microsecond=0)
             self.condi_hist[code].append(timestamp)
+
+        # timestamp -> code list 색인 (code 순서는 condi_hist 순서를 따른다)
+        self.condi_hist_index = defaultdict(list)
+        for code, time_series in self.condi_hist.items():
+            for timestamp in sorted(set(time_series)):
+                self.condi_hist_index[timestamp].append(code)
         return self.condi_hist
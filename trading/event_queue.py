@@ -0,0 +1,50 @@
+import heapq
+
+
+class EventQueue(object):
+    """시뮬레이션에서 상태가 바뀔 수 있는 시점(timestamp)만 오름차순으로 꺼내주는 heap 기반 event queue
+
+        - 중복된 timestamp 는 한번만 꺼낸다.
+        - 순회 도중에도 push 가 가능하며, 이미 지나간 시점은 무시한다.
+        - [s_time, e_time) 구간을 벗어난 시점은 무시한다.
+    """
+
+    def __init__(self, s_time, e_time):
+        self.s_time = s_time
+        self.e_time = e_time
+        self.heap = []
+        self.curr_time = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        while self.heap:
+            t = heapq.heappop(self.heap)
+            if self.curr_time is not None and t <= self.curr_time:
+                continue
+            self.curr_time = t
+            yield t
+
+    def is_valid(self, timestamp):
+        if not (self.s_time <= timestamp < self.e_time):
+            return False
+        return self.curr_time is None or self.curr_time < timestamp
+
+    def push(self, timestamp):
+        """event 시점을 추가한다.
+
+        :param timestamp:
+        :return:
+        """
+        if self.is_valid(timestamp):
+            heapq.heappush(self.heap, timestamp)
+
+    def push_list(self, timestamps):
+        """여러 event 시점을 한번에 추가한다.
+
+        :param timestamps:
+        :return:
+        """
+        self.heap += [t for t in timestamps if self.is_valid(t)]
+        heapq.heapify(self.heap)
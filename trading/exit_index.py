@@ -0,0 +1,65 @@
+from util import constant
+
+
+class ExitTriggerIndex(object):
+    """보유종목별 매도(익절/손절) 가격을 미리 계산해둔 index
+
+        매입평균가와 현재 매도단계(sell_at_rising/sell_at_falling)로부터 매도신호가 나는 가격을 계산해두고,
+        가격이 바뀌면 해당 종목의 두 가격(익절가, 손절가)만 비교한다. (보유종목 수와 관계없이 tick 당 O(1))
+        매수/매도 체결로 매입평균가나 매도단계가 바뀐 경우에만 build() 로 다시 계산한다.
+
+        수익률을 반올림(round(x, 2))해서 비교하는 경우 margin 만큼 넓게 잡은 후보만 찾고,
+        최종 판단은 호출하는 쪽에서 한다. (Strategy.RATE_MARGIN 참고)
+
+        >>> index = ExitTriggerIndex()
+        >>> index.build("005930", avg_price=10000, sar_rate=3.0, saf_rate=-2.0)
+        >>> index.check("005930", 9800)
+        'PRICE_FALLING'
+    """
+
+    def __init__(self, margin=0.0):
+        """
+
+        :param margin: 매도가격을 넓게 잡을 수익률(%) 여유값
+        """
+        self.margin = margin
+        self.triggers = {}  # code -> (손절가, 익절가)
+
+    def __contains__(self, code):
+        return code in self.triggers
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def build(self, code, avg_price, sar_rate, saf_rate):
+        """종목의 매도가격을 계산한다.
+
+        :param code:
+        :param avg_price: 매입평균가
+        :param sar_rate: 현재 매도단계의 익절 수익률(%)
+        :param saf_rate: 현재 매도단계의 손절 수익률(%)
+        :return: (손절가, 익절가)
+        """
+        self.triggers[code] = (avg_price * (1 + (saf_rate + self.margin) / 100),
+                               avg_price * (1 + (sar_rate - self.margin) / 100))
+        return self.triggers[code]
+
+    def remove(self, code):
+        self.triggers.pop(code, None)
+
+    def check(self, code, price):
+        """가격이 매도가격에 도달했는지 확인한다.
+
+        :param code:
+        :param price: 현재가
+        :return: constant.PRICE_RISING(익절), constant.PRICE_FALLING(손절), 도달하지 않았으면 None
+        """
+        trigger = self.triggers.get(code)
+        if trigger is None:
+            return None
+        lower, upper = trigger
+        if price >= upper:
+            return constant.PRICE_RISING
+        if price <= lower:
+            return constant.PRICE_FALLING
+        return None
@@ -0,0 +1,221 @@
+import time
+
+from kiwoom.real_decoder import to_abs, to_str
+from trading.exit_index import ExitTriggerIndex
+
+# opw00004 손익율과 같은 기준(수수료, 세금 포함)으로 손익율을 계산한다.
+FEE_RATE = 0.00015  # 매수/매도 수수료
+TAX_RATE = 0.003  # 매도 세금(거래세 + 농특세)
+
+
+class Position(object):
+    ORDER_TIMEOUT = 60  # 매도요청 후 주문체결 통보가 없으면 주문이 실패한 것으로 보는 시간(sec)
+
+    def __init__(self, code, stock_name, quantity, avg_price, curr_price=0):
+        self.code = code
+        self.stock_name = stock_name
+        self.quantity = quantity
+        self.avg_price = avg_price
+        self.curr_price = curr_price if bool(curr_price) else avg_price
+        self.exiting = False  # 매도요청 후 주문이 끝나고 잔고통보를 받을 때까지 True
+        self.exit_at = 0.0  # 매도요청 시각
+        self.sell_orders = {}  # 주문번호 -> 미체결수량 (주문체결 통보 gubun=0)
+
+    @property
+    def break_even_price(self):
+        """수수료, 세금을 포함한 손익분기 가격"""
+        return self.avg_price * (1 + FEE_RATE) / (1 - FEE_RATE - TAX_RATE)
+
+    @property
+    def profit_rate(self):
+        """수수료, 세금을 포함한 평균단가 대비 현재가 손익율(%)"""
+        if not bool(self.avg_price):
+            return 0.0
+        return (self.curr_price / self.break_even_price - 1) * 100
+
+    @property
+    def open_sell_quantity(self):
+        return sum(self.sell_orders.values())
+
+    def has_open_order(self):
+        """매도주문이 아직 끝나지 않았는지 확인한다.
+
+        매도요청 후 주문체결 통보를 아직 받지 못했거나(ORDER_TIMEOUT 이내), 미체결수량이 남은 주문이 있으면 True
+        """
+        if self.open_sell_quantity > 0:
+            return True
+        return self.exiting and not bool(self.sell_orders) and time.time() - self.exit_at < self.ORDER_TIMEOUT
+
+    def start_exit(self):
+        self.exiting = True
+        self.exit_at = time.time()
+        self.sell_orders = {}
+
+    def reset_exit(self):
+        self.exiting = False
+        self.sell_orders = {}
+
+    def __repr__(self):
+        return "Position({}, {}, {}주, 평균단가 {}, 현재가 {}, {:.2f}%)".format(
+            self.code, self.stock_name, self.quantity, self.avg_price, self.curr_price, self.profit_rate)
+
+
+def to_code(code):
+    # 체결/잔고통보, opw00004 의 종목코드는 'A005930' 형태
+    code = to_str(code)
+    return code[1:] if len(code) == 7 and code[0].isalpha() else code
+
+
+class PositionBook(object):
+    """보유종목 장부 (push 방식)
+
+        - OnReceiveChejanData 잔고통보(gubun=1)의 보유수량, 매입단가로 보유종목을 갱신한다.
+        - OnReceiveRealData 주식체결의 현재가로 손익율을 갱신하고, 그 자리에서 익절/손절 조건을 확인한다.
+          (익절/손절 가격은 ExitTriggerIndex 에 미리 계산해두고, 체결/잔고통보로 평균단가가 바뀔 때만 다시 계산한다.)
+        - 매도요청 후에는 주문체결 통보(gubun=0)의 미체결수량이 0 이 되고 잔고통보를 받을 때까지 다시 매도하지 않는다.
+          (일부 체결로 보유수량이 줄어도 남은 수량을 또 매도하지 않는다.)
+        - reconcile() 로 가끔 계좌평가현황(opw00004) 결과와 맞춘다. (놓친 통보, 수동 주문 등)
+
+        >>> book = PositionBook(take_profit=3.0, stop_loss=-2.0, on_exit=sell)
+        >>> kw.reg_callback("OnReceiveChejanData", "", book.on_chejan_data)
+        >>> kw.reg_callback("OnReceiveRealData", "", book.on_real_data)
+    """
+
+    def __init__(self, take_profit, stop_loss, on_exit, logger=None):
+        """
+
+        :param take_profit: 익절 손익율(%), 수수료/세금 포함
+        :param stop_loss: 손절 손익율(%), 수수료/세금 포함
+        :param on_exit: 매도 조건이 되면 호출되는 함수 fn(position)
+        :param logger:
+        """
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.on_exit = on_exit
+        self.logger = logger
+        self.positions = {}  # code -> Position
+        self.exit_index = ExitTriggerIndex()
+
+    def __contains__(self, code):
+        return code in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get(self, code):
+        return self.positions.get(code)
+
+    def codes(self):
+        return set(self.positions.keys())
+
+    def set_position(self, code, stock_name, quantity, avg_price, curr_price=0):
+        """보유수량, 평균단가를 갱신한다. 보유수량이 0 이면 장부에서 지운다.
+
+        :return: 갱신된 Position, 지워졌으면 None
+        """
+        if quantity <= 0:
+            self.positions.pop(code, None)
+            self.exit_index.remove(code)
+            return None
+        position = self.positions.get(code)
+        if position is None:
+            position = self.positions[code] = Position(code, stock_name, quantity, avg_price, curr_price)
+        else:
+            if quantity > position.quantity:  # 추가 매수
+                position.reset_exit()
+            position.quantity = quantity
+            position.avg_price = avg_price
+            if bool(curr_price):
+                position.curr_price = curr_price
+        self.exit_index.build(code, position.break_even_price, self.take_profit, self.stop_loss)
+        return position
+
+    def on_chejan_data(self, data):
+        """OnReceiveChejanData callback (Chejan.make_data)
+
+        :param data:
+        :return: 갱신된 Position (잔고통보가 아니거나 보유수량이 0 이면 None)
+        """
+        gubun = str(data.get('gubun'))
+        if gubun == "0":
+            self.on_order_data(data)
+            return None
+        if gubun != "1":
+            return None
+        code = to_code(data['종목코드'])
+        position = self.set_position(code, to_str(data.get('종목명', "")), to_abs(data['보유수량']),
+                                     to_abs(data['매입단가']), to_abs(data.get('현재가', "")))
+        if position is not None:
+            # 매도주문이 모두 끝난 후의 잔고통보이면 남은 수량을 다시 매도할 수 있다.
+            if position.exiting and not position.has_open_order():
+                position.reset_exit()
+            self.check_exit(position)
+        return position
+
+    def on_order_data(self, data):
+        """주문체결 통보(gubun=0)로 매도주문의 미체결수량을 기록한다.
+
+        :param data:
+        :return:
+        """
+        if to_str(data.get('매도수구분', "")) != "1":  # 1: 매도, 2: 매수
+            return
+        position = self.positions.get(to_code(data['종목코드']))
+        if position is None:
+            return
+        order_no = to_str(data.get('주문번호', ""))
+        position.sell_orders[order_no] = to_abs(data.get('미체결수량', ""))
+        # 체결없이 끝난 주문(거부, 취소)은 잔고통보가 오지 않으므로 여기서 다시 매도할 수 있게 한다.
+        if not position.has_open_order() and not bool(to_abs(data.get('체결량', ""))):
+            position.reset_exit()
+            self.check_exit(position)
+
+    def on_real_data(self, data):
+        """OnReceiveRealData callback (RealDecoder 로 변환된 doc)
+
+        :param data:
+        :return:
+        """
+        if data.get('real_type') != "주식체결":
+            return
+        position = self.positions.get(data['code'])
+        if position is None:
+            return
+        position.curr_price = data['현재가']
+        self.check_exit(position)
+
+    def check_exit(self, position):
+        if position.exiting:
+            return
+        if self.exit_index.check(position.code, position.curr_price) is not None:
+            position.start_exit()
+            self.on_exit(position)
+
+    def reconcile(self, account_info):
+        """계좌평가현황(opw00004) 결과로 장부를 맞춘다.
+
+        :param account_info: 계좌평가현황요청 결과 {'계좌정보': {...}, '종목정보': [...]}
+        :return: 장부와 달랐던 종목코드 list
+        """
+        diff = []
+        held = set()
+        for data in account_info["종목정보"]:
+            code, quantity = to_code(data["종목코드"]), int(data["보유수량"])
+            held.add(code)
+            position = self.positions.get(code)
+            if position is None or position.quantity != quantity:
+                diff.append(code)
+            position = self.set_position(code, data["종목명"], quantity, data["평균단가"], data["현재가"])
+            if position is None:
+                continue
+            # 진행중인 매도주문이 없는데 보유수량이 그대로면 매도주문이 실패한 것으로 보고 다시 확인한다.
+            if position.exiting and not position.has_open_order():
+                position.reset_exit()
+            self.check_exit(position)
+        for code in self.codes() - held:
+            diff.append(code)
+            del self.positions[code]
+            self.exit_index.remove(code)
+        if bool(diff) and self.logger is not None:
+            self.logger.info("[PositionBook] reconcile : {}".format(diff))
+        return diff
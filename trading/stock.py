@@ -4,6 +4,8 @@ from datetime import timedelta
 from database.db_manager import DBM
 from util import common, constant
 from util.tt_logger import TTlog
+from util.trading_calendar import TradingCalendar
+import numpy as np
 import pandas as pd
 from config import config_manager as cfg_mgr
 
@@ -13,6 +15,7 @@ class Stock(object):
 
     """
     _inst = {}
+    tick_store = None  # TickStore, 설정되면 time_series_sec1 을 memory-mapped array 로 공유한다.
 
     def __init__(self, code):
         self.empty = True
@@ -46,6 +49,9 @@ class Stock(object):
         self.check_core_index()
 
         self.time_series_sec1 = None
+        self.time_series_sec1_arr = None  # time_series_sec1 의 현재가 (contiguous float64 array)
+        self.time_series_sec1_base = None  # time_series_sec1_arr[0] 의 timestamp
+        self.tick_timestamps = []  # 1tick 체결이 발생한 timestamp list (초단위)
         self.logger = TTlog().logger
         self.dbm = DBM('TopTrader')
 
@@ -87,12 +93,32 @@ class Stock(object):
             cls._inst[code] = Stock(code)
         return cls._inst[code]
 
+    @classmethod
+    def set_tick_store(cls, tick_store):
+        """time_series_sec1 을 공유할 TickStore 를 설정한다. (None 이면 사용하지 않음)
+
+        :param tick_store:
+        :return:
+        """
+        cls.tick_store = tick_store
+
+    @classmethod
+    def clear_instance(cls):
+        """생성된 모든 Stock 객체(time_series_sec1 포함)를 제거한다.
+        다른 날짜의 시뮬레이션을 하기 전에 호출해야 한다.
+
+        :return:
+        """
+        cls._inst = {}
+
     @classmethod
     def get_new_instance(cls, code, recycle_time_series=False):
         if code in cls._inst and recycle_time_series:
             time_series_sec1 = cls._inst[code].time_series_sec1
+            tick_timestamps = cls._inst[code].tick_timestamps
             cls._inst[code] = Stock(code)
             cls._inst[code].time_series_sec1 = time_series_sec1
+            cls._inst[code].tick_timestamps = tick_timestamps
         else:
             cls._inst[code] = Stock(code)
         return cls._inst[code]
@@ -260,7 +286,7 @@ class Stock(object):
         :return:
         """
         self.timestamp = timestamp
-        현재가 = self.time_series_sec1.ix[timestamp]['현재가']
+        현재가 = self.get_curr_price(timestamp)
         self.bep('change_price', 현재가)
 
     def set_strategy(self, strg):
@@ -289,14 +315,35 @@ class Stock(object):
             self.logger.info("{}/{} use existing gen_time_series_sec1..".format(self.stock_name, self.code))
             return self.time_series_sec1
 
-        self.logger.info("{}/{} gen_time_series_sec1..".format(self.stock_name, self.code))
         y, m, d = target_date.year, target_date.month, target_date.day
         s_time = datetime(y, m, d, 9, 0, 0)
         e_time = datetime(y, m, d, 15, 30, 0)
-        df = pd.DataFrame(self.dbm.get_tick_data(self.code, target_date, tick="1"))
+        # 폐장시각이 늦춰진 날(수능 등)은 폐장시각까지 생성한다.
+        session = TradingCalendar().get_session(target_date)
+        if session is not None and session[1] > e_time:
+            e_time = session[1]
+        index = pd.date_range(s_time, e_time, freq='S')
+
+        # 다른 process 가 이미 생성한 array 가 있으면 attach 만 한다.
+        if self.tick_store is not None:
+            shared = self.tick_store.attach(self.code, target_date)
+            if shared is not None:
+                self.logger.info("{}/{} attach time_series_sec1..".format(self.stock_name, self.code))
+                price_arr, tick_secs = shared
+                self.tick_timestamps = [s_time + timedelta(seconds=int(sec)) for sec in tick_secs]
+                self.time_series_sec1 = pd.DataFrame(price_arr.reshape(-1, 1), index=index, columns=['현재가'],
+                                                     copy=False)
+                return self.time_series_sec1
+
+        self.logger.info("{}/{} gen_time_series_sec1..".format(self.stock_name, self.code))
+        # 휴장일은 tick data 가 없으므로 DB 를 조회하지 않는다.
+        columns = self.dbm.get_tick_columns(self.code, target_date, tick="1") if session is not None else None
+        if columns is None:
+            columns = {'timestamp': np.array([], dtype='datetime64[ns]'), '현재가': np.array([], dtype=np.float64)}
+        df = pd.DataFrame({'timestamp': columns['timestamp'], '현재가': columns['현재가']})
         ts_group = df.groupby('timestamp')
         price = pd.DataFrame(ts_group.max()['현재가'])
-        index = pd.date_range(s_time, e_time, freq='S')
+        self.tick_timestamps = list(price.index.to_pydatetime())
         price = price.reindex(index, method='ffill', fill_value=0)
         # volumn = pd.DataFrame(ts_group.sum()['거래량'])
         # volumn = volumn.reindex(index, method='ffill', fill_value=0)
@@ -305,6 +352,10 @@ class Stock(object):
         # 현재가 = max, ffill, fill_value=0
         # 거래량 = sum, ffill, fill_value=0
         self.time_series_sec1 = price
+
+        if self.tick_store is not None:
+            tick_secs = [int((t - s_time).total_seconds()) for t in self.tick_timestamps]
+            self.tick_store.put(self.code, target_date, price['현재가'].values, tick_secs)
         return self.time_series_sec1
 
     def get_curr_price(self, timestamp):
@@ -317,8 +368,32 @@ class Stock(object):
             y, m, d = timestamp.year, timestamp.month, timestamp.day
             self.time_series_sec1 = self.gen_time_series_sec1(datetime(y, m, d))
 
-        return self.time_series_sec1.ix[timestamp]['현재가']
-    
+        return self.get_time_series_sec1_array()[self.get_sec1_index(timestamp)]
+
+    def get_time_series_sec1_array(self):
+        """time_series_sec1 의 현재가를 연속된 float64 array 로 반환한다.
+        array[i] 는 time_series_sec1_base 로부터 i초 경과한 시점의 현재가이다.
+
+        :return:
+        """
+        if self.time_series_sec1_arr is None:
+            price = self.time_series_sec1['현재가'].values
+            self.time_series_sec1_arr = np.ascontiguousarray(price, dtype=np.float64)
+            self.time_series_sec1_base = self.time_series_sec1.index[0].to_pydatetime()
+        return self.time_series_sec1_arr
+
+    def get_sec1_index(self, timestamp):
+        """timestamp 에 해당하는 time_series_sec1_arr 의 index 를 반환한다.
+
+        :param timestamp:
+        :return:
+        """
+        arr = self.get_time_series_sec1_array()
+        i = int((timestamp - self.time_series_sec1_base).total_seconds())
+        if not 0 <= i < len(arr):
+            raise KeyError(timestamp)
+        return i
+
     def get_core_index(self):
         """Stock객체의 핵심 지표 리스트. 반드시 Stock객체의 속성값과 동기화가 되어야 함.
         
@@ -7,13 +7,16 @@ import pdb
 from config import config_manager
 from database.db_manager import DBM
 from trading.account import Account, TradingHistory
+from trading.event_queue import EventQueue
+from trading.exit_index import ExitTriggerIndex
 from trading.stock import Stock
 from util import tt_logger
-from util import common, constant
+from util import common, constant, timeutil
+from util.trading_calendar import TradingCalendar
 
 
 class StrategyConfig(object):
-    def __init__(self, strg_file):
+    def __init__(self, strg_file, strg_params=None):
         cfg_path = config_manager.CFG_PATH
         self.strg_file = os.path.join(cfg_path, strg_file)
         self.logger = tt_logger.TTlog().logger
@@ -25,6 +28,11 @@ class StrategyConfig(object):
         for k, v in json.loads(open(self.strg_file, encoding='utf-8').read()).items():
             setattr(self, k, v)
 
+        # *.strategy 의 일부 필드를 덮어쓴다. (parameter sweep 등)
+        if bool(strg_params):
+            for k, v in strg_params.items():
+                setattr(self, k, v)
+
         self.init_index()
 
     def init_index(self):
@@ -68,24 +76,52 @@ class Strategy(object):
     trading_sequence에 대해서 어떻게 정의하면 좋을지 좀더 생각해봐야함
     """
 
-    def __init__(self, strategy_cfg, condi):
+    # round(x, 2) 오차를 고려한 매도신호 후보 검색 여유값
+    RATE_MARGIN = 0.01
+
+    def __init__(self, strategy_cfg, condi, strg_params=None):
         self.logger = tt_logger.TTlog().logger
         self.dbm = DBM('TopTrader')
         self.strg_filename = strategy_cfg
         self.strg_name = strategy_cfg.replace(".strategy", "")
-        self.strg_cfg = StrategyConfig(strategy_cfg)
+        self.strg_params = strg_params
+        self.strg_cfg = StrategyConfig(strategy_cfg, strg_params)
         self.condi = condi
         self.condi.set_disable_code_list(self.strg_cfg.disable_code_list)
         self.th = TradingHistory(self.strg_name, self.condi.condi_index, self.condi.condi_name)
         self.acc = Account(self.strg_cfg.balance, self.th)
+        self.exit_index = ExitTriggerIndex(margin=self.RATE_MARGIN)
 
     def get_sell_signal_stocks(self, stock_list):
-        """
+        """보유종목 중 매도신호가 발생한 종목을 찾는다.
+
+        exit_index 의 매도가격에 도달했거나 최대 보유시간이 지난 종목만 is_sell_signal 로 확인한다.
 
         :param stock_list:
         :return:
         """
-        return [stock for stock in stock_list if self.is_sell_signal(stock)]
+        return [stock for stock in stock_list if self.is_exit_candidate(stock) and self.is_sell_signal(stock)]
+
+    def is_exit_candidate(self, stock):
+        if stock.code not in self.exit_index:
+            return True
+        if self.exit_index.check(stock.code, stock.현재가) is not None:
+            return True
+        return self.stock_strg[stock.code].max_holding_period <= stock.get_holding_period().seconds
+
+    def update_exit_trigger(self, stock):
+        """매수/매도 체결 후 매입평균가, 매도단계에 맞춰 exit_index 를 다시 계산한다.
+
+        :param stock:
+        :return:
+        """
+        if stock.보유수량 <= 0:
+            self.exit_index.remove(stock.code)
+            return
+        strg_cfg = self.stock_strg[stock.code]
+        sar_rate, sar_amount_rate = strg_cfg.get_sar_step()
+        saf_rate, saf_amount_rate = strg_cfg.get_saf_step()
+        self.exit_index.build(stock.code, stock.매입금액 / stock.보유수량, sar_rate, saf_rate)
 
     def get_buy_signal_stocks(self, stock_list):
         """
@@ -98,6 +134,69 @@ class Strategy(object):
         return [stock for stock in stock_list if self.is_buy_signal(stock)]
 
     def simulate(self, target_date):
+        self.ready_to_simulate(target_date)
+
+        # 전략파일에 명시한 거래가능시간 중, 상태가 바뀔 수 있는 시점(event)만 순회한다.
+        for s_time, e_time in self.trading_period(target_date):
+            if s_time >= e_time:
+                continue
+
+            queue = self.gen_event_queue(s_time, e_time)
+            for t in queue:
+                for code in self.simul_step(t):
+                    self.push_trading_events(queue, Stock.get_instance(code), t)
+
+            # 거래 period 끝난 후 일괄 청산
+            self.all_clear_stocks(t)
+        return self
+
+    def gen_event_queue(self, s_time, e_time):
+        """거래 period 의 event queue 를 생성한다.
+
+            - period 시작 시점, 마지막 시점
+            - 시뮬레이션 대상 종목의 1tick 체결시점 (현재가가 바뀔 수 있는 시점)
+            - 조건검색식 검출시점
+
+        :param s_time:
+        :param e_time:
+        :return:
+        """
+        events = {s_time, e_time - timedelta(seconds=1)}
+        for code in self.stock_strg:
+            events.update(Stock.get_instance(code).tick_timestamps)
+        events.update(self.condi.condi_hist_index)
+
+        queue = EventQueue(s_time, e_time)
+        queue.push_list(events)
+        return queue
+
+    def push_trading_events(self, queue, stock, t):
+        """매매가 발생한 종목에 대해 이후 상태가 바뀔 수 있는 시점을 event queue 에 추가한다.
+
+            - 다음 시점 (가격변동 없이도 다음 매도단계의 신호가 발생할 수 있음)
+            - 종목당 최대 보유시간 만기 시점
+
+        :param queue:
+        :param stock:
+        :param t:
+        :return:
+        """
+        queue.push(t + timedelta(seconds=1))
+        strg_cfg = self.stock_strg[stock.code]
+        if bool(stock.first_buy_time) and strg_cfg.max_holding_period > 0:
+            queue.push(stock.first_buy_time + timedelta(seconds=strg_cfg.max_holding_period))
+
+    def ready_to_simulate(self, target_date):
+        """시뮬레이션에 필요한 Stock 객체, time_series_sec1, 조건검색 이력을 준비한다.
+
+        :param target_date:
+        :return: code_list
+        """
+        # 휴장일은 시뮬레이션할 data 가 없다.
+        self.stock_strg = {}
+        self.exit_index = ExitTriggerIndex(margin=self.RATE_MARGIN)
+        if not TradingCalendar().is_trading_day(target_date):
+            return []
 
         # 조건검색식으로부터 검출된 code list
         code_list = self.condi.detected_code_list(target_date)
@@ -107,64 +206,79 @@ class Strategy(object):
         code_list = list(set(code_list) - set(self.strg_cfg.disable_code_list))
 
         # stock 객체 초기화 및 time_series_sec1 생성
-        self.stock_strg = {}
         for code in code_list:
             stock = Stock.get_new_instance(code, recycle_time_series=True)
             stock.gen_time_series_sec1(target_date)
-            self.stock_strg[code] = StrategyConfig(self.strg_filename)
+            self.stock_strg[code] = StrategyConfig(self.strg_filename, self.strg_params)
 
         # 조건검색식으로 검출된 종목의 timeseries data 생성
         self.condi.gen_condi_history(target_date)
+        return code_list
 
-        # 전략파일에 명시한 거래가능시간으로 특정 일의 초단위 time series 정보를 생성
-        for period in self.date_range(target_date):
-            for t in period:
-                # timestamp 업데이트 필요한 모든 객체에 업데이트(아마도 Account, Stock ?)
-                self.update_account_n_stock(t)
-
-                sell_flag = False
-
-                # 보유한 주식에 대해 매도신호를 검사
-                stock_list = self.acc.get_stock_list_in_account()
-                for stock in self.get_sell_signal_stocks(stock_list):
-                    # 주식 매도, 관련된 모든 정보 업데이트(계좌, 거래이력, 주식)
-                    stock.timestamp = t
-                    self.simul_sell(stock, stock.get_curr_price(t))
-                    sell_flag = True
-
-                # 이번에 매도를 했다면, 매수는 하지 않는다.
-                if sell_flag:
-                    continue
-
-                # 이번 timestamp에 매도하지 않은 경우, 조건검색식으로부터 검출된 종목의 매수신호를 검사
-                stock_list = self.condi.get_stock_list_at_timestamp(t)
-                for stock in self.get_buy_signal_stocks(stock_list):
-                    # 주식 매수, 관련된 모든 정보 업데이트(계좌, 거래이력, 주식)
-                    stock.timestamp = t
-                    self.simul_buy(stock, stock.get_curr_price(t))
-
-            # 거래 period 끝난 후 일괄 청산
-            self.all_clear_stocks(t)
-        return self
+    def simul_step(self, t):
+        """특정 timestamp 한 시점에 대한 매도/매수 시뮬레이션을 수행한다.
 
-    def date_range(self, date):
-        """특정일로부터 초단위 timestamp list 를 생성하여 return
-        이때, *.strategy 를 참조하여, 거래가능시간을 고려한다.
+        :param t:
+        :return: 매매가 발생한 종목코드 set
+        """
+        traded = set()
+
+        # timestamp 업데이트 필요한 모든 객체에 업데이트(아마도 Account, Stock ?)
+        self.update_account_n_stock(t)
+
+        # 보유한 주식에 대해 매도신호를 검사
+        stock_list = self.acc.get_stock_list_in_account()
+        for stock in self.get_sell_signal_stocks(stock_list):
+            # 주식 매도, 관련된 모든 정보 업데이트(계좌, 거래이력, 주식)
+            stock.timestamp = t
+            self.simul_sell(stock, stock.get_curr_price(t))
+            traded.add(stock.code)
+
+        # 이번에 매도를 했다면, 매수는 하지 않는다.
+        if bool(traded):
+            return traded
+
+        # 이번 timestamp에 매도하지 않은 경우, 조건검색식으로부터 검출된 종목의 매수신호를 검사
+        stock_list = self.condi.get_stock_list_at_timestamp(t)
+        for stock in self.get_buy_signal_stocks(stock_list):
+            # 주식 매수, 관련된 모든 정보 업데이트(계좌, 거래이력, 주식)
+            stock.timestamp = t
+            self.simul_buy(stock, stock.get_curr_price(t))
+            traded.add(stock.code)
+        return traded
+
+    def trading_period(self, date):
+        """*.strategy 를 참조하여, 특정일의 거래가능시간 list 를 반환한다.
 
         :param date: Datetime 객체
-        :return:
+        :return: [(s_date, e_date), ...]  e_date 는 거래가능시간에 포함되지 않는다.
         """
+        # 휴장일은 거래가능시간이 없고, 거래가능시간은 장운영시간을 벗어나지 않는다.
+        session = TradingCalendar().get_session(date)
+        if session is None:
+            return []
+        open_time, close_time = session
+
         y, m, d = date.year, date.month, date.day
         ret = []
         for s_time, e_time in self.strg_cfg.trading_time:
             h1, m1, s1 = [int(t) for t in s_time.split(":")]
             h2, m2, s2 = [int(t) for t in e_time.split(":")]
-            s_date = datetime(y, m, d, h1, m1, s1)
-            e_date = datetime(y, m, d, h2, m2, s2)
-            datelist = [s_date + timedelta(seconds=x) for x in range(0, (e_date - s_date).seconds)]
-            ret.append(datelist)
+            s_date = max(datetime(y, m, d, h1, m1, s1), open_time)
+            e_date = min(datetime(y, m, d, h2, m2, s2), close_time)
+            if s_date < e_date:
+                ret.append((s_date, e_date))
         return ret
 
+    def date_range(self, date):
+        """특정일로부터 거래가능시간 구간별 초단위 timestamp 생성기(generator) list 를 return
+        이때, *.strategy 를 참조하여, 거래가능시간을 고려한다.
+
+        :param date: Datetime 객체
+        :return:
+        """
+        return [timeutil.date_range(s_date, e_date) for s_date, e_date in self.trading_period(date)]
+
     def update_account_n_stock(self, t):
         """timestamp가 변경된 후, 관련있는 모든 객체의 timestamp값을 업데이트 한다.
         계좌, 주식, 등등
@@ -246,6 +360,7 @@ class Strategy(object):
         # 주식을 모두다 팔면, index를 초기화 한다.
         if stock.first_trading:
             strg_cfg.init_index()
+        self.update_exit_trigger(stock)
 
     def is_buy_signal(self, stock):
         """특정 종목에 대해 현재 timestamp에 매수해야 하는지 신호를 검사한다.
@@ -288,7 +403,7 @@ class Strategy(object):
         if stock.first_trading:
             amount = strg_cfg.max_buy_price_per_stock / curr_price
             self.acc.update_buy(stock, int(curr_price), int(amount), constant.FIRST_TRADING)
-
+            self.update_exit_trigger(stock)
             return
 
         try:
@@ -312,6 +427,8 @@ class Strategy(object):
             # except constant.BuySequenceEmptyError as e:
             msg = "매수신호 발생하였으나, 매수단계(buy_at_rising, buy_at_falling)가 정의되어 있지 않아, 추가 매수 안함"
             self.logger.error(msg)
+        else:
+            self.update_exit_trigger(stock)
 
     def all_clear_stocks(self, t):
         for stock in self.acc.get_stock_list_in_account():
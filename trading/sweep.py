@@ -0,0 +1,206 @@
+import itertools
+import multiprocessing
+import pdb
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import config_manager as cfg_mgr
+from database.db_manager import DBM
+from trading.condi import ConditionalSearch
+from trading.stock import Stock
+from trading.strategy import Strategy
+from database.tick_store import TickStore
+from trading.vector_strategy import VectorStrategy
+from util import constant
+from util.tt_logger import TTlog
+
+# worker process 에 현재 load 되어있는 tick data 의 날짜
+_loaded_date = None
+
+
+def gen_param_grid(grid):
+    """전략 필드별 후보값으로부터 모든 조합(*.strategy 덮어쓰기용 dict list)을 생성한다.
+
+        >>> gen_param_grid({'max_holding_period': [300, 600], 'max_amount_stocks': [1, 2]})
+        [{'max_holding_period': 300, 'max_amount_stocks': 1}, {'max_holding_period': 300, 'max_amount_stocks': 2}, ...]
+
+    :param grid: {필드명: [후보값, ...], ...}
+    :return:
+    """
+    if not bool(grid):
+        return [{}]
+    fields = list(grid.keys())
+    return [dict(zip(fields, values)) for values in itertools.product(*[grid[f] for f in fields])]
+
+
+def init_worker(stock_info, cfg_path, tick_store_path):
+    """worker process 초기화 (Kiwoom 없이 동작하도록 주식 기본정보를 넘겨받는다.)
+
+    :param stock_info:
+    :param cfg_path:
+    :param tick_store_path: time_series_sec1 을 공유할 TickStore 경로
+    :return:
+    """
+    cfg_mgr.STOCK_INFO = stock_info
+    cfg_mgr.CFG_PATH = cfg_path
+    cfg_mgr.STOCK_MONITOR = False
+    cfg_mgr.ACCOUNT_MONITOR = False
+    Stock.set_tick_store(TickStore(tick_store_path))
+
+
+def preload_task(condi_info, target_date):
+    """특정일에 조건검색식으로 검출된 모든 종목의 time_series_sec1 을 TickStore 에 저장한다.
+
+    :param condi_info:
+    :param target_date:
+    :return: 저장한 종목 수
+    """
+    code_list = set()
+    for condi_name, condi_index in condi_info.items():
+        code_list.update(ConditionalSearch.get_instance(condi_index, condi_name).detected_code_list(target_date))
+
+    for code in code_list:
+        if not Stock.tick_store.has(code, target_date):
+            Stock.get_new_instance(code).gen_time_series_sec1(target_date)
+    Stock.clear_instance()
+    return len(code_list)
+
+
+def simulate_task(strategy_cfg, condi_index, condi_name, target_date, param_list, vectorized=True):
+    """특정일, 특정 조건검색식에 대해 모든 parameter 조합을 시뮬레이션한다.
+    같은 날짜의 task 가 연속으로 오면 이미 attach 한 time_series_sec1 을 재사용한다.
+
+    :param strategy_cfg:
+    :param condi_index:
+    :param condi_name:
+    :param target_date:
+    :param param_list:
+    :param vectorized: VectorStrategy 사용여부
+    :return: [summary, ...] (param_list 와 같은 순서)
+    """
+    global _loaded_date
+    if _loaded_date != target_date:
+        Stock.clear_instance()
+        _loaded_date = target_date
+
+    strg_class = VectorStrategy if vectorized else Strategy
+    condi = ConditionalSearch.get_instance(condi_index, condi_name)
+    result = []
+    for strg_params in param_list:
+        strg = strg_class(strategy_cfg, condi, strg_params)
+        strg.simulate(target_date)
+        result.append(summarize(strg))
+    return result
+
+
+def summarize(strg):
+    """시뮬레이션 결과 요약
+
+    :param strg:
+    :return:
+    """
+    sell_list = strg.th.get_trading_history(trading_type=constant.SELL_TRADING_TYPE)
+    return {
+        '총누적손익': float(strg.acc.총누적손익),
+        '총누적수익률': float(strg.acc.총누적수익률),
+        '매도횟수': len(sell_list),
+        '수익횟수': len([tr for tr in sell_list if tr.실현손익 > 0])
+    }
+
+
+class StrategySweep(object):
+    """*.strategy 의 필드 조합 x 조건검색식 x 날짜 에 대한 시뮬레이션을 여러 process 로 나누어 수행하고,
+    (필드 조합, 조건검색식) 별로 기간 전체의 성과를 순위를 매겨 DB(strategy_sweep)에 저장한다.
+    time_series_sec1 은 날짜별로 한번만 생성하여 TickStore 에 저장하고, 모든 worker 가 mmap 으로 공유한다.
+
+        >>> sweep = StrategySweep("short_trading.strategy", grid, condi_info, date_list)
+        >>> sweep.run("20180802_short_trading")
+    """
+
+    def __init__(self, strategy_cfg, grid, condi_info, date_list, max_workers=None, vectorized=True,
+                 tick_store_path=None):
+        """
+
+        :param strategy_cfg: 기준 *.strategy 파일명
+        :param grid: {필드명: [후보값, ...], ...}
+        :param condi_info: {condi_name: condi_index, ...}
+        :param date_list: 시뮬레이션 날짜 list
+        :param max_workers: process 개수 (None 이면 cpu 개수)
+        :param vectorized: VectorStrategy 사용여부
+        :param tick_store_path: TickStore 경로 (None 이면 기본 경로)
+        """
+        self.strategy_cfg = strategy_cfg
+        self.param_list = gen_param_grid(grid)
+        self.condi_info = condi_info
+        self.date_list = sorted(date_list)
+        self.max_workers = max_workers
+        self.vectorized = vectorized
+        self.tick_store = TickStore(tick_store_path)
+        self.logger = TTlog().logger
+        self.dbm = DBM('TopTrader')
+
+    def run(self, sweep_id):
+        """모든 조합을 시뮬레이션하고, 순위가 매겨진 결과를 저장 후 반환한다.
+
+        :param sweep_id: 결과 구분용 id
+        :return:
+        """
+        stock_info = cfg_mgr.STOCK_INFO if bool(cfg_mgr.STOCK_INFO) else self.dbm.get_stock_info()
+        total = len(self.param_list) * len(self.condi_info) * len(self.date_list)
+        self.logger.info("[StrategySweep] {} : {} simulations ({} params x {} condi x {} days)".format(
+            sweep_id, total, len(self.param_list), len(self.condi_info), len(self.date_list)))
+
+        # 같은 날짜의 task 가 같은 worker 에서 연속으로 처리될 수 있도록 날짜순으로 제출한다.
+        daily = defaultdict(list)  # (param_no, condi_name) -> [{date, summary}, ...]
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx,
+                                 initializer=init_worker,
+                                 initargs=(stock_info, cfg_mgr.CFG_PATH, self.tick_store.path)) as executor:
+            # 날짜별로 time_series_sec1 을 한번만 생성해 둔다.
+            for future in [executor.submit(preload_task, self.condi_info, d) for d in self.date_list]:
+                future.result()
+
+            futures = {}
+            for target_date in self.date_list:
+                for condi_name, condi_index in self.condi_info.items():
+                    future = executor.submit(simulate_task, self.strategy_cfg, condi_index, condi_name,
+                                             target_date, self.param_list, self.vectorized)
+                    futures[future] = (condi_name, target_date)
+
+            for future in as_completed(futures):
+                condi_name, target_date = futures[future]
+                for param_no, summary in enumerate(future.result()):
+                    daily[(param_no, condi_name)].append(dict(summary, date=target_date))
+                self.logger.info("[StrategySweep] {} {} done".format(condi_name, target_date))
+
+        result = self.rank(daily)
+        self.dbm.save_sweep_result(sweep_id, result)
+        return result
+
+    def rank(self, daily):
+        """(필드 조합, 조건검색식) 별로 기간 전체 성과를 집계하고 총누적손익 순으로 순위를 매긴다.
+
+        :param daily:
+        :return:
+        """
+        result = []
+        for (param_no, condi_name), summary_list in daily.items():
+            summary_list.sort(key=lambda x: x['date'])
+            sell_cnt = sum(s['매도횟수'] for s in summary_list)
+            profit_cnt = sum(s['수익횟수'] for s in summary_list)
+            result.append({
+                'strategy': self.strategy_cfg,
+                'params': self.param_list[param_no],
+                'condi_name': condi_name,
+                'condi_index': self.condi_info[condi_name],
+                '총누적손익': sum(s['총누적손익'] for s in summary_list),
+                '매도횟수': sell_cnt,
+                '수익횟수': profit_cnt,
+                '승률': round(float(profit_cnt) / sell_cnt * 100, 2) if sell_cnt else 0.0,
+                'daily': summary_list
+            })
+
+        result.sort(key=lambda x: (-x['총누적손익'], -x['승률']))
+        for i, doc in enumerate(result):
+            doc['rank'] = i + 1
+        return result
@@ -0,0 +1,107 @@
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+
+from trading.stock import Stock
+from trading.strategy import Strategy
+
+
+class VectorStrategy(Strategy):
+    """Strategy.simulate 와 동일한 매매결과(TradingHistory)를 만들어내는 vectorized 시뮬레이터
+
+        Strategy.simulate 는 거래가능시간의 모든 초(second)를 순회하지만,
+        VectorStrategy 는 보유종목의 time_series_sec1 array 에서 매도신호(sell_at_rising/sell_at_falling,
+        max_holding_period)가 발생하는 시점과 조건검색식 검출 시점을 array 연산으로 먼저 찾고,
+        해당 event 시점에만 Strategy.simul_step 을 수행한다.
+    """
+
+    def simulate(self, target_date):
+        code_list = self.ready_to_simulate(target_date)
+        y, m, d = target_date.year, target_date.month, target_date.day
+        base_time = datetime(y, m, d, 9, 0, 0)
+
+        # 조건검색식 검출시점 (base_time 으로부터 경과 초)
+        buy_secs = np.array(sorted(self.to_sec(t, base_time) for t in self.condi.condi_hist_index), dtype=np.int64)
+
+        for s_sec, e_sec in self.trading_period_secs(target_date, base_time):
+            if s_sec >= e_sec:
+                continue
+            last_sec = e_sec - 1
+            sell_secs = {}  # code -> 다음 매도신호 시점(sec)
+
+            curr_sec = s_sec
+            while curr_sec <= last_sec:
+                event_sec = last_sec
+
+                # 조건검색식 검출시점
+                i = np.searchsorted(buy_secs, curr_sec)
+                if i < len(buy_secs):
+                    event_sec = min(event_sec, buy_secs[i])
+
+                # 보유종목의 매도신호 시점
+                for stock in self.acc.get_stock_list_in_account():
+                    if stock.code not in sell_secs:
+                        sell_secs[stock.code] = self.next_sell_signal_sec(stock, curr_sec, last_sec, base_time)
+                    event_sec = min(event_sec, sell_secs[stock.code])
+
+                t = base_time + timedelta(seconds=int(event_sec))
+                for code in self.simul_step(t):
+                    sell_secs.pop(code, None)
+
+                # 매도신호 시점은 해당 시점 이후에 다시 계산한다.
+                for code in [code for code, sec in sell_secs.items() if sec <= event_sec]:
+                    del sell_secs[code]
+                curr_sec = event_sec + 1
+
+            # 거래 period 끝난 후 일괄 청산
+            self.all_clear_stocks(t)
+        return self
+
+    def next_sell_signal_sec(self, stock, s_sec, e_sec, base_time):
+        """보유종목의 현재 상태(보유수량, 매입금액, 매도단계)가 유지된다고 할 때,
+        s_sec ~ e_sec 구간에서 처음으로 매도신호(is_sell_signal)가 발생하는 시점을 반환한다.
+        매도신호가 없으면 e_sec 을 반환한다.
+
+        :param stock:
+        :param s_sec:
+        :param e_sec:
+        :param base_time:
+        :return:
+        """
+        strg_cfg = self.stock_strg[stock.code]
+        sar_rate, sar_amount_rate = strg_cfg.get_sar_step()
+        saf_rate, saf_amount_rate = strg_cfg.get_saf_step()
+
+        # 종목당 최대 보유시간 만기 시점
+        if strg_cfg.max_holding_period <= 0:
+            return s_sec
+        first_buy_sec = self.to_sec(stock.first_buy_time, base_time)
+        ret = min(e_sec, max(s_sec, first_buy_sec + strg_cfg.max_holding_period))
+
+        # 수익률 = round((현재가 * 보유수량 - 매입금액) / 매입금액 * 100, 2)
+        # Stock.evaluate_change_price 와 같은 순서로 계산해야 같은 값을 얻을 수 있다.
+        arr = stock.get_time_series_sec1_array()
+        s_idx = stock.get_sec1_index(base_time + timedelta(seconds=int(s_sec)))
+        price = arr[s_idx:s_idx + (ret - s_sec) + 1]
+        rate = (price * stock.보유수량 - stock.매입금액) / stock.매입금액 * 100
+        candidate = np.flatnonzero((sar_rate - self.RATE_MARGIN <= rate) | (rate <= saf_rate + self.RATE_MARGIN))
+        for i in candidate:
+            수익률 = round(rate[i], 2)
+            if sar_rate <= 수익률 or 수익률 <= saf_rate:
+                return min(ret, s_sec + int(i))
+        return ret
+
+    def trading_period_secs(self, date, base_time):
+        """*.strategy 의 거래가능시간을 base_time 으로부터 경과 초 구간 list 로 반환한다.
+
+        :param date:
+        :param base_time:
+        :return: [(s_sec, e_sec), ...]  e_sec 은 구간에 포함되지 않는다.
+        """
+        return [(self.to_sec(s_date, base_time), self.to_sec(e_date, base_time))
+                for s_date, e_date in self.trading_period(date)]
+
+    @staticmethod
+    def to_sec(timestamp, base_time):
+        return int((timestamp - base_time).total_seconds())
@@ -22,6 +22,11 @@ RELEASE = 2
 FILTER_KEYWORD = ["KODEX", "TIGER", "KINDEX", "ETN", "KOSEF", "ARIRANG", "KBSTAR",
                   "선물", "TREX", "SMART", "FOCUS", "HANARO", "ATM"]
 
+# collect_stock_data_worker.py 가 키움 서버 점검시간으로 종료할 때의 exit code
+EXIT_SERVER_CHECK_TIME = 100
+# TrScheduler.check_session_request 가 process 당 최대 요청수에 도달하여 종료할 때의 exit code
+EXIT_SESSION_REQUEST_LIMIT = 101
+
 class BuySequenceEmptyError(Exception):
     """매수신호는 발생했는데, 매수 단계가 정의되어 있지 않는 경우 발생하는 예외
 
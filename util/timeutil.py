@@ -1,7 +1,23 @@
 from datetime import datetime
+from datetime import time
 from datetime import timedelta
+
+import numpy as np
 from dateutil.relativedelta import relativedelta
 
+# date_range 의 by -> timedelta 인자
+TIME_UNITS = {
+    "second": "seconds",
+    "minute": "minutes",
+    "hour": "hours",
+    "day": "days",
+    "week": "weeks",
+    "month": None,
+    "year": None
+}
+
+# 정규장 운영시간
+REGULAR_SESSIONS = [(time(9, 0, 0), time(15, 30, 0))]
 
 
 def get_time_str(format="YYMMDD-HHMMSS"):
@@ -34,37 +50,90 @@ def get_datetime(format="YYMMDD"):
     """
     return datetime.today()
 
-def date_range(s_date, e_date, by="second"):
-    if s_date >= e_date:
-        return []
-
-    date_list = []
-    if by == "second":
-        time_diff = (e_date - s_date).seconds
-        date_list = [s_date + timedelta(seconds=x) for x in range(0, time_diff)]
-    elif by == "minute":
-        time_diff = (e_date - s_date).minutes
-        date_list = [s_date + timedelta(minutes=x) for x in range(0, time_diff)]
-    elif by == "hour":
-        time_diff = (e_date - s_date).hours
-        date_list = [s_date + timedelta(hours=x) for x in range(0, time_diff)]
-    elif by == "day":
-        time_diff = (e_date - s_date).days
-        date_list = [s_date + timedelta(days=x) for x in range(0, time_diff)]
-    elif by == "week":
-        time_diff = (e_date - s_date).weeks
-        date_list = [s_date + timedelta(weeks=x) for x in range(0, time_diff)]
-    elif by == "month":
-        # need to implement
-        # time_diff = (e_date - s_date).months
-        # date_list = [s_date + relativedelta(month=x) for x in range(0, time_diff)]
-        pass
-    elif by == "year":
-        # need to implement
-        # time_diff = (e_date - s_date).years
-        # date_list = [s_date + relativedelta(year=x) for x in range(0, time_diff)]
-        pass
+def date_range(s_date, e_date, by="second", step=1):
+    """s_date 부터 e_date 직전까지 by 단위의 datetime 을 하나씩 생성한다. (list 를 만들지 않음)
+
+        >>> for t in date_range(datetime(2018, 8, 2, 9), datetime(2018, 8, 2, 15, 30)):
+        >>>     ...
+
+    :param s_date:
+    :param e_date: 포함하지 않음
+    :param by: second, minute, hour, day, week, month, year 중 하나
+    :param step: by 단위의 간격
+    :return: generator
+    """
+    if by not in TIME_UNITS:
+        raise ValueError("[timeutil] by should be one of {}".format(list(TIME_UNITS.keys())))
+    return iter_dates(s_date, e_date, by, step)
+
+
+def iter_dates(s_date, e_date, by, step):
+    if by in ["month", "year"]:
+        # 월말 일자는 relativedelta 와 같이 해당 월의 마지막 날로 맞춘다. (ex. 1/31 -> 2/28)
+        months = step if by == "month" else step * 12
+        i = 0
+        t = s_date
+        while t < e_date:
+            yield t
+            i += 1
+            t = s_date + relativedelta(months=months * i)
     else:
-        pass
+        delta = timedelta(**{TIME_UNITS[by]: step})
+        t = s_date
+        while t < e_date:
+            yield t
+            t += delta
+
 
-    return date_list
\ No newline at end of file
+def date_range_array(s_date, e_date, by="second", step=1):
+    """date_range 와 같은 범위를 numpy datetime64 array 로 반환한다.
+
+    :param s_date:
+    :param e_date: 포함하지 않음
+    :param by: second, minute, hour, day, week, month, year 중 하나
+    :param step: by 단위의 간격
+    :return: datetime64[us] array
+    """
+    dates = date_range(s_date, e_date, by, step)
+    if by in ["month", "year"]:
+        return np.array(list(dates), dtype='datetime64[us]')
+    delta = np.timedelta64(int(timedelta(**{TIME_UNITS[by]: step}).total_seconds() * 10**6), 'us')
+    return np.arange(np.datetime64(s_date, 'us'), np.datetime64(e_date, 'us'), delta)
+
+
+def session_periods(s_date, e_date, sessions=None, day_filter=None):
+    """s_date ~ e_date 사이의 날짜별 장운영시간 구간을 하나씩 생성한다.
+
+    :param s_date:
+    :param e_date: 포함
+    :param sessions: [(시작시각(time), 종료시각(time)), ...] (None 이면 정규장 09:00 ~ 15:30)
+    :param day_filter: 날짜를 받아 거래일 여부를 반환하는 함수 (None 이면 주말만 제외)
+    :return: generator of (구간시작, 구간종료)
+    """
+    sessions = sessions if bool(sessions) else REGULAR_SESSIONS
+    day_filter = day_filter if day_filter is not None else (lambda d: d.weekday() < 5)
+    base = datetime(s_date.year, s_date.month, s_date.day)
+    for day in date_range(base, datetime(e_date.year, e_date.month, e_date.day) + timedelta(days=1), by="day"):
+        if not day_filter(day):
+            continue
+        for s_time, e_time in sessions:
+            yield datetime.combine(day.date(), s_time), datetime.combine(day.date(), e_time)
+
+
+def session_range(s_date, e_date, by="second", step=1, sessions=None, day_filter=None):
+    """s_date ~ e_date 사이 거래일의 장운영시간 동안 by 단위의 datetime 을 하나씩 생성한다.
+
+        >>> for t in session_range(datetime(2018, 8, 1), datetime(2018, 8, 3), by="minute"):
+        >>>     ...
+
+    :param s_date:
+    :param e_date: 포함
+    :param by: second, minute, hour
+    :param step:
+    :param sessions: [(시작시각(time), 종료시각(time)), ...] (None 이면 정규장 09:00 ~ 15:30)
+    :param day_filter: 날짜를 받아 거래일 여부를 반환하는 함수 (None 이면 주말만 제외)
+    :return: generator
+    """
+    for s_time, e_time in session_periods(s_date, e_date, sessions, day_filter):
+        for t in date_range(s_time, e_time, by, step):
+            yield t
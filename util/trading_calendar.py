@@ -0,0 +1,114 @@
+import json
+import os
+from datetime import datetime
+from datetime import timedelta
+
+from singleton_decorator import singleton
+
+from config import config_manager as cfg_mgr
+
+
+@singleton
+class TradingCalendar(object):
+    """KRX 거래일/장운영시간 달력 (config/krx_calendar.json)
+
+        {
+          "regular_session": ["09:00:00", "15:30:00"],     정규장 운영시간
+          "holidays": ["2018-01-01", ...],                 주말 외 휴장일
+          "special_sessions": {"2018-11-15": ["10:00:00", "16:30:00"], ...}   개장시간이 바뀌는 날 (신년, 수능 등)
+        }
+
+        파일에 없는 연도는 주말만 휴장일로 본다. 휴장일에는 TR 요청, DB 조회, 시뮬레이션을 하지 않는다.
+
+        >>> cal = TradingCalendar()
+        >>> cal.is_trading_day(datetime(2018, 8, 15))
+        False
+        >>> cal.trading_days(datetime(2018, 8, 1), datetime(2018, 8, 31))
+    """
+
+    def __init__(self, path=None):
+        """
+
+        :param path: 달력 파일 경로 (None 이면 CFG_PATH/TRADING_CALENDAR_FILE)
+        """
+        self.path = path if bool(path) else os.path.join(cfg_mgr.CFG_PATH, cfg_mgr.TRADING_CALENDAR_FILE)
+        self.regular_session = ("09:00:00", "15:30:00")
+        self.holidays = set()
+        self.special_sessions = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            cfg = json.load(f)
+        self.regular_session = tuple(cfg.get('regular_session', self.regular_session))
+        self.holidays = {self.to_date(d) for d in cfg.get('holidays', [])}
+        self.special_sessions = {self.to_date(d): tuple(session)
+                                 for d, session in cfg.get('special_sessions', {}).items()}
+
+    @staticmethod
+    def to_date(date):
+        """문자열(YYYY-MM-DD) 또는 datetime 을 0시 datetime 으로 변환한다.
+
+        :param date:
+        :return:
+        """
+        if isinstance(date, str):
+            return datetime.strptime(date, "%Y-%m-%d")
+        return datetime(date.year, date.month, date.day)
+
+    def is_trading_day(self, date):
+        date = self.to_date(date)
+        return date.weekday() < 5 and date not in self.holidays
+
+    def get_session(self, date):
+        """특정일의 장운영시간
+
+        :param date:
+        :return: (개장시각, 폐장시각), 휴장일이면 None
+        """
+        date = self.to_date(date)
+        if not self.is_trading_day(date):
+            return None
+        ret = []
+        for t in self.special_sessions.get(date, self.regular_session):
+            h, m, s = [int(_) for _ in t.split(":")]
+            ret.append(date.replace(hour=h, minute=m, second=s))
+        return tuple(ret)
+
+    def trading_days(self, s_date, e_date):
+        """s_date ~ e_date(포함) 사이의 거래일 list
+
+        :param s_date:
+        :param e_date:
+        :return: [0시 datetime, ...]
+        """
+        s_date, e_date = self.to_date(s_date), self.to_date(e_date)
+        days = (e_date - s_date).days + 1
+        return [d for d in (s_date + timedelta(days=i) for i in range(max(days, 0))) if self.is_trading_day(d)]
+
+    def has_session(self, s_time, e_time):
+        """s_time ~ e_time 사이에 장운영시간이 있는지 확인한다. (수집할 data 가 있는지)
+
+        :param s_time:
+        :param e_time:
+        :return:
+        """
+        for date in self.trading_days(s_time, e_time):
+            open_time, close_time = self.get_session(date)
+            if open_time < e_time and s_time < close_time:
+                return True
+        return False
+
+    def next_trading_day(self, date):
+        date = self.to_date(date) + timedelta(days=1)
+        while not self.is_trading_day(date):
+            date += timedelta(days=1)
+        return date
+
+    def prev_trading_day(self, date):
+        date = self.to_date(date) - timedelta(days=1)
+        while not self.is_trading_day(date):
+            date -= timedelta(days=1)
+        return date